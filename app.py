@@ -5,11 +5,23 @@ from urllib.parse import quote
 import os
 import requests
 import pandas as pd
+import numpy as np
 from moviepy.editor import VideoFileClip, concatenate_videoclips
 import tempfile
 import subprocess
 import json
+import re
 import uuid
+import time
+import copy
+import hashlib
+import bisect
+import shutil
+import threading
+import socket
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from fractions import Fraction
 from io import BytesIO
 from werkzeug.utils import secure_filename
 
@@ -20,12 +32,14 @@ from pdf2image import convert_from_path
 # 添加图像处理相关的导入
 from PIL import Image, ImageOps
 
-# 尝试导入imageio_ffmpeg以备FFmpeg路径问题
-try:
-    import imageio_ffmpeg
-    FFMPEG_PATH = imageio_ffmpeg.get_ffmpeg_exe()
-except ImportError:
-    FFMPEG_PATH = 'ffmpeg'
+# FFmpeg路径、按文件缓存、操作历史和媒体信息读取（与 toAdd/app.py 共用）
+from media_tools import (
+    logger, FFMPEG_PATH, FFPROBE_PATH, CACHE_FOLDER,
+    FASTSTART_MUXERS, get_faststart_args,
+    load_file_cache, save_file_cache,
+    get_history_db, history_lock, get_ffmpeg_version, run_ffmpeg,
+    probe_media
+)
 
 app = Flask(__name__)
 
@@ -42,12 +56,15 @@ PDF_OUTPUT_FOLDER = os.path.join(BASE_DIR, 'static/output/pdf_images')
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['OUTPUT_FOLDER'] = OUTPUT_FOLDER
 app.config['PDF_OUTPUT_FOLDER'] = PDF_OUTPUT_FOLDER
+app.config['CACHE_FOLDER'] = CACHE_FOLDER
 
 # 确保目录存在
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(OUTPUT_FOLDER, exist_ok=True)
 # 确保PDF输出目录存在
 os.makedirs(PDF_OUTPUT_FOLDER, exist_ok=True)
+# 确保缓存目录存在
+os.makedirs(CACHE_FOLDER, exist_ok=True)
 
 def time_to_seconds(t):
     """将时间字符串转换为秒数"""
@@ -73,6 +90,25 @@ def is_video_file(filename):
     _, ext = os.path.splitext(filename.lower())
     return ext in video_extensions
 
+def is_media_file(filename):
+    """检查文件是否为视频或音频文件"""
+    audio_extensions = {'.mp3', '.wav', '.aac', '.m4a', '.ogg', '.flac'}
+    _, ext = os.path.splitext(filename.lower())
+    return is_video_file(filename) or ext in audio_extensions
+
+def is_safe_output_name(filename):
+    """检查用户指定的输出文件名：保留中文等字符，只拒绝路径分隔符和 . / .."""
+    return bool(filename) and not any(sep in filename for sep in ('/', '\\', '\0')) and filename not in ('.', '..')
+
+def is_path_in_folders(file_path, folders):
+    """检查文件是否位于指定目录之内（解析符号链接和 .. 之后比较）"""
+    real_path = os.path.realpath(file_path)
+    for folder in folders:
+        real_folder = os.path.realpath(folder)
+        if os.path.commonpath([real_path, real_folder]) == real_folder:
+            return True
+    return False
+
 def format_file_size(size_bytes):
     """格式化文件大小"""
     if size_bytes < 1024:
@@ -84,26 +120,865 @@ def format_file_size(size_bytes):
     else:
         return f"{size_bytes / (1024 * 1024 * 1024):.1f} GB"
 
+# 操作历史统计：按操作类型汇总 run_ffmpeg() 记录的耗时，用于统计吞吐量和预估耗时
+def get_operation_stats(operation=None, since=None):
+    """按操作类型、主机和FFmpeg版本汇总操作历史
+
+    speed 为处理的媒体时长与耗时之比（倍速），bytes_per_second 为每秒读取的输入字节数，
+    同一操作在不同FFmpeg版本下的差异可用于发现升级后的性能退化。
+    """
+    sql = """
+        SELECT operation, host, ffmpeg_version, COUNT(*), SUM(returncode = 0),
+               AVG(wall_seconds), AVG(cpu_seconds),
+               SUM(CASE WHEN returncode = 0 AND media_seconds > 0 THEN media_seconds END),
+               SUM(CASE WHEN returncode = 0 AND media_seconds > 0 THEN wall_seconds END),
+               SUM(CASE WHEN returncode = 0 AND input_size > 0 THEN input_size END),
+               SUM(CASE WHEN returncode = 0 AND input_size > 0 THEN wall_seconds END),
+               MAX(started_at)
+        FROM operations WHERE 1 = 1
+    """
+    params = []
+    if operation:
+        sql += " AND operation = ?"
+        params.append(operation)
+    if since:
+        sql += " AND started_at >= ?"
+        params.append(since)
+    sql += " GROUP BY operation, host, ffmpeg_version ORDER BY operation, MAX(started_at) DESC"
+
+    with history_lock:
+        conn = get_history_db()
+        try:
+            rows = conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+    stats = []
+    for (op, host, version, count, success_count, avg_wall, avg_cpu,
+         media_seconds, media_wall, input_bytes, input_wall, last_run) in rows:
+        stats.append({
+            'operation': op,
+            'host': host,
+            'ffmpeg_version': version,
+            'count': count,
+            'success_count': success_count or 0,
+            'avg_wall_seconds': round(avg_wall, 3),
+            'avg_cpu_seconds': round(avg_cpu, 3) if avg_cpu is not None else None,
+            'cpu_utilization': round(avg_cpu / avg_wall, 2) if avg_cpu is not None and avg_wall else None,
+            'speed': round(media_seconds / media_wall, 2) if media_seconds and media_wall else None,
+            'bytes_per_second': int(input_bytes / input_wall) if input_bytes and input_wall else None,
+            'last_run': last_run
+        })
+    return stats
+
+def predict_operation_eta(operation, media_seconds=None, input_size=None, sample_limit=50):
+    """根据本机最近成功的同类操作预估耗时（秒）
+
+    优先按每秒媒体时长的耗时中位数推算，没有时长时按每字节耗时推算；
+    优先使用当前FFmpeg版本的记录，没有时使用全部版本。没有历史记录时 predicted_seconds 为 None。
+    """
+    basis, column, amount = ('media_seconds', 'media_seconds', media_seconds) if media_seconds else ('input_size', 'input_size', input_size)
+    if not amount:
+        return {'operation': operation, 'predicted_seconds': None, 'basis': None, 'sample_count': 0}
+
+    with history_lock:
+        conn = get_history_db()
+        try:
+            ratios = []
+            for version in (get_ffmpeg_version(), None):
+                sql = f"""
+                    SELECT wall_seconds / {column} FROM operations
+                    WHERE operation = ? AND host = ? AND returncode = 0 AND {column} > 0
+                """
+                params = [operation, socket.gethostname()]
+                if version is not None:
+                    sql += " AND ffmpeg_version = ?"
+                    params.append(version)
+                sql += " ORDER BY started_at DESC LIMIT ?"
+                params.append(sample_limit)
+                ratios = [row[0] for row in conn.execute(sql, params).fetchall()]
+                if ratios:
+                    break
+        finally:
+            conn.close()
+
+    if not ratios:
+        return {'operation': operation, 'predicted_seconds': None, 'basis': basis, 'sample_count': 0}
+    return {
+        'operation': operation,
+        'predicted_seconds': round(float(np.median(ratios)) * amount, 2),
+        'basis': basis,
+        'sample_count': len(ratios)
+    }
+
+def get_media_summary(file_path, missing=None):
+    """列表页使用的时长和分辨率，只读取缓存；没有缓存的媒体文件加入 missing 等待后台读取"""
+    info = probe_media(file_path, probe=False)
+    if info is None:
+        if missing is not None and is_media_file(file_path):
+            missing.append(file_path)
+        return {'duration': None, 'resolution': None}
+    video = info.get('video')
+    return {
+        'duration': seconds_to_time(info['duration']) if info['duration'] else None,
+        'resolution': f"{video['width']}x{video['height']}" if video and video['width'] else None
+    }
+
+_media_probe_pending = set()
+_media_probe_lock = threading.Lock()
+
+def start_media_probe(file_paths):
+    """后台读取文件的媒体信息（列表页中还没有缓存的文件），已在读取中的文件不重复提交"""
+    with _media_probe_lock:
+        file_paths = [file_path for file_path in file_paths if file_path not in _media_probe_pending]
+        _media_probe_pending.update(file_paths)
+    if not file_paths:
+        return
+
+    def run():
+        for file_path in file_paths:
+            try:
+                probe_media(file_path)
+            except Exception as e:
+                logger.warning(f"读取媒体信息失败: {file_path} - {str(e)}")
+            finally:
+                with _media_probe_lock:
+                    _media_probe_pending.discard(file_path)
+
+    threading.Thread(target=run, daemon=True).start()
+
+def format_video_info(video_path, info):
+    """把媒体信息整理为页面显示用的视频信息"""
+    video = info.get('video') or {}
+    # 获取文件名和大小
+    filename = os.path.basename(video_path)
+    filesize = os.path.getsize(video_path)
+    filesize_mb = f"{filesize / (1024 * 1024):.2f} MB"
+    return {
+        "filename": filename,
+        "filesize": filesize_mb,
+        "duration": seconds_to_time(info['duration']),
+        "resolution": f"{video.get('width', 0)}x{video.get('height', 0)}"
+    }
+
 def get_video_info(video_path):
     """获取视频信息"""
     try:
-        with VideoFileClip(video_path) as video:
-            duration = float(video.duration) if video.duration is not None else 0.0
-            fps = float(video.fps) if video.fps is not None else 0.0
-            size = video.size if video.size is not None else (0, 0)
-            # 获取文件名和大小
-            filename = os.path.basename(video_path)
-            filesize = os.path.getsize(video_path)
-            filesize_mb = f"{filesize / (1024 * 1024):.2f} MB"
-            return {
-                "filename": filename,
-                "filesize": filesize_mb,
-                "duration": seconds_to_time(duration),
-                "resolution": f"{size[0]}x{size[1]}"
-            }
+        return format_video_info(video_path, probe_media(video_path))
     except Exception as e:
         return {"error": str(e)}
 
+# 关键帧索引格式版本，格式变化后旧缓存自动失效
+KEYFRAME_INDEX_VERSION = 2
+
+# 关键帧索引构建锁，避免同一文件被重复扫描
+_keyframe_index_locks = {}
+_keyframe_index_locks_guard = threading.Lock()
+
+def build_keyframe_index(video_path):
+    """扫描视频流的数据包，生成关键帧索引（不解码）"""
+    keyframes = []
+    keyframe_bytes = []
+    keyframe_packets = []  # 每个关键帧之前（解码顺序）的数据包数量
+    total_bytes = 0
+    packet_count = 0
+    duration = 0.0
+
+    if FFPROBE_PATH:
+        cmd = [
+            FFPROBE_PATH,
+            '-v', 'error',
+            '-select_streams', 'v:0',
+            '-show_entries', 'packet=pts_time,duration_time,size,flags:format=start_time',
+            '-of', 'csv',
+            video_path
+        ]
+        result = run_ffmpeg(cmd, operation='keyframe_index', timeout=1800)
+        if result.returncode != 0:
+            raise Exception(f"FFprobe错误: {result.stderr}")
+
+        start_time = 0.0
+        packets = []
+        for line in result.stdout.splitlines():
+            fields = line.strip().split(',')
+            if fields[0] == 'format' and len(fields) > 1:
+                try:
+                    start_time = float(fields[1])
+                except ValueError:
+                    pass
+            elif fields[0] == 'packet' and len(fields) >= 5:
+                packets.append(fields[1:5])
+
+        for pts_time, duration_time, size, flags in packets:
+            packet_count += 1
+            try:
+                pts = float(pts_time) - start_time
+            except ValueError:
+                pts = None
+            if pts is not None and 'K' in flags:
+                keyframes.append(round(pts, 6))
+                keyframe_bytes.append(total_bytes)
+                keyframe_packets.append(packet_count - 1)
+            total_bytes += int(size) if size.isdigit() else 0
+            if pts is not None:
+                try:
+                    duration = max(duration, pts + float(duration_time))
+                except ValueError:
+                    duration = max(duration, pts)
+    else:
+        # 没有ffprobe时，用FFmpeg以流复制方式输出每个数据包的信息
+        cmd = [
+            FFMPEG_PATH,
+            '-i', video_path,
+            '-map', '0:v:0',
+            '-c', 'copy',
+            '-f', 'framecrc',
+            '-'
+        ]
+        result = run_ffmpeg(cmd, operation='keyframe_index', timeout=1800)
+        if result.returncode != 0:
+            raise Exception(f"FFmpeg错误: {result.stderr}")
+
+        time_base = None
+        for line in result.stdout.splitlines():
+            if line.startswith('#tb 0:'):
+                num, den = line.split(':', 1)[1].strip().split('/')
+                time_base = float(num) / float(den)
+                continue
+            if line.startswith('#') or time_base is None:
+                continue
+            fields = [field.strip() for field in line.split(',')]
+            if len(fields) < 5:
+                continue
+            packet_count += 1
+            pts = int(fields[2]) * time_base
+            # framecrc 只在标志位不是单纯关键帧时输出 F=
+            flags = fields[6] if len(fields) > 6 else ''
+            is_key = not flags or (int(flags.split('=')[1], 16) & 1)
+            if is_key:
+                keyframes.append(round(pts, 6))
+                keyframe_bytes.append(total_bytes)
+                keyframe_packets.append(packet_count - 1)
+            total_bytes += int(fields[4])
+            duration = max(duration, pts + int(fields[3]) * time_base)
+
+    # 数据包按解码顺序输出，按时间排序后便于二分查找
+    entries = sorted(zip(keyframes, keyframe_bytes, keyframe_packets))
+    return {
+        'version': KEYFRAME_INDEX_VERSION,
+        'keyframes': [entry[0] for entry in entries],
+        'keyframe_bytes': [entry[1] for entry in entries],
+        'keyframe_packets': [entry[2] for entry in entries],
+        'duration': round(duration, 6),
+        'packet_count': packet_count,
+        'video_bytes': total_bytes
+    }
+
+def get_keyframe_index(video_path, build=True):
+    """获取关键帧索引，优先读取磁盘缓存
+
+    build=False 时只返回已有的缓存，不触发扫描。
+    """
+    index = load_file_cache('keyframes', video_path)
+    if index is not None and index.get('version') != KEYFRAME_INDEX_VERSION:
+        index = None
+    if index is not None or not build:
+        return index
+
+    abs_path = os.path.abspath(video_path)
+    with _keyframe_index_locks_guard:
+        lock = _keyframe_index_locks.setdefault(abs_path, threading.Lock())
+    with lock:
+        # 等待期间可能已被其他线程生成
+        index = load_file_cache('keyframes', video_path)
+        if index is not None and index.get('version') == KEYFRAME_INDEX_VERSION:
+            return index
+        try:
+            index = build_keyframe_index(video_path)
+            save_file_cache('keyframes', video_path, index)
+            return index
+        except Exception as e:
+            logger.warning(f"关键帧索引生成失败: {str(e)}")
+            return None
+
+def keyframe_before(index, t):
+    """返回不晚于 t 的最后一个关键帧时间"""
+    keyframes = index['keyframes']
+    pos = bisect.bisect_right(keyframes, t + 1e-6)
+    return keyframes[pos - 1] if pos > 0 else 0.0
+
+def keyframe_after(index, t):
+    """返回不早于 t 的第一个关键帧时间"""
+    keyframes = index['keyframes']
+    pos = bisect.bisect_left(keyframes, t - 1e-6)
+    return keyframes[pos] if pos < len(keyframes) else index['duration']
+
+def keyframe_copy_start(index, keyframe_time):
+    """流复制从指定关键帧开始时使用的定位时间
+
+    FFmpeg按解码时间戳丢弃起点之前的数据包，关键帧的解码时间戳可能早于显示时间，
+    因此把定位点放在该关键帧与前一个关键帧之间（最多提前1秒）。
+    """
+    keyframes = index['keyframes']
+    pos = bisect.bisect_left(keyframes, keyframe_time - 1e-6)
+    previous = keyframes[pos - 1] if pos > 0 else 0.0
+    return max(keyframe_time - min(1.0, (keyframe_time - previous) / 2), 0.0)
+
+def get_actual_cut_range(index, start, end, cut_mode='copy'):
+    """计算流复制剪辑实际得到的起止时间
+
+    copy 模式下画面从 start 之后的第一个关键帧开始；
+    keyframe 模式把起点对齐到 start 之前的关键帧，不丢失画面。
+    """
+    duration = index['duration'] or end
+    if cut_mode == 'keyframe':
+        actual_start = keyframe_before(index, start)
+    else:
+        actual_start = keyframe_after(index, start)
+    return actual_start, min(end, duration)
+
+def prepare_source_caches(video_path):
+    """把 moov 移到文件开头，然后生成源文件的媒体信息、内容指纹、关键帧索引和缩略图雪碧图，需要时加入代理队列"""
+    try:
+        remux_faststart(video_path)
+    except Exception as e:
+        logger.warning(f"faststart 重封装失败: {str(e)}")
+    try:
+        probe_media(video_path)
+        get_source_fingerprint(video_path)
+    except Exception as e:
+        logger.warning(f"源文件缓存生成失败: {str(e)}")
+    get_keyframe_index(video_path)
+    get_sprite_map(video_path)
+    try:
+        get_proxy(video_path)
+    except Exception as e:
+        logger.warning(f"代理检查失败: {str(e)}")
+
+def start_keyframe_index_build(video_path):
+    """后台执行 faststart 重封装并生成媒体信息、内容指纹、关键帧索引和缩略图雪碧图，需要时加入代理队列（上传后调用）"""
+    thread = threading.Thread(target=prepare_source_caches, args=(video_path,), daemon=True)
+    thread.start()
+
+# 缩略图雪碧图：只解码关键帧，每隔 SPRITE_INTERVAL 秒取一帧拼成图集，供进度条悬停预览
+SPRITE_VERSION = 1
+SPRITE_INTERVAL = int(os.environ.get('SPRITE_INTERVAL', 10))
+SPRITE_TILE_WIDTH = 160
+SPRITE_COLUMNS = 10
+SPRITE_ROWS = 10
+
+_sprite_locks = {}
+_sprite_locks_guard = threading.Lock()
+
+def get_sprite_dir(video_path):
+    """获取视频雪碧图的存放目录"""
+    key = hashlib.sha1(os.path.abspath(video_path).encode('utf-8')).hexdigest()
+    return os.path.join(app.config['CACHE_FOLDER'], 'sprites', key)
+
+def build_sprite_sheets(video_path, interval=SPRITE_INTERVAL):
+    """生成缩略图雪碧图和图块映射表
+
+    -skip_frame nokey 只解码关键帧，每个 interval 时间段取其中第一个关键帧，
+    showinfo 输出每个图块的实际时间；图块按 SPRITE_COLUMNS x SPRITE_ROWS 拼成多张图。
+    """
+    info = probe_media(video_path)
+    video = info.get('video')
+    if not video or not video.get('width'):
+        raise Exception('没有视频流')
+    tile_width = SPRITE_TILE_WIDTH
+    tile_height = max(2, round(tile_width * video['height'] / video['width'] / 2) * 2)
+
+    sprite_dir = get_sprite_dir(video_path)
+    build_id = uuid.uuid4().hex[:8]
+    build_dir = os.path.join(sprite_dir, build_id)
+    os.makedirs(build_dir, exist_ok=True)
+
+    select = f"isnan(prev_selected_t)+gte(floor(t/{interval}),floor(prev_selected_t/{interval})+1)"
+    cmd = [
+        FFMPEG_PATH,
+        '-hide_banner',
+        '-nostats',
+        '-skip_frame', 'nokey',
+        '-i', video_path,
+        '-map', '0:v:0',
+        '-vf', f"select='{select}',scale={tile_width}:{tile_height},showinfo,tile={SPRITE_COLUMNS}x{SPRITE_ROWS}",
+        '-fps_mode', 'vfr',
+        '-q:v', '5',
+        '-y',
+        os.path.join(build_dir, 'sheet_%03d.jpg')
+    ]
+    result = run_ffmpeg(cmd, operation='sprite', timeout=3600)
+    if result.returncode != 0:
+        shutil.rmtree(build_dir, ignore_errors=True)
+        raise Exception(f"FFmpeg错误: {result.stderr}")
+
+    times = [float(t) for t in re.findall(r'\] n:\s*\d+ .*?pts_time:\s*(-?[\d.]+)', result.stderr)]
+    duration = info.get('duration') or (times[-1] + interval if times else 0.0)
+    per_sheet = SPRITE_COLUMNS * SPRITE_ROWS
+    static_root = os.path.join(BASE_DIR, 'static')
+    sheet_urls = []
+    tiles = []
+    for i, t in enumerate(times):
+        sheet = i // per_sheet
+        if sheet == len(sheet_urls):
+            sheet_path = os.path.join(build_dir, f'sheet_{sheet + 1:03d}.jpg')
+            sheet_urls.append('/static/' + os.path.relpath(sheet_path, static_root).replace(os.sep, '/'))
+        pos = i % per_sheet
+        tiles.append({
+            'start': round(t, 3),
+            'end': round(times[i + 1] if i + 1 < len(times) else duration, 3),
+            'sheet': sheet,
+            'x': (pos % SPRITE_COLUMNS) * tile_width,
+            'y': (pos // SPRITE_COLUMNS) * tile_height
+        })
+
+    # 只保留本次生成的图集
+    for name in os.listdir(sprite_dir):
+        if name != build_id:
+            shutil.rmtree(os.path.join(sprite_dir, name), ignore_errors=True)
+
+    return {
+        'version': SPRITE_VERSION,
+        'interval': interval,
+        'duration': round(duration, 3),
+        'tile_width': tile_width,
+        'tile_height': tile_height,
+        'columns': SPRITE_COLUMNS,
+        'rows': SPRITE_ROWS,
+        'sheets': sheet_urls,
+        'tiles': tiles
+    }
+
+def get_sprite_map(video_path, interval=SPRITE_INTERVAL, build=True):
+    """获取缩略图雪碧图的图块映射表，优先读取磁盘缓存
+
+    build=False 时只返回已有的缓存，不触发生成。
+    """
+    def load():
+        sprite_map = load_file_cache('sprites', video_path)
+        if sprite_map is None or sprite_map.get('version') != SPRITE_VERSION or sprite_map.get('interval') != interval:
+            return None
+        # 图集文件被清理后重新生成
+        sheet_dir = os.path.join(BASE_DIR, sprite_map['sheets'][0].lstrip('/')) if sprite_map['sheets'] else None
+        if sheet_dir and not os.path.exists(sheet_dir):
+            return None
+        return sprite_map
+
+    sprite_map = load()
+    if sprite_map is not None or not build:
+        return sprite_map
+
+    abs_path = os.path.abspath(video_path)
+    with _sprite_locks_guard:
+        lock = _sprite_locks.setdefault(abs_path, threading.Lock())
+    with lock:
+        sprite_map = load()
+        if sprite_map is not None:
+            return sprite_map
+        try:
+            sprite_map = build_sprite_sheets(video_path, interval)
+            save_file_cache('sprites', video_path, sprite_map)
+            return sprite_map
+        except Exception as e:
+            logger.warning(f"缩略图雪碧图生成失败: {str(e)}")
+            return None
+
+def get_sprite_vtt(sprite_map):
+    """把图块映射表转换为 WebVTT 缩略图轨道（url#xywh=x,y,w,h）"""
+    def vtt_time(seconds):
+        hours, rest = divmod(seconds, 3600)
+        minutes, secs = divmod(rest, 60)
+        return f"{int(hours):02d}:{int(minutes):02d}:{secs:06.3f}"
+
+    lines = ['WEBVTT', '']
+    for tile in sprite_map['tiles']:
+        lines.append(f"{vtt_time(tile['start'])} --> {vtt_time(tile['end'])}")
+        lines.append(f"{sprite_map['sheets'][tile['sheet']]}#xywh={tile['x']},{tile['y']},"
+                     f"{sprite_map['tile_width']},{sprite_map['tile_height']}")
+        lines.append('')
+    return '\n'.join(lines)
+
+# 编辑代理：浏览器播放不了或解码吃力的源文件（MKV/AVI/WMV、4K、高码率），在低优先级后台队列里
+# 生成小尺寸、短GOP的H.264代理供播放器使用；剪辑、裁剪等操作仍然使用原文件
+PROXY_VERSION = 1
+PROXY_MAX_HEIGHT = int(os.environ.get('PROXY_MAX_HEIGHT', 540))
+PROXY_BITRATE_THRESHOLD_KBPS = int(os.environ.get('PROXY_BITRATE_THRESHOLD_KBPS', 8000))
+BACKGROUND_NICE = 10  # 后台代理生成、faststart 重封装的调度优先级
+BROWSER_VIDEO_EXTENSIONS = ('.mp4', '.m4v', '.webm')
+BROWSER_VIDEO_CODECS = {'h264', 'vp8', 'vp9', 'av1'}
+BROWSER_AUDIO_CODECS = {'aac', 'mp3', 'opus', 'vorbis'}
+BROWSER_PIX_FMTS = {'yuv420p', 'yuvj420p'}
+
+proxy_executor = ThreadPoolExecutor(max_workers=1)
+_proxy_status = {}  # 绝对路径 -> queued / building / failed
+_proxy_status_lock = threading.Lock()
+
+def get_proxy_path(video_path):
+    """获取视频编辑代理的存放路径"""
+    key = hashlib.sha1(os.path.abspath(video_path).encode('utf-8')).hexdigest()
+    return os.path.join(app.config['CACHE_FOLDER'], 'proxies', f"{key}.mp4")
+
+def get_proxy_reason(video_path, info):
+    """判断是否需要生成代理，需要时返回原因，否则返回 None"""
+    video = info.get('video')
+    if not video:
+        return None
+    if not video_path.lower().endswith(BROWSER_VIDEO_EXTENSIONS):
+        return f"浏览器不支持 {os.path.splitext(video_path)[1] or '该'} 格式"
+    if video['codec'] not in BROWSER_VIDEO_CODECS:
+        return f"浏览器不支持 {video['codec']} 视频编码"
+    if video.get('pix_fmt') and video['pix_fmt'] not in BROWSER_PIX_FMTS:
+        return f"浏览器不支持 {video['pix_fmt']} 像素格式"
+    if info.get('audio') and info['audio']['codec'] not in BROWSER_AUDIO_CODECS:
+        return f"浏览器不支持 {info['audio']['codec']} 音频编码"
+    if video['height'] > PROXY_MAX_HEIGHT * 2:
+        return f"分辨率过高（{video['width']}x{video['height']}）"
+    if info.get('bit_rate', 0) > PROXY_BITRATE_THRESHOLD_KBPS * 1000:
+        return f"码率过高（{info['bit_rate'] // 1000} kb/s）"
+    return None
+
+def build_proxy(video_path):
+    """生成编辑代理：缩小到 PROXY_MAX_HEIGHT、每秒一个关键帧便于拖动定位，时间戳和时间基与原文件一致"""
+    info = probe_media(video_path)
+    video = info['video']
+    proxy_path = get_proxy_path(video_path)
+    os.makedirs(os.path.dirname(proxy_path), exist_ok=True)
+    temp_path = f"{proxy_path}.{uuid.uuid4().hex}.tmp.mp4"
+
+    cmd = [
+        FFMPEG_PATH,
+        '-i', video_path,
+        '-map', '0:v:0',
+        '-map', '0:a:0?',
+        '-vf', f"scale=-2:'min(ih,{PROXY_MAX_HEIGHT})'",
+        '-fps_mode', 'passthrough',
+        '-c:v', 'libx264',
+        '-preset', 'veryfast',
+        '-tune', 'fastdecode',
+        '-crf', '28',
+        '-pix_fmt', 'yuv420p',
+        '-force_key_frames', 'expr:gte(t,n_forced*1)',
+        '-c:a', 'aac',
+        '-b:a', '96k',
+        '-ac', '2',
+        '-movflags', '+faststart'
+    ]
+    if video.get('time_base'):
+        cmd.extend(['-video_track_timescale', video['time_base'].split('/')[1]])
+    cmd.extend(['-y', temp_path])
+
+    result = run_ffmpeg(cmd, operation='proxy', timeout=max(3600, int(info.get('duration') or 0) * 2), nice=BACKGROUND_NICE)
+    if result.returncode != 0:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise Exception(f"FFmpeg错误: {result.stderr}")
+    os.replace(temp_path, proxy_path)
+    return {
+        'version': PROXY_VERSION,
+        'url': '/static/' + os.path.relpath(proxy_path, os.path.join(BASE_DIR, 'static')).replace(os.sep, '/'),
+        'size': os.path.getsize(proxy_path)
+    }
+
+def load_proxy(video_path):
+    """读取已生成的代理信息，原文件变化或代理文件被清理后返回 None"""
+    proxy = load_file_cache('proxy', video_path)
+    if proxy is None or proxy.get('version') != PROXY_VERSION or not os.path.exists(get_proxy_path(video_path)):
+        return None
+    return proxy
+
+def run_proxy_build(video_path):
+    """代理队列中执行的任务"""
+    abs_path = os.path.abspath(video_path)
+    with _proxy_status_lock:
+        _proxy_status[abs_path] = 'building'
+    try:
+        if load_proxy(video_path) is None:
+            save_file_cache('proxy', video_path, build_proxy(video_path))
+        with _proxy_status_lock:
+            _proxy_status.pop(abs_path, None)
+    except Exception as e:
+        logger.warning(f"代理生成失败: {str(e)}")
+        with _proxy_status_lock:
+            _proxy_status[abs_path] = 'failed'
+
+def get_proxy(video_path, enqueue=True):
+    """获取视频的播放代理状态
+
+    status: original（不需要代理，直接播放原文件）/ ready / queued / building / failed / none（未生成且未加入队列）。
+    enqueue=True 时需要代理但还没有生成的文件会加入后台队列。
+    """
+    info = probe_media(video_path)
+    video = info.get('video') or {}
+    proxy = {
+        'status': 'original',
+        'url': None,
+        'reason': get_proxy_reason(video_path, info),
+        'width': video.get('width', 0),
+        'height': video.get('height', 0),
+        'duration': info.get('duration', 0)
+    }
+    if proxy['reason'] is None:
+        return proxy
+
+    cached = load_proxy(video_path)
+    if cached is not None:
+        proxy.update(status='ready', url=cached['url'])
+        return proxy
+
+    abs_path = os.path.abspath(video_path)
+    with _proxy_status_lock:
+        status = _proxy_status.get(abs_path)
+        if status is None and enqueue:
+            status = _proxy_status[abs_path] = 'queued'
+            proxy_executor.submit(run_proxy_build, video_path)
+    proxy['status'] = status or 'none'
+    return proxy
+
+# faststart：MP4/MOV 的 moov 原子在文件末尾时，浏览器要先取到文件尾部才能开始播放和定位，
+# 上传文件和输出文件在后台以流复制方式把 moov 移到文件开头（新生成的输出直接带 get_faststart_args() 参数）
+faststart_executor = ThreadPoolExecutor(max_workers=1)
+_faststart_pending = set()
+_faststart_lock = threading.Lock()
+
+def get_moov_position(file_path):
+    """读取 MP4/MOV 顶层原子，返回 moov 相对 mdat 的位置：front / end；不是 MP4 或结构不完整时返回 None"""
+    try:
+        with open(file_path, 'rb') as f:
+            file_size = os.fstat(f.fileno()).st_size
+            offset = 0
+            seen_mdat = False
+            while offset + 8 <= file_size:
+                f.seek(offset)
+                header = f.read(16)
+                size = int.from_bytes(header[0:4], 'big')
+                atom_type = header[4:8]
+                if size == 1:
+                    # 64位扩展大小
+                    if len(header) < 16:
+                        return None
+                    size = int.from_bytes(header[8:16], 'big')
+                elif size == 0:
+                    # 一直延伸到文件末尾
+                    size = file_size - offset
+                if size < 8:
+                    return None
+                if atom_type == b'moov':
+                    return 'end' if seen_mdat else 'front'
+                if atom_type == b'mdat':
+                    seen_mdat = True
+                offset += size
+    except OSError:
+        pass
+    return None
+
+def needs_faststart(file_path):
+    """判断文件是否需要把 moov 移到文件开头"""
+    if os.path.splitext(file_path)[1].lower() not in FASTSTART_MUXERS:
+        return False
+    return get_moov_position(file_path) == 'end'
+
+def remux_faststart(file_path):
+    """以流复制方式把 moov 移到文件开头，写临时文件后原子替换，保留原文件的修改时间"""
+    if not needs_faststart(file_path):
+        return False
+    stat = os.stat(file_path)
+    temp_path = os.path.join(os.path.dirname(file_path), f".{os.path.basename(file_path)}.{uuid.uuid4().hex}.tmp")
+    cmd = [
+        FFMPEG_PATH,
+        '-i', file_path,
+        '-map', '0',
+        '-c', 'copy',
+        '-map_metadata', '0',
+        '-movflags', '+faststart',
+        '-f', FASTSTART_MUXERS[os.path.splitext(file_path)[1].lower()],
+        '-y',
+        temp_path
+    ]
+    try:
+        result = run_ffmpeg(cmd, operation='faststart', timeout=3600, nice=BACKGROUND_NICE)
+        if result.returncode != 0:
+            raise Exception(f"FFmpeg错误: {result.stderr}")
+        # 重封装期间原文件被改写过时放弃替换
+        current = os.stat(file_path)
+        if (current.st_size, current.st_mtime) != (stat.st_size, stat.st_mtime):
+            raise Exception('文件在重封装期间被修改')
+        os.utime(temp_path, (stat.st_atime, stat.st_mtime))
+        os.replace(temp_path, file_path)
+        return True
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def run_faststart_remux(file_path):
+    """faststart 队列中执行的任务"""
+    abs_path = os.path.abspath(file_path)
+    try:
+        remux_faststart(file_path)
+    except Exception as e:
+        logger.warning(f"faststart 重封装失败: {str(e)}")
+    finally:
+        with _faststart_lock:
+            _faststart_pending.discard(abs_path)
+
+def start_faststart_remux(file_path):
+    """需要时把文件加入后台 faststart 队列，返回是否已在队列中"""
+    abs_path = os.path.abspath(file_path)
+    with _faststart_lock:
+        if abs_path in _faststart_pending:
+            return True
+        if not needs_faststart(file_path):
+            return False
+        _faststart_pending.add(abs_path)
+    faststart_executor.submit(run_faststart_remux, file_path)
+    return True
+
+# 片段缓存：按（源文件内容指纹、起止时间、剪辑模式、编码参数）保存已裁剪的片段，
+# 相同片段再次导出时直接链接到输出目录，无需重新裁剪
+CLIP_CACHE_VERSION = 3
+CLIP_CACHE_MAX_BYTES = int(os.environ.get('CLIP_CACHE_MAX_MB', 10240)) * 1024 * 1024
+FICLONE = 0x40049409  # Linux 写时复制（reflink）ioctl
+
+_clip_cache_lock = threading.Lock()
+
+FINGERPRINT_VERSION = 2
+FINGERPRINT_BLOCK_SIZE = 1024 * 1024  # 首尾各读取的字节数
+FINGERPRINT_SAMPLE_SIZE = 64 * 1024   # 中间每个采样块的字节数
+FINGERPRINT_SAMPLE_COUNT = 16
+
+def get_source_fingerprint(file_path):
+    """计算源文件指纹：路径、大小、修改时间加上首尾和中间均匀采样块的SHA-1
+
+    只读取约 3MB，不随文件大小增长；路径、大小和修改时间任一变化指纹都会变化，
+    所以采样之外的改写也不会误用旧片段。小文件整个读取。
+    """
+    cached = load_file_cache('fingerprint', file_path)
+    if isinstance(cached, dict) and cached.get('version') == FINGERPRINT_VERSION:
+        return cached['fingerprint']
+    stat = os.stat(file_path)
+    sha1 = hashlib.sha1(json.dumps([os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns]).encode('utf-8'))
+    with open(file_path, 'rb') as f:
+        if stat.st_size <= FINGERPRINT_BLOCK_SIZE * 2 + FINGERPRINT_SAMPLE_SIZE * FINGERPRINT_SAMPLE_COUNT:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha1.update(chunk)
+        else:
+            sha1.update(f.read(FINGERPRINT_BLOCK_SIZE))
+            middle = stat.st_size - FINGERPRINT_BLOCK_SIZE * 2 - FINGERPRINT_SAMPLE_SIZE
+            for i in range(FINGERPRINT_SAMPLE_COUNT):
+                f.seek(FINGERPRINT_BLOCK_SIZE + middle * i // (FINGERPRINT_SAMPLE_COUNT - 1))
+                sha1.update(f.read(FINGERPRINT_SAMPLE_SIZE))
+            f.seek(stat.st_size - FINGERPRINT_BLOCK_SIZE)
+            sha1.update(f.read(FINGERPRINT_BLOCK_SIZE))
+    fingerprint = sha1.hexdigest()
+    save_file_cache('fingerprint', file_path, {'version': FINGERPRINT_VERSION, 'fingerprint': fingerprint})
+    return fingerprint
+
+def link_or_copy_file(src, dst):
+    """把文件放到目标位置：优先硬链接，其次写时复制（reflink），最后普通复制
+
+    先写到临时文件再替换，目标已存在时不会改写原文件内容（原文件可能是其他位置的硬链接）。
+    """
+    temp_path = f"{dst}.{uuid.uuid4().hex}.tmp"
+    try:
+        os.link(src, temp_path)
+        method = 'hardlink'
+    except OSError:
+        try:
+            import fcntl
+            with open(src, 'rb') as fs, open(temp_path, 'wb') as fd:
+                fcntl.ioctl(fd.fileno(), FICLONE, fs.fileno())
+            method = 'reflink'
+        except (ImportError, OSError):
+            shutil.copyfile(src, temp_path)
+            method = 'copy'
+    os.replace(temp_path, dst)
+    return method
+
+def get_clip_cache_key(fingerprint, start, end, cut_mode, output_args):
+    """生成片段缓存键"""
+    key_data = [CLIP_CACHE_VERSION, fingerprint, round(start, 3), round(end, 3), cut_mode, output_args]
+    return hashlib.sha1(json.dumps(key_data).encode('utf-8')).hexdigest()
+
+def get_clip_cache_paths(key, ext):
+    """返回缓存片段文件及其元数据文件的路径"""
+    clip_dir = os.path.join(app.config['CACHE_FOLDER'], 'clips')
+    return os.path.join(clip_dir, f"{key}{ext}"), os.path.join(clip_dir, f"{key}.json")
+
+def write_clip_cache_meta(meta_path, meta):
+    temp_path = f"{meta_path}.{uuid.uuid4().hex}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(temp_path, meta_path)
+
+def lookup_clip_cache(key, ext, touch=True):
+    """查找缓存片段，命中时更新最近使用时间并返回文件路径
+
+    缓存文件大小或修改时间与记录不一致（被改写过）时视为失效；touch=False 时只查询不更新。
+    """
+    clip_path, meta_path = get_clip_cache_paths(key, ext)
+    with _clip_cache_lock:
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            stat = os.stat(clip_path)
+        except (OSError, ValueError):
+            return None
+        if meta.get('size') != stat.st_size or meta.get('mtime') != stat.st_mtime:
+            return None
+        if not touch:
+            return clip_path
+        meta['last_used'] = time.time()
+        try:
+            write_clip_cache_meta(meta_path, meta)
+        except OSError:
+            pass
+        return clip_path
+
+def store_clip_cache(key, file_path):
+    """把裁剪结果放入片段缓存，超出容量时按最近使用时间淘汰"""
+    ext = os.path.splitext(file_path)[1]
+    clip_path, meta_path = get_clip_cache_paths(key, ext)
+    try:
+        os.makedirs(os.path.dirname(clip_path), exist_ok=True)
+        with _clip_cache_lock:
+            link_or_copy_file(file_path, clip_path)
+            stat = os.stat(clip_path)
+            write_clip_cache_meta(meta_path, {
+                'file': os.path.basename(clip_path),
+                'size': stat.st_size,
+                'mtime': stat.st_mtime,
+                'last_used': time.time()
+            })
+            evict_clip_cache()
+    except OSError as e:
+        logger.warning(f"片段缓存保存失败: {str(e)}")
+
+def evict_clip_cache():
+    """按最近使用时间淘汰缓存片段，直到总大小不超过上限（调用方需持有 _clip_cache_lock）"""
+    clip_dir = os.path.join(app.config['CACHE_FOLDER'], 'clips')
+    entries = []
+    total_size = 0
+    for name in os.listdir(clip_dir):
+        if not name.endswith('.json'):
+            continue
+        meta_path = os.path.join(clip_dir, name)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            continue
+        entries.append((meta.get('last_used', 0), meta_path, os.path.join(clip_dir, meta.get('file', '')), meta.get('size', 0)))
+        total_size += meta.get('size', 0)
+    entries.sort()
+    for _, meta_path, clip_path, size in entries:
+        if total_size <= CLIP_CACHE_MAX_BYTES:
+            break
+        for path in (clip_path, meta_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        total_size -= size
+
 def smart_cut(in_file, out_file, start, end):
     """零重编码精准切片"""
     try:
@@ -114,10 +989,11 @@ def smart_cut(in_file, out_file, start, end):
             '-ss', str(start),
             '-to', str(end),
             '-c', 'copy',
+            *get_faststart_args(out_file),
             '-y',
             out_file
         ]
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)  # 5分钟超时
+        result = run_ffmpeg(cmd, operation='cut', timeout=300)  # 5分钟超时
         if result.returncode != 0:
             raise Exception(f"FFmpeg error: {result.stderr}")
         return True
@@ -125,8 +1001,396 @@ def smart_cut(in_file, out_file, start, end):
         print(f"FFmpeg cut failed: {str(e)}")
         return False
 
-def concatenate_videos(video_paths, output_path):
-    """拼接多个视频文件（零重编码版）"""
+def cut_audio_clip(in_file, out_file, start, end, output_args):
+    """单独导出一个音频片段（批量导出失败时逐个重试），失败时抛出带FFmpeg错误信息的异常"""
+    cmd = [
+        FFMPEG_PATH,
+        '-ss', str(start),
+        '-i', in_file,
+        '-t', str(end - start),
+        *output_args,
+        '-y',
+        out_file
+    ]
+    result = run_ffmpeg(cmd, operation='cut', timeout=300)  # 5分钟超时
+    if result.returncode != 0 or not os.path.exists(out_file):
+        raise Exception(f"FFmpeg音频导出错误: {result.stderr[-500:]}")
+
+# 单次FFmpeg调用最多输出的片段数（避免同时打开过多输出文件）
+MAX_OUTPUTS_PER_PASS = 16
+# 单批剪辑的超时上限（按每个片段5分钟累加，不超过30分钟）
+MULTI_CUT_MAX_TIMEOUT = 1800
+
+def detect_io_workers(path):
+    """根据存放文件的磁盘类型决定流复制的并行数：机械硬盘并行读取会来回寻道，只用1个；SSD或无法判断时用4个"""
+    try:
+        dev = os.stat(path).st_dev
+        block_dir = f"/sys/dev/block/{os.major(dev)}:{os.minor(dev)}"
+        # 分区没有自己的 queue 目录，读取所在磁盘的
+        for queue_dir in (os.path.join(block_dir, 'queue'), os.path.join(block_dir, '..', 'queue')):
+            rotational_path = os.path.join(queue_dir, 'rotational')
+            if os.path.exists(rotational_path):
+                with open(rotational_path, 'r') as f:
+                    return 1 if f.read().strip() == '1' else 4
+    except (OSError, AttributeError):
+        pass
+    return 4
+
+# 并行剪辑的并发上限：x264 等编码器本身多线程，每个重编码进程按4核计算，避免进程数×线程数超过CPU核数；
+# 流复制主要受磁盘读取限制，按上传目录所在磁盘是否为机械硬盘决定
+CUT_CPU_WORKERS = int(os.environ.get('CUT_CPU_WORKERS', max(1, (os.cpu_count() or 1) // 4)))
+CUT_IO_WORKERS = int(os.environ.get('CUT_IO_WORKERS', 0)) or detect_io_workers(BASE_DIR)
+
+def get_cut_worker_count(reencode=False):
+    """根据剪辑方式返回并行进程数"""
+    if reencode:
+        return max(1, CUT_CPU_WORKERS)
+    return max(1, min(CUT_IO_WORKERS, os.cpu_count() or 1))
+
+def get_encode_threads(workers):
+    """并行重编码时每个FFmpeg进程的编码线程数（各进程平分CPU）"""
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+def get_cut_batches(segments, max_workers=1):
+    """把片段按开始时间连续分批，返回每批的片段下标列表
+
+    批次数至少能让每个并行进程分到一批，每批最多 MAX_OUTPUTS_PER_PASS 个输出。
+    """
+    order = sorted(range(len(segments)), key=lambda i: segments[i][0])
+    if not order:
+        return []
+    batch_count = max(-(-len(order) // MAX_OUTPUTS_PER_PASS), min(max_workers, len(order)))
+    batch_size = -(-len(order) // batch_count)
+    return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+def multi_cut(in_file, segments, output_args=None, max_workers=1, on_result=None):
+    """单次读取源文件输出多个片段
+
+    segments 为 [(start, end, out_file), ...]，按开始时间分成若干批，
+    每批只启动一个FFmpeg进程：先在输入端定位到本批最早的开始时间，
+    再为每个片段添加一个输出，本批覆盖的区间只被顺序读取一次。
+    max_workers > 1 时各批并行执行；on_result(i, ok) 在每批完成后逐个片段回调。
+    返回与 segments 顺序一致的成功标记列表。
+    """
+    if output_args is None:
+        output_args = ['-c', 'copy']
+
+    results = [False] * len(segments)
+    batches = get_cut_batches(segments, max_workers)
+    if not batches:
+        return results
+
+    def run_batch(batch):
+        seek = min(segments[i][0] for i in batch)
+
+        cmd = [FFMPEG_PATH, '-y', '-ss', str(seek), '-i', in_file]
+        for i in batch:
+            start, end, out_file = segments[i]
+            cmd.extend(['-ss', str(start - seek), '-to', str(end - seek), *output_args, *get_faststart_args(out_file), out_file])
+
+        success = False
+        try:
+            result = run_ffmpeg(cmd, operation='cut', timeout=min(300 * len(batch), MULTI_CUT_MAX_TIMEOUT))
+            if result.returncode == 0:
+                success = True
+            else:
+                logger.warning(f"FFmpeg multi cut error: {result.stderr}")
+        except Exception as e:
+            logger.warning(f"FFmpeg multi cut failed: {str(e)}")
+
+        # 逐个检查输出，失败的片段交给调用方回退处理
+        for i in batch:
+            out_file = segments[i][2]
+            results[i] = success and os.path.exists(out_file) and os.path.getsize(out_file) > 0
+            if on_result:
+                on_result(i, results[i])
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(batches)))) as executor:
+        list(executor.map(run_batch, batches))
+
+    return results
+
+_audio_track_locks = {}
+_audio_track_locks_guard = threading.Lock()
+
+def get_audio_track(video_path, fingerprint, output_args):
+    """把音轨按目标格式完整编码一次，放入片段缓存，供各片段流复制切分
+
+    MP3按帧独立存储，切分时只需在帧边界流复制，不必每个片段都重新读取视频并编码。
+    生成失败或超出缓存容量时返回 None，调用方退回逐片段编码。
+    """
+    key = get_clip_cache_key(fingerprint, 0, 0, 'audio_track', output_args)
+    track_path = lookup_clip_cache(key, '.mp3')
+    if track_path:
+        return track_path
+
+    with _audio_track_locks_guard:
+        lock = _audio_track_locks.setdefault(key, threading.Lock())
+    with lock:
+        # 等待期间可能已被其他线程生成
+        track_path = lookup_clip_cache(key, '.mp3')
+        if track_path:
+            return track_path
+
+        clip_dir = os.path.join(app.config['CACHE_FOLDER'], 'clips')
+        os.makedirs(clip_dir, exist_ok=True)
+        temp_path = os.path.join(clip_dir, f"{key}.{uuid.uuid4().hex}.tmp.mp3")
+        cmd = [FFMPEG_PATH, '-i', video_path, *output_args, '-f', 'mp3', '-y', temp_path]
+        try:
+            result = run_ffmpeg(cmd, operation='audio_track', timeout=1800)
+            if result.returncode != 0 or not os.path.exists(temp_path):
+                logger.warning(f"音轨提取失败: {result.stderr}")
+                return None
+            store_clip_cache(key, temp_path)
+            return lookup_clip_cache(key, '.mp3')
+        except Exception as e:
+            logger.warning(f"音轨提取失败: {str(e)}")
+            return None
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+
+# 混合精确剪辑支持的视频编码：(重编码使用的编码器, 转为 Annex B 的比特流过滤器)
+HYBRID_CUT_ENCODERS = {
+    'h264': ('libx264', 'h264_mp4toannexb'),
+    'hevc': ('libx265', 'hevc_mp4toannexb')
+}
+
+def accurate_cut(in_file, out_file, start, end):
+    """整段重编码的精确剪辑"""
+    cmd = [
+        FFMPEG_PATH,
+        '-ss', str(start),
+        '-i', in_file,
+        '-t', str(end - start),
+        '-c:v', 'libx264',
+        '-preset', 'fast',
+        '-crf', '18',
+        '-threads', str(get_encode_threads(get_cut_worker_count(reencode=True))),
+        '-c:a', 'aac',
+        *get_faststart_args(out_file),
+        '-y',
+        out_file
+    ]
+    result = run_ffmpeg(cmd, operation='cut_accurate', timeout=600)
+    if result.returncode != 0:
+        raise Exception(f"FFmpeg重编码剪辑错误: {result.stderr}")
+
+def hybrid_cut(in_file, out_file, start, end, index):
+    """混合精确剪辑：只重编码首尾不完整的GOP，中间部分流复制
+
+    [start, 第一个关键帧) 和 [最后一个关键帧, end) 重编码，中间整段GOP直接复制，
+    重编码部分对齐源视频的 profile、level 和参考帧数，三段都带上码流内参数集（SPS/PPS），
+    用 concat 清单无损拼接后再与流复制的音频一起封装（MP4/MOV 使用 avc3/hev1 样本描述）。
+    返回 'hybrid' 或 'reencode'（区间内没有完整GOP或编码不支持时整段重编码）。
+    """
+    params = probe_media(in_file)['video']
+    keyframes = index['keyframes']
+    first_key = keyframe_after(index, start)
+    last_key = keyframe_before(index, end)
+
+    if not params or params['codec'] not in HYBRID_CUT_ENCODERS or first_key >= last_key:
+        accurate_cut(in_file, out_file, start, end)
+        return 'reencode'
+
+    encoder, annexb_filter = HYBRID_CUT_ENCODERS[params['codec']]
+    half_frame = 0.5 / params['fps'] if params['fps'] else 0.02
+    encode_args = ['-map', '0:v:0', '-an', '-c:v', encoder, '-preset', 'fast', '-crf', '18',
+                   '-threads', str(get_encode_threads(get_cut_worker_count(reencode=True))), '-bsf:v', annexb_filter]
+    if params['pix_fmt']:
+        encode_args.extend(['-pix_fmt', params['pix_fmt']])
+    encode_args.extend(get_matching_encoder_args(params))
+    # 首尾与中间段的参数集不同，文件头只有第一段的参数集，需声明为码流内参数集
+    inband_args = []
+    if out_file.lower().endswith(('.mp4', '.mov', '.m4v')):
+        inband_args = ['-tag:v', INBAND_PARAMETER_SET_TAGS[params['codec']]]
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        parts = []
+
+        # 1. 头部：起点到第一个关键帧之间重编码
+        if first_key - start > half_frame:
+            head_path = os.path.join(temp_dir, 'head.mp4')
+            cmd = [FFMPEG_PATH, '-ss', str(start), '-i', in_file,
+                   '-t', str(first_key - start - half_frame), *encode_args, '-y', head_path]
+            result = run_ffmpeg(cmd, operation='cut_hybrid', timeout=300)
+            if result.returncode != 0:
+                raise Exception(f"FFmpeg头部编码错误: {result.stderr}")
+            parts.append(head_path)
+
+        # 2. 中间：两个关键帧之间按数据包数量原样复制
+        first_pos = bisect.bisect_left(keyframes, first_key - 1e-6)
+        last_pos = bisect.bisect_left(keyframes, last_key - 1e-6)
+        packet_count = index['keyframe_packets'][last_pos] - index['keyframe_packets'][first_pos]
+        middle_path = os.path.join(temp_dir, 'middle.mp4')
+        cmd = [FFMPEG_PATH, '-ss', str(first_key + half_frame), '-i', in_file,
+               '-map', '0:v:0', '-an', '-c:v', 'copy', '-bsf:v', annexb_filter,
+               '-frames:v', str(packet_count), '-y', middle_path]
+        result = run_ffmpeg(cmd, operation='cut_hybrid', timeout=300)
+        if result.returncode != 0:
+            raise Exception(f"FFmpeg中间段复制错误: {result.stderr}")
+        parts.append(middle_path)
+
+        # 3. 尾部：最后一个关键帧到终点之间重编码
+        if end - last_key > half_frame:
+            tail_path = os.path.join(temp_dir, 'tail.mp4')
+            cmd = [FFMPEG_PATH, '-ss', str(last_key), '-i', in_file,
+                   '-t', str(end - last_key), *encode_args, '-y', tail_path]
+            result = run_ffmpeg(cmd, operation='cut_hybrid', timeout=300)
+            if result.returncode != 0:
+                raise Exception(f"FFmpeg尾部编码错误: {result.stderr}")
+            parts.append(tail_path)
+
+        # 4. 无损拼接三段视频，音频从源文件流复制
+        list_path = os.path.join(temp_dir, 'parts.txt')
+        with open(list_path, 'w', encoding='utf-8') as f:
+            for part in parts:
+                f.write(f"file '{part}'\n")
+        cmd = [
+            FFMPEG_PATH,
+            '-f', 'concat', '-safe', '0', '-i', list_path,
+            '-ss', str(start), '-i', in_file,
+            '-map', '0:v:0', '-map', '1:a:0?',
+            '-t', str(end - start),
+            '-c', 'copy',
+            *inband_args,
+            *get_faststart_args(out_file),
+            '-y',
+            out_file
+        ]
+        result = run_ffmpeg(cmd, operation='cut_hybrid', timeout=300)
+        if result.returncode != 0:
+            raise Exception(f"FFmpeg拼接错误: {result.stderr}")
+        return 'hybrid'
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+# 拼接前统一参数时使用的编码器
+CONCAT_VIDEO_ENCODERS = {'h264': 'libx264', 'hevc': 'libx265', 'mpeg4': 'mpeg4', 'vp9': 'libvpx-vp9', 'vp8': 'libvpx'}
+CONCAT_AUDIO_ENCODERS = {'aac': 'aac', 'mp3': 'libmp3lame', 'opus': 'libopus', 'vorbis': 'libvorbis', 'ac3': 'ac3'}
+
+def get_concat_profile(info):
+    """流复制拼接要求各输入一致的参数：编码、分辨率、帧率、时间基、像素格式和声道布局"""
+    video, audio = info.get('video'), info.get('audio')
+    video_profile = (video['codec'], video['width'], video['height'], video['fps'],
+                     video.get('time_base'), video['pix_fmt']) if video else None
+    audio_profile = (audio['codec'], audio['sample_rate'], audio['channels'],
+                     audio.get('channel_layout')) if audio else None
+    return video_profile, audio_profile
+
+def analyze_concat_inputs(video_paths):
+    """拼接前检查各输入是否能直接流复制拼接
+
+    返回 (目标参数, 参数不一致的输入下标列表)，目标参数取多数输入的参数（数量相同时取靠前的）。
+    """
+    profiles = [get_concat_profile(probe_media(fp)) for fp in video_paths]
+    counts = {}
+    for profile in profiles:
+        counts[profile] = counts.get(profile, 0) + 1
+    target = max(profiles, key=lambda profile: counts[profile])  # max 在数量相同时返回靠前的
+    return target, [i for i, profile in enumerate(profiles) if profile != target]
+
+def get_exact_frame_rate(fps):
+    """把媒体信息中保留3位小数的帧率还原为精确的分数形式（29.97 -> 30000/1001）"""
+    if abs(fps - round(fps)) < 0.0005:
+        return str(round(fps))
+    ntsc = round(fps * 1.001)
+    if abs(fps * 1.001 - ntsc) < 0.002:
+        return f"{ntsc * 1000}/1001"
+    rate = Fraction(fps).limit_denominator(1001)
+    return f"{rate.numerator}/{rate.denominator}"
+
+# 与目标参数一致的编码器 profile 名称，h264/hevc 以外的编码不指定
+ENCODER_PROFILES = {
+    'h264': {'Baseline': 'baseline', 'Constrained Baseline': 'baseline', 'Main': 'main', 'High': 'high',
+             'High 10': 'high10', 'High 4:2:2': 'high422', 'High 4:4:4 Predictive': 'high444'},
+    'hevc': {'Main': 'main', 'Main 10': 'main10', 'Main Still Picture': 'mainstillpicture'}
+}
+# 码流内带参数集时使用的 MP4 样本描述（avc1/hvc1 只在文件头保存一份 SPS/PPS）
+INBAND_PARAMETER_SET_TAGS = {'h264': 'avc3', 'hevc': 'hev1'}
+
+def get_matching_encoder_args(video):
+    """重编码片段与流复制片段拼接时的编码参数：对齐源视频的 profile、level、参考帧数，并在每个关键帧前重复参数集"""
+    codec, args = video['codec'], []
+    profile = ENCODER_PROFILES.get(codec, {}).get(video.get('profile'))
+    if profile:
+        args.extend(['-profile:v', profile])
+    if codec == 'h264':
+        if video.get('level'):
+            args.extend(['-level', f"{video['level'] / 10:.1f}"])
+        if video.get('refs'):
+            args.extend(['-refs', str(video['refs'])])
+        args.extend(['-x264-params', 'repeat-headers=1'])
+    elif codec == 'hevc':
+        x265_params = ['repeat-headers=1']
+        if video.get('level'):
+            x265_params.append(f"level-idc={video['level'] / 30:.1f}")
+        args.extend(['-x265-params', ':'.join(x265_params)])
+    return args
+
+def normalize_concat_input(input_path, output_path, target, reference):
+    """把参数不一致的输入转码为目标参数，编码参数对齐参数一致的参考输入，返回是否成功"""
+    (video_profile, audio_profile), info = target, probe_media(input_path)
+    if video_profile is None or info.get('video') is None:
+        return False
+    codec, width, height, fps, time_base, pix_fmt = video_profile
+    video_encoder = CONCAT_VIDEO_ENCODERS.get(codec)
+    if video_encoder is None:
+        return False
+    
+    # 等比缩放后补黑边，统一帧率和像素格式
+    filters = [f"scale={width}:{height}:force_original_aspect_ratio=decrease",
+               f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2", 'setsar=1']
+    if fps:
+        filters.append(f"fps={get_exact_frame_rate(fps)}")
+    if pix_fmt:
+        filters.append(f"format={pix_fmt}")
+    cmd = [FFMPEG_PATH, '-i', input_path]
+    
+    if audio_profile is not None:
+        audio_codec, sample_rate, channels, channel_layout = audio_profile
+        audio_encoder = CONCAT_AUDIO_ENCODERS.get(audio_codec)
+        if audio_encoder is None:
+            return False
+        if info.get('audio') is None:
+            # 没有音轨的输入补一段静音，保证每个输入的流数量一致
+            layout = channel_layout or ('mono' if channels == 1 else 'stereo')
+            cmd += ['-f', 'lavfi', '-i', f"anullsrc=r={sample_rate or 44100}:cl={layout}", '-shortest']
+            cmd += ['-map', '0:v:0', '-map', '1:a:0']
+        else:
+            cmd += ['-map', '0:v:0', '-map', '0:a:0']
+        cmd += ['-c:a', audio_encoder]
+        if sample_rate:
+            cmd += ['-ar', str(sample_rate)]
+        if channels:
+            cmd += ['-ac', str(channels)]
+    else:
+        cmd += ['-map', '0:v:0']
+    
+    cmd += ['-vf', ','.join(filters), '-c:v', video_encoder, '-crf', '18',
+            '-threads', str(get_encode_threads(get_cut_worker_count(reencode=True)))]
+    cmd += get_matching_encoder_args(probe_media(reference)['video'])
+    if time_base and output_path.lower().endswith(('.mp4', '.mov', '.m4v')):
+        cmd += ['-video_track_timescale', time_base.split('/')[-1]]
+    cmd += ['-y', output_path]
+    
+    logger.info(f"执行FFmpeg命令: {' '.join(cmd)}")
+    result = run_ffmpeg(cmd, operation='concat_normalize', timeout=1800)  # 30分钟超时
+    if result.returncode != 0 or not os.path.exists(output_path):
+        logger.warning(f"FFmpeg错误: {result.stderr}")
+        return False
+    return True
+
+def concatenate_videos(video_paths, output_path, check_compatibility=True):
+    """拼接多个视频文件（流复制拼接，只转码参数不一致的输入）
+
+    check_compatibility 时先比较各输入的流参数，只把不一致的输入并行转码为多数输入的参数，
+    再整体流复制拼接；转码片段带码流内参数集，h264/hevc 输出使用 avc3/hev1 样本描述。
+    来自同一源文件的片段可以跳过检查。
+    """
+    normalize_dir = None
     try:
         # 检查所有文件是否存在
         for fp in video_paths:
@@ -137,23 +1401,47 @@ def concatenate_videos(video_paths, output_path):
         if video_paths and all(fp.endswith('.mp3') for fp in video_paths):
             return concatenate_audios(video_paths, output_path)
         
-        # 1. 生成 concat 清单
+        # 1. 检查参数是否一致，转码不一致的输入
+        concat_paths = list(video_paths)
+        mismatched = []
+        inband_args = []
+        if check_compatibility and len(video_paths) > 1:
+            target, mismatched = analyze_concat_inputs(video_paths)
+            if mismatched:
+                logger.info(f"参数不一致的输入 {len(mismatched)}/{len(video_paths)} 个，转码为: {target}")
+                reference = video_paths[next(i for i in range(len(video_paths)) if i not in mismatched)]
+                normalize_dir = tempfile.mkdtemp(prefix='concat_normalize_')
+                ext = os.path.splitext(reference)[1]
+                for i in mismatched:
+                    concat_paths[i] = os.path.join(normalize_dir, f"{i}{ext}")
+                with ThreadPoolExecutor(max_workers=min(get_cut_worker_count(reencode=True), len(mismatched))) as executor:
+                    normalized = list(executor.map(
+                        lambda i: normalize_concat_input(video_paths[i], concat_paths[i], target, reference), mismatched))
+                if not all(normalized):
+                    # 目标参数无法转码（如编码器不支持）时使用回退方案
+                    return fallback_concatenate_videos(video_paths, output_path)
+                # 各段参数集不同：每个关键帧前写入本段的参数集，并声明为码流内参数集
+                codec = target[0][0]
+                if codec in INBAND_PARAMETER_SET_TAGS and output_path.lower().endswith(('.mp4', '.mov', '.m4v')):
+                    inband_args = ['-bsf:v', HYBRID_CUT_ENCODERS[codec][1], '-tag:v', INBAND_PARAMETER_SET_TAGS[codec]]
+        
+        # 2. 生成 concat 清单
         list_path = os.path.join(tempfile.gettempdir(), f"concat_list_{uuid.uuid4().hex}.txt")
         with open(list_path, "w", encoding="utf-8") as f:
-            for fp in video_paths:
-                # 处理包含特殊字符的路径
-                # 使用绝对路径并规范化路径
-                abs_path = os.path.abspath(fp)
-                # 对于包含特殊字符的路径，使用file指令的另一种格式
+            for fp in concat_paths:
+                # 使用绝对路径，转义路径中的单引号
+                abs_path = os.path.abspath(fp).replace("'", "'\\''")
                 f.write(f"file '{abs_path}'\n")
 
-        # 2. 零重编码拼接
+        # 3. 零重编码拼接
         cmd = [
             FFMPEG_PATH,
             '-f', 'concat',
             '-safe', '0',
             '-i', list_path,
             '-c', 'copy',
+            *inband_args,
+            *get_faststart_args(output_path),
             '-y',
             output_path
         ]
@@ -161,9 +1449,9 @@ def concatenate_videos(video_paths, output_path):
         # 打印命令用于调试
         print(f"执行FFmpeg命令: {' '.join(cmd)}")
         
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=600)  # 10分钟超时
+        result = run_ffmpeg(cmd, operation='concat', timeout=600)  # 10分钟超时
         
-        # 3. 清理
+        # 4. 清理
         if os.path.exists(list_path):
             os.remove(list_path)
             
@@ -172,13 +1460,86 @@ def concatenate_videos(video_paths, output_path):
             print(error_msg)
             # 如果失败，尝试使用回退方案
             return fallback_concatenate_videos(video_paths, output_path)
-            
+        
+        if mismatched:
+            return f"✅ 视频拼接完成：{output_path}（转码了 {len(mismatched)} 个参数不一致的文件）"
         return f"✅ 视频拼接完成：{output_path}"
 
     except subprocess.TimeoutExpired:
         return "❌ 视频拼接超时，请检查视频文件大小"
     except Exception as e:
         return f"❌ 视频拼接失败: {str(e)}"
+    finally:
+        if normalize_dir:
+            shutil.rmtree(normalize_dir, ignore_errors=True)
+
+
+def fused_cut_concat(in_file, segments, output_path, output_args=None, audio_only=False):
+    """从源文件直接输出多个区间拼接后的结果，不生成中间片段文件
+
+    segments: [(start, end), ...]，通过 concat 清单的 inpoint/outpoint 指定区间。
+    流复制时 inpoint 应为关键帧，否则会带上之前关键帧开始的画面。
+    audio_only 时改用 atrim + concat 滤镜，在同一个滤镜图中按采样精确截取。
+    """
+    try:
+        if not os.path.exists(in_file):
+            return f"❌ 视频文件不存在: {in_file}"
+        
+        if audio_only:
+            filters = [f"[0:a]atrim={start:.6f}:{end:.6f},asetpts=PTS-STARTPTS[a{i}]"
+                       for i, (start, end) in enumerate(segments)]
+            inputs = ''.join(f"[a{i}]" for i in range(len(segments)))
+            filters.append(f"{inputs}concat=n={len(segments)}:v=0:a=1[out]")
+            cmd = [
+                FFMPEG_PATH,
+                '-i', in_file,
+                '-filter_complex', ';'.join(filters),
+                '-map', '[out]'
+            ] + (output_args or []) + ['-y', output_path]
+            logger.info(f"执行FFmpeg命令: {' '.join(cmd)}")
+            result = run_ffmpeg(cmd, operation='concat_fused', timeout=600)  # 10分钟超时
+            if result.returncode != 0 or not os.path.exists(output_path):
+                logger.warning(f"FFmpeg错误: {result.stderr}")
+                return f"❌ 直接合并失败: {result.stderr[-500:]}"
+            return f"✅ 音频拼接完成：{output_path}"
+        
+        # 1. 生成 concat 清单，每个区间引用一次源文件
+        list_path = os.path.join(tempfile.gettempdir(), f"concat_list_{uuid.uuid4().hex}.txt")
+        abs_path = os.path.abspath(in_file).replace("'", "'\\''")
+        with open(list_path, "w", encoding="utf-8") as f:
+            for start, end in segments:
+                f.write(f"file '{abs_path}'\n")
+                f.write(f"inpoint {start:.6f}\n")
+                f.write(f"outpoint {end:.6f}\n")
+        
+        # 2. 单次读取源文件输出合并结果
+        cmd = [
+            FFMPEG_PATH,
+            '-f', 'concat',
+            '-safe', '0',
+            '-i', list_path
+        ] + (output_args or ['-c', 'copy']) + get_faststart_args(output_path) + ['-y', output_path]
+        
+        logger.info(f"执行FFmpeg命令: {' '.join(cmd)}")
+        
+        result = run_ffmpeg(cmd, operation='concat_fused', timeout=600)  # 10分钟超时
+        
+        # 3. 清理
+        if os.path.exists(list_path):
+            os.remove(list_path)
+        
+        if result.returncode != 0 or not os.path.exists(output_path):
+            logger.warning(f"FFmpeg错误: {result.stderr}")
+            return f"❌ 直接合并失败: {result.stderr[-500:]}"
+        
+        if output_path.endswith('.mp3'):
+            return f"✅ 音频拼接完成：{output_path}"
+        return f"✅ 视频拼接完成：{output_path}"
+    
+    except subprocess.TimeoutExpired:
+        return "❌ 合并超时，请检查视频文件大小"
+    except Exception as e:
+        return f"❌ 直接合并失败: {str(e)}"
 
 
 def set_video_cover(video_path, cover_path, output_path):
@@ -205,11 +1566,12 @@ def set_video_cover(video_path, cover_path, output_path):
             '-map', '1',
             '-c', 'copy',
             '-disposition:v:1', 'attached_pic',
+            *get_faststart_args(output_path),
             '-y',
             output_path
         ]
         
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)  # 5分钟超时
+        result = run_ffmpeg(cmd, operation='cover', timeout=300)  # 5分钟超时
         
         if result.returncode != 0:
             raise Exception(f"FFmpeg错误: {result.stderr}")
@@ -222,6 +1584,154 @@ def set_video_cover(video_path, cover_path, output_path):
         return f"❌ 视频封面设置失败: {str(e)}"
 
 
+# 操作流水线：把 cut / crop / scale / compress / cover 组成的操作列表编译为一次FFmpeg调用
+PIPELINE_OPERATIONS = ('cut', 'crop', 'scale', 'compress', 'cover')
+# 可以直接复制到MP4中的音频编码
+MP4_AUDIO_CODECS = ('aac', 'mp3', 'alac', 'opus', 'ac3', 'eac3')
+
+def compile_pipeline(video_path, operations, output_path):
+    """把操作列表编译为一条FFmpeg命令，返回 (cmd, plan)，操作无效时抛出 ValueError
+
+    cut 可出现多次，后一次的时间相对于前一次剪辑的结果；crop / scale 按顺序组成滤镜链；
+    compress 指定编码参数（preset、speed_mode）；cover 设置封面。
+    整个流水线只解码和编码一次；没有滤镜和 compress 时视频流复制，起点对齐到之前的关键帧。
+    """
+    start, end = 0.0, None
+    filters, encode, cover_path = [], None, None
+    for i, operation in enumerate(operations):
+        kind = operation.get('type')
+        if kind == 'cut':
+            cut_start = float(operation.get('start', 0))
+            cut_end = float(operation.get('end', 0))
+            if cut_start < 0 or cut_end <= cut_start:
+                raise ValueError(f"第{i + 1}个操作：结束时间必须大于开始时间")
+            new_start = start + cut_start
+            new_end = start + cut_end if end is None else min(start + cut_end, end)
+            if new_end <= new_start:
+                raise ValueError(f"第{i + 1}个操作：剪辑区间超出前面剪辑的范围")
+            start, end = new_start, new_end
+        elif kind == 'crop':
+            # 宽高取偶数（FFmpeg 要求）
+            width = int(operation.get('width', 0)) // 2 * 2
+            height = int(operation.get('height', 0)) // 2 * 2
+            if width <= 0 or height <= 0:
+                raise ValueError(f"第{i + 1}个操作：裁剪区域宽高必须大于0")
+            filters.append(f"crop={width}:{height}:{int(operation.get('x', 0))}:{int(operation.get('y', 0))}")
+        elif kind == 'scale':
+            # 宽或高为 -2 时按比例计算并取偶数
+            width = int(operation.get('width', -2))
+            height = int(operation.get('height', -2))
+            if width == 0 or height == 0 or (width < 0 and height < 0):
+                raise ValueError(f"第{i + 1}个操作：缩放尺寸无效")
+            filters.append(f"scale={width}:{height}")
+        elif kind == 'compress':
+            settings = COMPRESS_PRESET_SETTINGS.get(operation.get('preset', 'medium'), COMPRESS_PRESET_SETTINGS['medium'])
+            encode = {
+                'crf': settings['crf'],
+                'preset': COMPRESS_SPEED_PRESETS.get(operation.get('speed_mode', 'medium'), 'medium'),
+                'audio_bitrate': settings['audio_bitrate']
+            }
+        elif kind == 'cover':
+            cover_path = operation.get('cover_path')
+            if not cover_path or not os.path.exists(cover_path):
+                raise ValueError(f"第{i + 1}个操作：封面图片文件不存在")
+            if not is_path_in_folders(cover_path, (app.config['UPLOAD_FOLDER'], app.config['OUTPUT_FOLDER'])):
+                raise ValueError(f"第{i + 1}个操作：封面图片必须位于上传或输出目录")
+        else:
+            raise ValueError(f"第{i + 1}个操作类型不支持: {kind}")
+
+    info = probe_media(video_path)
+    if info.get('video') is None:
+        raise ValueError('输入文件没有视频流')
+    copy_video = not filters and encode is None
+    cmd = [FFMPEG_PATH]
+    output_args = []  # 输出端的定位参数，放在所有输入之后
+    actual_start = start
+    if start > 0 or end is not None:
+        if copy_video:
+            index = get_keyframe_index(video_path)
+            has_keyframes = bool(index and index['keyframes'])
+            # 流复制：起点对齐到之前的关键帧，不丢失画面；
+            # 输出端 -ss 0 丢弃定位点之前的数据包，避免带上更早的GOP
+            actual_start = keyframe_before(index, start) if has_keyframes else start
+            seek = keyframe_copy_start(index, actual_start) if has_keyframes else actual_start
+            output_args += ['-ss', '0']
+            output_start = seek
+        else:
+            # 重新编码：输入端定位时FFmpeg从之前的关键帧解码并丢弃起点前的帧，起点逐帧精确
+            # （不用输出端 -ss，否则时间戳为0的封面图片也会被丢弃）
+            seek = start
+            output_start = start
+        cmd += ['-ss', f"{seek:.6f}"]
+        if end is not None:
+            output_args += ['-t', f"{end - output_start:.6f}"]
+    cmd += ['-i', video_path]
+    if cover_path:
+        cmd += ['-i', cover_path]
+    cmd += output_args
+
+    cmd += ['-map', '0:v:0', '-map', '0:a:0?']
+    if cover_path:
+        cmd += ['-map', '1:v:0']
+    if filters:
+        cmd += ['-filter:v:0', ','.join(filters)]
+    if copy_video:
+        cmd += ['-c:v:0', 'copy']
+    else:
+        cmd += ['-c:v:0', 'libx264']
+        if encode:
+            cmd += ['-crf', str(encode['crf']), '-preset', encode['preset']]
+
+    audio = info.get('audio')
+    if encode:
+        cmd += ['-c:a', 'aac', '-b:a', encode['audio_bitrate']]
+        audio_mode = 'aac'
+    elif audio and audio['codec'] not in MP4_AUDIO_CODECS:
+        cmd += ['-c:a', 'aac']
+        audio_mode = 'aac'
+    else:
+        cmd += ['-c:a', 'copy']
+        audio_mode = 'copy'
+    if cover_path:
+        cmd += ['-c:v:1', 'copy', '-disposition:v:1', 'attached_pic']
+    cmd += ['-movflags', '+faststart', '-y', output_path]
+
+    plan = {
+        'video': 'copy' if copy_video else 'libx264',
+        'audio': audio_mode if audio else None,
+        'filters': filters,
+        'range': [round(actual_start, 3), round(end if end is not None else info['duration'], 3)],
+        'cover': bool(cover_path)
+    }
+    return cmd, plan
+
+def run_pipeline(video_path, operations, output_path, plan_info=None):
+    """执行操作流水线，plan_info 传入字典时写入编译结果"""
+    try:
+        if not os.path.exists(video_path):
+            return f"❌ 错误：找不到视频文件 {video_path}"
+        if not operations:
+            return "❌ 操作列表不能为空"
+        
+        cmd, plan = compile_pipeline(video_path, operations, output_path)
+        if plan_info is not None:
+            plan_info.update(plan)
+        logger.info(f"执行FFmpeg命令: {' '.join(cmd)}")
+        result = run_ffmpeg(cmd, operation='pipeline', timeout=1800)  # 30分钟超时
+        if result.returncode != 0 or not os.path.exists(output_path):
+            raise Exception(f"FFmpeg错误: {result.stderr[-500:]}")
+        
+        output_size = os.path.getsize(output_path) / (1024 * 1024)  # MB
+        video_mode = '视频流复制' if plan['video'] == 'copy' else '视频编码一次'
+        return f"✅ 流水线处理完成（{video_mode}）：{output_path}，大小: {output_size:.1f}MB"
+    
+    except ValueError as e:
+        return f"❌ {str(e)}"
+    except subprocess.TimeoutExpired:
+        return "❌ 流水线处理超时，请检查视频文件大小"
+    except Exception as e:
+        return f"❌ 流水线处理失败: {str(e)}"
+
 def concatenate_audios(audio_paths, output_path):
     """拼接多个音频文件"""
     try:
@@ -254,43 +1764,311 @@ def concatenate_audios(audio_paths, output_path):
         # 打印命令用于调试
         print(f"执行FFmpeg命令: {' '.join(cmd)}")
         
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=600)  # 10分钟超时
+        result = run_ffmpeg(cmd, operation='concat_audio', timeout=600)  # 10分钟超时
         
         # 3. 清理
         if os.path.exists(list_path):
             os.remove(list_path)
         
         if result.returncode != 0:
-            error_msg = f"FFmpeg错误: {result.stderr}"
-            print(error_msg)
-            raise Exception(error_msg)
-        
-        return f"✅ 音频拼接完成：{output_path}"
-    except subprocess.TimeoutExpired:
-        return "❌ 音频拼接超时，请检查音频文件大小"
-    except Exception as e:
-        return f"❌ 音频拼接失败: {str(e)}"
+            error_msg = f"FFmpeg错误: {result.stderr}"
+            print(error_msg)
+            raise Exception(error_msg)
+        
+        return f"✅ 音频拼接完成：{output_path}"
+    except subprocess.TimeoutExpired:
+        return "❌ 音频拼接超时，请检查音频文件大小"
+    except Exception as e:
+        return f"❌ 音频拼接失败: {str(e)}"
+
+def fallback_concatenate_videos(video_paths, output_path):
+    """回退方案：使用MoviePy进行视频拼接"""
+    try:
+        from moviepy.editor import VideoFileClip, concatenate_videoclips
+        
+        clips = [VideoFileClip(path) for path in video_paths]
+        final_clip = concatenate_videoclips(clips)
+        final_clip.write_videofile(output_path, codec='libx264', audio_codec='aac')
+        
+        # 清理资源
+        for clip in clips:
+            clip.close()
+        final_clip.close()
+        
+        # MoviePy 输出的 moov 在文件末尾，后台移到开头
+        start_faststart_remux(output_path)
+        
+        return f"✅ 视频拼接完成：{output_path}"
+    except Exception as e:
+        return f"❌ 视频拼接失败: {str(e)}"
+
+# 分段并行压缩：按关键帧切分源文件，各段并行编码后流复制拼接
+COMPRESS_CHUNK_SECONDS = int(os.environ.get('COMPRESS_CHUNK_SECONDS', 120))
+
+def get_compress_chunks(index, duration, chunk_seconds=COMPRESS_CHUNK_SECONDS):
+    """按关键帧把源文件切分为约 chunk_seconds 秒的分段，返回 [(start, end), ...]"""
+    bounds = [0.0]
+    t = chunk_seconds
+    while t < duration:
+        keyframe = keyframe_after(index, t)
+        if keyframe >= duration - 1:
+            break  # 不单独留下不足1秒的末段
+        bounds.append(keyframe)
+        t = keyframe + chunk_seconds
+    bounds.append(duration)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def compress_video_chunked(input_path, output_path, crf, ffmpeg_preset, audio_bitrate, progress_callback=None):
+    """分段并行压缩，源文件不足两段时返回 False（由调用方整体压缩）
+
+    各段使用相同的CRF和preset编码，画质一致；音轨整体编码一次，避免分段处的音频间隙。
+    """
+    info = probe_media(input_path)
+    index = get_keyframe_index(input_path)
+    if index is None or not info['duration'] or info.get('video') is None:
+        return False
+    chunks = get_compress_chunks(index, info['duration'])
+    if len(chunks) < 2:
+        return False
+
+    max_workers = min(get_cut_worker_count(reencode=True), len(chunks))
+    threads = get_encode_threads(max_workers)
+    chunk_dir = tempfile.mkdtemp(prefix='compress_chunks_')
+    if progress_callback:
+        progress_callback('plan', rows=[{
+            'title': f"{seconds_to_time(start)} - {seconds_to_time(end)}",
+            'status': 'pending',
+            'message': ''
+        } for start, end in chunks], merge=True)
+
+    def encode_chunk(i):
+        start, end = chunks[i]
+        cmd = [FFMPEG_PATH, '-ss', f"{start:.6f}", '-i', input_path]
+        if i < len(chunks) - 1:
+            cmd += ['-t', f"{end - start:.6f}"]
+        cmd += [
+            '-map', '0:v:0',
+            '-an',
+            '-vcodec', 'libx264',
+            '-crf', str(crf),
+            '-preset', ffmpeg_preset,
+            '-threads', str(threads),
+            '-y',
+            os.path.join(chunk_dir, f"{i}.mp4")
+        ]
+        result = run_ffmpeg(cmd, operation='compress_chunk', timeout=1800)  # 每段30分钟超时
+        if result.returncode != 0:
+            raise Exception(f"FFmpeg压缩错误（第{i + 1}段）: {result.stderr[-500:]}")
+        if progress_callback:
+            progress_callback('row', index=i, status='done', message='✅ 已压缩')
+
+    def encode_audio():
+        cmd = [
+            FFMPEG_PATH,
+            '-i', input_path,
+            '-map', '0:a:0',
+            '-vn',
+            '-acodec', 'aac',
+            '-b:a', audio_bitrate,
+            '-y',
+            os.path.join(chunk_dir, 'audio.m4a')
+        ]
+        result = run_ffmpeg(cmd, operation='compress_audio', timeout=1800)
+        if result.returncode != 0:
+            raise Exception(f"FFmpeg音频压缩错误: {result.stderr[-500:]}")
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(encode_chunk, i) for i in range(len(chunks))]
+            if info.get('audio') is not None:
+                futures.append(executor.submit(encode_audio))
+            for future in as_completed(futures):
+                future.result()
+
+        if progress_callback:
+            progress_callback('stage', message='正在拼接分段')
+        list_path = os.path.join(chunk_dir, 'concat_list.txt')
+        with open(list_path, 'w', encoding='utf-8') as f:
+            for i in range(len(chunks)):
+                f.write(f"file '{os.path.join(chunk_dir, f'{i}.mp4')}'\n")
+        cmd = [FFMPEG_PATH, '-f', 'concat', '-safe', '0', '-i', list_path]
+        if info.get('audio') is not None:
+            cmd += ['-i', os.path.join(chunk_dir, 'audio.m4a'), '-map', '0:v:0', '-map', '1:a:0']
+        cmd += ['-c', 'copy', *get_faststart_args(output_path), '-y', output_path]
+        result = run_ffmpeg(cmd, operation='concat', timeout=600)
+        if result.returncode != 0:
+            raise Exception(f"FFmpeg拼接错误: {result.stderr[-500:]}")
+        return True
+    finally:
+        shutil.rmtree(chunk_dir, ignore_errors=True)
+
+# 压缩预设的CRF值和音频码率
+COMPRESS_PRESET_SETTINGS = {
+    'low': {'crf': 35, 'audio_bitrate': '64k'},
+    'medium': {'crf': 28, 'audio_bitrate': '96k'},
+    'high': {'crf': 23, 'audio_bitrate': '128k'}
+}
+
+# 压缩速度模式对应的x264 preset
+COMPRESS_SPEED_PRESETS = {
+    'fast': 'ultrafast',
+    'medium': 'medium',
+    'slow': 'veryslow'
+}
+
+# 目标大小压缩：按目标大小和时长计算码率，两遍编码
+TARGET_SIZE_OVERHEAD = 0.02  # 预留给容器封装的比例
+MIN_VIDEO_BITRATE_KBPS = 50
+MIN_AUDIO_BITRATE_KBPS = 32
+
+def get_target_size_plan(duration, target_size_mb, audio_bitrate='96k', has_audio=True):
+    """根据目标大小计算视频和音频码率（kbps），目标较小时降低音频码率，目标过小时抛出 ValueError"""
+    if not duration or duration <= 0:
+        raise ValueError('无法获取视频时长')
+    if target_size_mb <= 0:
+        raise ValueError('目标大小必须大于0')
+    total_kbps = target_size_mb * 1024 * 1024 * 8 * (1 - TARGET_SIZE_OVERHEAD) / duration / 1000
+    audio_kbps = int(audio_bitrate.rstrip('k')) if has_audio else 0
+    if has_audio and total_kbps - audio_kbps < audio_kbps * 4:
+        # 视频码率不足音频的4倍时，把音频码率降到总码率的15%
+        audio_kbps = max(MIN_AUDIO_BITRATE_KBPS, min(audio_kbps, int(total_kbps * 0.15)))
+    video_kbps = int(total_kbps - audio_kbps)
+    if video_kbps < MIN_VIDEO_BITRATE_KBPS:
+        min_kbps = MIN_VIDEO_BITRATE_KBPS + (MIN_AUDIO_BITRATE_KBPS if has_audio else 0)
+        min_size_mb = min_kbps * 1000 * duration / 8 / (1024 * 1024) / (1 - TARGET_SIZE_OVERHEAD)
+        raise ValueError(f"目标大小过小，至少需要 {min_size_mb:.1f}MB")
+    return {
+        'target_size': target_size_mb,
+        'duration': duration,
+        'video_bitrate_kbps': video_kbps,
+        'audio_bitrate_kbps': audio_kbps
+    }
+
+def compress_video_two_pass(input_path, output_path, plan, ffmpeg_preset):
+    """按目标码率两遍编码：第一遍只分析画面，第二遍按统计结果分配码率
+
+    结果超过目标大小时按超出部分降低视频码率，复用第一遍的统计重新执行第二遍。
+    """
+    log_dir = tempfile.mkdtemp(prefix='compress_2pass_')
+    passlogfile = os.path.join(log_dir, 'ffmpeg2pass')
+
+    def run_pass(pass_number, video_kbps):
+        cmd = [FFMPEG_PATH, '-i', input_path]
+        if pass_number == 1:
+            cmd += ['-map', '0:v:0']
+        cmd += [
+            '-vcodec', 'libx264',
+            '-b:v', f"{video_kbps}k",
+            '-preset', ffmpeg_preset,
+            '-pass', str(pass_number),
+            '-passlogfile', passlogfile
+        ]
+        if pass_number == 1:
+            cmd += ['-an', '-f', 'null', '-y', os.devnull]
+        else:
+            if plan['audio_bitrate_kbps']:
+                cmd += ['-acodec', 'aac', '-b:a', f"{plan['audio_bitrate_kbps']}k"]
+            cmd += [*get_faststart_args(output_path), '-y', output_path]
+        result = run_ffmpeg(cmd, operation='compress_2pass', timeout=1800)  # 每遍30分钟超时
+        if result.returncode != 0:
+            raise Exception(f"FFmpeg第{pass_number}遍编码错误: {result.stderr[-500:]}")
 
-def fallback_concatenate_videos(video_paths, output_path):
-    """回退方案：使用MoviePy进行视频拼接"""
     try:
-        from moviepy.editor import VideoFileClip, concatenate_videoclips
-        
-        clips = [VideoFileClip(path) for path in video_paths]
-        final_clip = concatenate_videoclips(clips)
-        final_clip.write_videofile(output_path, codec='libx264', audio_codec='aac')
-        
-        # 清理资源
-        for clip in clips:
-            clip.close()
-        final_clip.close()
+        video_kbps = plan['video_bitrate_kbps']
+        run_pass(1, video_kbps)
+        run_pass(2, video_kbps)
         
-        return f"✅ 视频拼接完成：{output_path}"
-    except Exception as e:
-        return f"❌ 视频拼接失败: {str(e)}"
+        excess_mb = os.path.getsize(output_path) / (1024 * 1024) - plan['target_size']
+        if excess_mb > 0:
+            excess_kbps = excess_mb * 1024 * 1024 * 8 / plan['duration'] / 1000
+            video_kbps = max(MIN_VIDEO_BITRATE_KBPS, int(video_kbps - excess_kbps * 1.1))
+            run_pass(2, video_kbps)
+        return video_kbps
+    finally:
+        shutil.rmtree(log_dir, ignore_errors=True)
+
+# 各预设下x264输出的大致码率（每像素每帧的比特数），没有样本编码结果时用于判断重新编码能否减小体积
+COMPRESS_PRESET_BITS_PER_PIXEL = {'low': 0.03, 'medium': 0.06, 'high': 0.1}
 
-def compress_video(input_path, output_path, preset='medium', speed_mode='medium'):
-    """压缩视频到指定预设"""
+# 可以直接流复制封装进MP4的视频和音频编码
+MP4_COPY_VIDEO_CODECS = ('h264', 'hevc')
+MP4_COPY_AUDIO_CODECS = ('aac', 'mp3')
+
+def choose_compress_path(input_path, preset='medium', speed_mode='medium', target_plan=None):
+    """根据源文件的编码和码率选择压缩方式，返回 (path, reason)
+
+    path: reencode（重新编码）、remux（流复制重新封装）或 audio_only（视频流复制，只重新编码音频）。
+    源视频已是H.264/HEVC且码率不高于所选预设（或目标大小）能达到的码率时，重新编码视频不会更小；
+    只有视频和音频编码都能放进MP4时才直接封装，音频不能时只重新编码音频。
+    """
+    info = probe_media(input_path)
+    video, audio = info.get('video'), info.get('audio')
+    if not video or video['codec'] not in MP4_COPY_VIDEO_CODECS:
+        return 'reencode', '源视频不是H.264/HEVC编码'
+    if target_plan and os.path.getsize(input_path) <= target_plan['target_size'] * 1024 * 1024:
+        if audio and audio['codec'] not in MP4_COPY_AUDIO_CODECS:
+            return 'audio_only', '原始文件已小于目标大小'
+        return 'remux', '原始文件已小于目标大小'
+
+    video_kbps = video['bit_rate'] / 1000
+    if not video_kbps and info['bit_rate']:
+        video_kbps = (info['bit_rate'] - (audio['bit_rate'] if audio else 0)) / 1000
+    if video_kbps <= 0:
+        return 'reencode', '无法获取源视频码率'
+
+    settings = COMPRESS_PRESET_SETTINGS.get(preset, COMPRESS_PRESET_SETTINGS['medium'])
+    audio_kbps = int(settings['audio_bitrate'].rstrip('k'))
+    if target_plan:
+        expected_kbps = target_plan['video_bitrate_kbps']
+        audio_kbps = target_plan['audio_bitrate_kbps']
+    else:
+        # 有样本编码结果时按样本估算，否则按每像素比特数估算
+        cache = load_file_cache('compress_estimate', input_path)
+        sample = None
+        if cache and cache.get('version') == COMPRESS_ESTIMATE_VERSION:
+            sample = cache['samples'].get(f"{preset}/{speed_mode}")
+        if sample:
+            expected_kbps = sample['bytes_per_second'] * 8 / 1000 - (audio_kbps if audio else 0)
+        else:
+            bits_per_pixel = COMPRESS_PRESET_BITS_PER_PIXEL.get(preset, COMPRESS_PRESET_BITS_PER_PIXEL['medium'])
+            expected_kbps = video['width'] * video['height'] * (video['fps'] or 25) * bits_per_pixel / 1000
+    if video_kbps > expected_kbps:
+        return 'reencode', f"源视频码率 {video_kbps:.0f}kbps 高于重新编码后的约 {expected_kbps:.0f}kbps"
+
+    reason = f"源视频码率 {video_kbps:.0f}kbps 不高于重新编码后的约 {expected_kbps:.0f}kbps"
+    if audio and (audio['codec'] != 'aac' or audio['bit_rate'] > audio_kbps * 1000 * 1.1):
+        return 'audio_only', reason
+    return 'remux', reason
+
+def remux_for_compress(input_path, output_path, audio_bitrate=None):
+    """压缩时不重新编码视频：流复制重新封装，指定 audio_bitrate 时只重新编码音频"""
+    cmd = [
+        FFMPEG_PATH,
+        '-i', input_path,
+        '-map', '0:v:0',
+        '-map', '0:a:0?',
+        '-c', 'copy'
+    ]
+    if audio_bitrate:
+        cmd += ['-acodec', 'aac', '-b:a', audio_bitrate]
+    video = probe_media(input_path).get('video')
+    if video and video['codec'] == 'hevc':
+        # HEVC 使用 hvc1 标记，Safari/QuickTime 才能播放
+        cmd += ['-tag:v', 'hvc1']
+    cmd += ['-movflags', '+faststart', '-y', output_path]
+    result = run_ffmpeg(cmd, operation='compress_audio_only' if audio_bitrate else 'compress_remux', timeout=600)
+    if result.returncode != 0:
+        raise Exception(f"FFmpeg封装错误: {result.stderr[-500:]}")
+
+def compress_video(input_path, output_path, preset='medium', speed_mode='medium', chunked=False, progress_callback=None, target_size_mb=None, result_info=None):
+    """压缩视频到指定预设
+
+    chunked: 按关键帧分段并行编码，再流复制拼接（适合长视频和慢速模式）
+    target_size_mb: 按目标大小计算码率两遍编码，此时忽略 preset 的CRF和 chunked
+    result_info: 传入字典时写入实际采用的压缩方式 path（reencode / chunked / two_pass / remux / audio_only）和原因 reason
+    """
+    if result_info is None:
+        result_info = {}
     try:
         if not os.path.exists(input_path):
             return f"❌ 错误：找不到视频文件 {input_path}"
@@ -303,23 +2081,46 @@ def compress_video(input_path, output_path, preset='medium', speed_mode='medium'
         original_size = os.path.getsize(input_path) / (1024 * 1024)  # MB
         
         # 根据预设设置CRF值和音频码率
-        preset_settings = {
-            'low': {'crf': 35, 'audio_bitrate': '64k'},
-            'medium': {'crf': 28, 'audio_bitrate': '96k'},
-            'high': {'crf': 23, 'audio_bitrate': '128k'}
-        }
-        
-        settings = preset_settings.get(preset, preset_settings['medium'])
+        settings = COMPRESS_PRESET_SETTINGS.get(preset, COMPRESS_PRESET_SETTINGS['medium'])
         crf = settings['crf']
         audio_bitrate = settings['audio_bitrate']
         
         # 根据速度模式设置preset参数
-        preset_map = {
-            'fast': 'ultrafast',
-            'medium': 'medium',
-            'slow': 'veryslow'
-        }
-        ffmpeg_preset = preset_map.get(speed_mode, 'medium')
+        ffmpeg_preset = COMPRESS_SPEED_PRESETS.get(speed_mode, 'medium')
+        
+        # 重新编码视频不会更小时，只重新封装或只重新编码音频
+        plan = None
+        if target_size_mb:
+            media_info = probe_media(input_path)
+            plan = get_target_size_plan(media_info['duration'], float(target_size_mb), audio_bitrate,
+                                        media_info.get('audio') is not None)
+        path, reason = choose_compress_path(input_path, preset, speed_mode, plan)
+        result_info.update(path=path, reason=reason)
+        if path in ('remux', 'audio_only'):
+            if path == 'audio_only':
+                remux_for_compress(input_path, output_path, f"{plan['audio_bitrate_kbps']}k" if plan else audio_bitrate)
+            else:
+                remux_for_compress(input_path, output_path)
+            compressed_size = os.path.getsize(output_path) / (1024 * 1024)  # MB
+            compression_ratio = (1 - compressed_size / original_size) * 100
+            label = '只重新编码音频' if path == 'audio_only' else '直接封装，未重新编码'
+            if plan:
+                deviation = (compressed_size - plan['target_size']) / plan['target_size'] * 100
+                return f"✅ 视频压缩完成（{label}：{reason}）！原始大小: {original_size:.1f}MB -> 压缩后大小: {compressed_size:.1f}MB (目标大小: {plan['target_size']:.1f}MB，偏差: {deviation:+.1f}%)"
+            return f"✅ 视频压缩完成（{label}：{reason}）！原始大小: {original_size:.1f}MB -> 压缩后大小: {compressed_size:.1f}MB (压缩比例: {compression_ratio:.1f}%)"
+        
+        if plan:
+            result_info['path'] = 'two_pass'
+            compress_video_two_pass(input_path, output_path, plan, ffmpeg_preset)
+            compressed_size = os.path.getsize(output_path) / (1024 * 1024)  # MB
+            deviation = (compressed_size - plan['target_size']) / plan['target_size'] * 100
+            return f"✅ 视频压缩完成！原始大小: {original_size:.1f}MB -> 压缩后大小: {compressed_size:.1f}MB (目标大小: {plan['target_size']:.1f}MB，偏差: {deviation:+.1f}%)"
+        
+        if chunked and compress_video_chunked(input_path, output_path, crf, ffmpeg_preset, audio_bitrate, progress_callback):
+            result_info['path'] = 'chunked'
+            compressed_size = os.path.getsize(output_path) / (1024 * 1024)  # MB
+            compression_ratio = (1 - compressed_size / original_size) * 100
+            return f"✅ 视频压缩完成（分段并行）！原始大小: {original_size:.1f}MB -> 压缩后大小: {compressed_size:.1f}MB (压缩比例: {compression_ratio:.1f}%)"
         
         # 使用FFmpeg压缩视频
         cmd = [
@@ -330,11 +2131,12 @@ def compress_video(input_path, output_path, preset='medium', speed_mode='medium'
             '-preset', ffmpeg_preset,
             '-acodec', 'aac',
             '-b:a', audio_bitrate,
+            *get_faststart_args(output_path),
             '-y',
             output_path
         ]
         
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=600)  # 10分钟超时
+        result = run_ffmpeg(cmd, operation='compress', timeout=600)  # 10分钟超时
         
         if result.returncode != 0:
             raise Exception(f"FFmpeg压缩错误: {result.stderr}")
@@ -352,57 +2154,241 @@ def compress_video(input_path, output_path, preset='medium', speed_mode='medium'
     except Exception as e:
         return f"❌ 视频压缩失败: {str(e)}"
 
-def get_compression_estimate(original_size_mb, preset='medium'):
-    """根据预设估算压缩后的文件大小和预估时间"""
-    # 根据预设定义压缩比例
-    compression_ratios = {
-        'low': 0.1,    # 压缩到原始大小的10%
-        'medium': 0.25, # 压缩到原始大小的25%
-        'high': 0.5    # 压缩到原始大小的50%
-    }
-    
-    # 根据预设定义压缩速度（MB/分钟）
-    compression_speeds = {
-        'low': 150,    # 低质量压缩速度
-        'medium': 100, # 中等质量压缩速度
-        'high': 60     # 高质量压缩速度
+# 压缩预估：在分散的位置各编码一小段样本，按结果外推整体大小和耗时
+COMPRESS_SAMPLE_COUNT = 4
+COMPRESS_SAMPLE_SECONDS = 10  # 接近x264默认关键帧间隔，避免样本中关键帧占比偏高
+COMPRESS_ESTIMATE_VERSION = 1
+
+def sample_compression(input_path, preset='medium', speed_mode='medium'):
+    """按压缩参数编码样本段，返回每秒输出字节数和每秒编码耗时，按文件和参数缓存
+
+    文件较短时直接编码整个文件。编码耗时取FFmpeg报告的速度，不含进程启动和定位的时间。
+    """
+    cache = load_file_cache('compress_estimate', input_path)
+    if cache is None or cache.get('version') != COMPRESS_ESTIMATE_VERSION:
+        cache = {'version': COMPRESS_ESTIMATE_VERSION, 'samples': {}}
+    key = f"{preset}/{speed_mode}"
+    if key in cache['samples']:
+        return cache['samples'][key]
+
+    duration = probe_media(input_path)['duration']
+    if not duration:
+        raise Exception('无法获取视频时长')
+    settings = COMPRESS_PRESET_SETTINGS.get(preset, COMPRESS_PRESET_SETTINGS['medium'])
+    ffmpeg_preset = COMPRESS_SPEED_PRESETS.get(speed_mode, 'medium')
+    if duration <= COMPRESS_SAMPLE_COUNT * COMPRESS_SAMPLE_SECONDS:
+        offsets, sample_seconds = [0.0], duration
+    else:
+        sample_seconds = COMPRESS_SAMPLE_SECONDS
+        offsets = [(i + 0.5) * duration / COMPRESS_SAMPLE_COUNT - sample_seconds / 2
+                   for i in range(COMPRESS_SAMPLE_COUNT)]
+
+    sample_dir = tempfile.mkdtemp(prefix='compress_sample_')
+    total_bytes = total_encode_seconds = total_media_seconds = 0
+    try:
+        for i, offset in enumerate(offsets):
+            sample_path = os.path.join(sample_dir, f"{i}.mp4")
+            cmd = [
+                FFMPEG_PATH,
+                '-ss', f"{offset:.3f}",
+                '-i', input_path,
+                '-t', f"{sample_seconds:.3f}",
+                '-vcodec', 'libx264',
+                '-crf', str(settings['crf']),
+                '-preset', ffmpeg_preset,
+                '-acodec', 'aac',
+                '-b:a', settings['audio_bitrate'],
+                '-y',
+                sample_path
+            ]
+            started = time.time()
+            result = run_ffmpeg(cmd, operation='compress_sample', timeout=600)
+            elapsed = time.time() - started
+            if result.returncode != 0 or not os.path.exists(sample_path):
+                raise Exception(f"样本编码失败: {result.stderr[-500:]}")
+            media_seconds = min(sample_seconds, duration - offset)
+            speeds = [float(speed) for speed in re.findall(r'speed=\s*(\d+(?:\.\d+)?)x', result.stderr)]
+            total_encode_seconds += media_seconds / speeds[-1] if speeds and speeds[-1] > 0 else elapsed
+            total_bytes += os.path.getsize(sample_path)
+            total_media_seconds += media_seconds
+    finally:
+        shutil.rmtree(sample_dir, ignore_errors=True)
+
+    sample = {
+        'bytes_per_second': total_bytes / total_media_seconds,
+        'encode_seconds_per_second': total_encode_seconds / total_media_seconds,
+        'sample_count': len(offsets),
+        'sample_seconds': round(total_media_seconds, 3)
     }
+    cache['samples'][key] = sample
+    save_file_cache('compress_estimate', input_path, cache)
+    return sample
+
+def get_compression_estimate(video_path, preset='medium', speed_mode='medium', target_plan=None):
+    """根据样本编码结果估算压缩后的文件大小和预估时间
+
+    target_plan: 目标大小模式下 get_target_size_plan() 的结果，大小和码率按计划给出准确值，耗时按两遍编码估算
+    样本编码失败时按预设的固定比例估算。
+    """
+    original_size_mb = os.path.getsize(video_path) / (1024 * 1024)
+    try:
+        sample = sample_compression(video_path, preset, speed_mode)
+        duration = probe_media(video_path)['duration']
+        estimated_size = sample['bytes_per_second'] * duration / (1024 * 1024)
+        estimated_time_minutes = sample['encode_seconds_per_second'] * duration / 60
+        estimate = {'method': 'sample', 'sample_count': sample['sample_count'], 'sample_seconds': sample['sample_seconds']}
+    except Exception as e:
+        logger.warning(f"样本编码预估失败，按固定比例估算: {str(e)}")
+        # 根据预设定义压缩比例
+        compression_ratios = {
+            'low': 0.1,    # 压缩到原始大小的10%
+            'medium': 0.25, # 压缩到原始大小的25%
+            'high': 0.5    # 压缩到原始大小的50%
+        }
+        
+        # 根据预设定义压缩速度（MB/分钟）
+        compression_speeds = {
+            'low': 150,    # 低质量压缩速度
+            'medium': 100, # 中等质量压缩速度
+            'high': 60     # 高质量压缩速度
+        }
+        
+        estimated_size = original_size_mb * compression_ratios.get(preset, compression_ratios['medium'])
+        # 预估时间（分钟）= 原始文件大小 / 压缩速度
+        estimated_time_minutes = original_size_mb / compression_speeds.get(preset, compression_speeds['medium'])
+        estimate = {'method': 'ratio'}
     
-    ratio = compression_ratios.get(preset, compression_ratios['medium'])
-    speed = compression_speeds.get(preset, compression_speeds['medium'])
-    
-    estimated_size = original_size_mb * ratio
-    
-    # 预估时间（分钟）= 原始文件大小 / 压缩速度
-    estimated_time_minutes = original_size_mb / speed
+    if target_plan:
+        estimated_size = target_plan['target_size']
+        estimated_time_minutes *= 2
+        estimate.update(video_bitrate_kbps=target_plan['video_bitrate_kbps'],
+                        audio_bitrate_kbps=target_plan['audio_bitrate_kbps'])
     
-    return {
-        'original_size': original_size_mb,
-        'estimated_size': estimated_size,
-        'compression_ratio': (1 - ratio) * 100,
-        'estimated_time_minutes': estimated_time_minutes
-    }
+    estimate.update(
+        original_size=original_size_mb,
+        estimated_size=estimated_size,
+        compression_ratio=(1 - estimated_size / original_size_mb) * 100 if original_size_mb else 0,
+        estimated_time_minutes=estimated_time_minutes
+    )
+    return estimate
+
+# 片段标题的圈数字序号，超过50个后使用数字格式
+CIRCLE_NUMBERS = ['①', '②', '③', '④', '⑤', '⑥', '⑦', '⑧', '⑨', '⑩',
+                  '⑪', '⑫', '⑬', '⑭', '⑮', '⑯', '⑰', '⑱', '⑲', '⑳',
+                  '㉑', '㉒', '㉓', '㉔', '㉕', '㉖', '㉗', '㉘', '㉙', '㉚',
+                  '㉛', '㉜', '㉝', '㉞', '㉟', '㊱', '㊲', '㊳', '㊴', '㊵',
+                  '㊶', '㊷', '㊸', '㊹', '㊺', '㊻', '㊼', '㊽', '㊾', '㊿']
+
+# 编译后的剪辑计划：每个有效片段一条记录
+CUT_PLAN_DTYPE = np.dtype([('row', 'i4'), ('start', 'f8'), ('end', 'f8'), ('title', 'O')])
+
+CUT_PLAN_SKIP_MESSAGES = {
+    'empty_end': "跳过：结束时间为空的行",
+    'empty_start': "跳过：开始时间为空的行",
+    'invalid_range': "跳过：时间无效（开始时间必须小于结束时间）",
+    'duplicate': "跳过：与前面的片段重复"
+}
+
+def get_plan_column(df, names, default):
+    """按中英文列名取列，都不存在时返回默认值列"""
+    for name in names:
+        if name in df.columns:
+            return df[name]
+    return pd.Series([default] * len(df), index=df.index, dtype=object)
+
+def times_to_seconds(values):
+    """批量把 时:分:秒 格式的时间列转换为秒数，无法解析时为0（与 time_to_seconds 一致）"""
+    text = values.astype(str).str.strip()
+    valid = text.str.count(':') == 2
+    parts = text.where(valid, '0:0:0').str.split(':', expand=True)
+    if parts.shape[1] < 3:
+        return np.zeros(len(values))
+    numbers = np.column_stack([pd.to_numeric(parts[i].str.strip(), errors='coerce').to_numpy(dtype=float)
+                               for i in range(3)])
+    seconds = numbers[:, 0] * 3600 + numbers[:, 1] * 60 + numbers[:, 2]
+    return np.where(valid.to_numpy() & ~np.isnan(seconds), seconds, 0.0)
+
+def compile_cut_plan(df):
+    """把剪辑表编译为剪辑计划，整列解析和校验，不逐行遍历DataFrame
+
+    返回 (clips, bad_rows, folder_title)：
+    clips 为 CUT_PLAN_DTYPE 数组（行号、开始秒数、结束秒数、带序号的标题），
+    bad_rows 为被跳过的行 [{'row', 'reason', 'message'}, ...]，
+    folder_title 为第一个有效标题，用作输出文件夹名称。
+    """
+    start_values = get_plan_column(df, ["开始时间", "StartTime"], "00:00:00")
+    end_values = get_plan_column(df, ["结束时间", "EndTime"], "")
+    titles = get_plan_column(df, ["剪辑标题", "Title"], "untitled").astype(str).str.strip() \
+        .str.replace("/", "-", regex=False).str.replace("\\", "-", regex=False).to_numpy(dtype=object)
+
+    empty_end = (end_values.isna() | (end_values.astype(str).str.strip() == "")).to_numpy()
+    empty_start = (start_values.isna() | (start_values.astype(str).str.strip() == "")).to_numpy() & ~empty_end
+    has_times = ~empty_end & ~empty_start
+
+    starts = times_to_seconds(start_values)
+    ends = times_to_seconds(end_values)
+    # 时间无效的行同样占用序号，与逐行处理时的编号保持一致
+    invalid_range = has_times & (starts >= ends)
+    candidates = has_times & ~invalid_range
+    keys = pd.DataFrame({'start': starts, 'end': ends, 'title': titles})
+    duplicate = np.zeros(len(keys), dtype=bool)
+    duplicate[candidates] = keys[candidates].duplicated().to_numpy()
+    numbered = has_times & ~duplicate
+    clip_numbers = np.cumsum(numbered) - 1
+    valid = candidates & ~duplicate
+
+    rows = np.flatnonzero(valid)
+    clips = np.empty(len(rows), dtype=CUT_PLAN_DTYPE)
+    clips['row'] = rows
+    clips['start'] = starts[rows]
+    clips['end'] = ends[rows]
+    clips['title'] = [f"{CIRCLE_NUMBERS[n]}{t}" if n < len(CIRCLE_NUMBERS) else f"{n + 1}.{t}"
+                      for n, t in zip(clip_numbers[rows], titles[rows])]
+
+    reasons = np.select([empty_end, empty_start, invalid_range, duplicate],
+                        ['empty_end', 'empty_start', 'invalid_range', 'duplicate'], '')
+    bad_rows = [{'row': int(row), 'reason': str(reasons[row]), 'message': CUT_PLAN_SKIP_MESSAGES[reasons[row]]}
+                for row in np.flatnonzero(reasons != '')]
+
+    named = np.flatnonzero(has_times & (titles != "") & (titles != "untitled"))
+    folder_title = titles[named[0]] if len(named) else None
+    return clips, bad_rows, folder_title
+
+
+def get_cut_output_args(audio_only=False):
+    """剪辑片段的输出编码参数"""
+    if audio_only:
+        return [
+            '-vn',  # 禁用视频
+            '-acodec', 'libmp3lame',  # 使用MP3编码
+            '-ar', '44100',  # 音频采样率
+            '-ac', '2',  # 双声道
+            '-b:a', '192k'  # 音频比特率
+        ]
+    # 零重编码切片，保证音画同步
+    return ['-c', 'copy']
+
+def cut_videos_from_dataframe(input_video_path, df, concat_after_cut=False, audio_only=False, concat_file_name=None, cut_mode='copy', progress_callback=None, export_clips=True):
+    """根据DataFrame中的时间信息裁剪视频
+
+    cut_mode: copy（流复制，画面从下一个关键帧开始）、keyframe（起点对齐到之前的关键帧）
+              或 accurate（逐帧精确，只重编码首尾不完整的GOP）
+    progress_callback(event, **info): 进度回调，event 为 plan / row / stage，plan 事件附带跳过行的报告 bad_rows
+    export_clips: 合并时是否同时导出单个片段；为 False 时合并结果直接从源文件生成，不写中间片段
+    """
+    def report(event, **info):
+        if progress_callback:
+            try:
+                progress_callback(event, **info)
+            except Exception as e:
+                logger.warning(f"进度回调失败: {str(e)}")
 
-def cut_videos_from_dataframe(input_video_path, df, concat_after_cut=False, audio_only=False, concat_file_name=None):
-    """根据DataFrame中的时间信息裁剪视频"""
     try:
         if not os.path.exists(input_video_path):
             return f"❌ 错误：找不到视频文件 {input_video_path}"
         
-        # 获取第一个剪辑标题作为文件夹名称
-        first_title = None
-        for index, row in df.iterrows():
-            end_time = row.get("结束时间", row.get("EndTime", ""))
-            start_time = row.get("开始时间", row.get("StartTime", "00:00:00"))
-            # 跳过无效行
-            if pd.isna(end_time) or (not end_time) or (str(end_time).strip() == ""):
-                continue
-            if pd.isna(start_time) or (not start_time) or (str(start_time).strip() == ""):
-                continue
-            title = str(row.get("剪辑标题", row.get("Title", "untitled"))).strip().replace("/", "-").replace("\\", "-")
-            if title and title != "untitled":
-                first_title = title
-                break
+        # 整列解析、校验和去重，得到有效片段和跳过的行
+        plan, bad_rows, first_title = compile_cut_plan(df)
         
         # 如果没有找到有效标题，使用默认名称
         if not first_title:
@@ -417,126 +2403,161 @@ def cut_videos_from_dataframe(input_video_path, df, concat_after_cut=False, audi
         result_messages.append(f"📁 创建输出文件夹：{first_title}")
         cut_files = []  # 保存剪辑后的文件路径，用于后续合并
         
-        # 打印DataFrame内容，用于调试
-        print(f"DataFrame内容: {df}")
-        print(f"DataFrame行数: {len(df)}")
+        logger.info(f"剪辑表行数: {len(df)}，有效片段: {len(plan)}，跳过: {len(bad_rows)}")
         print(f"输出文件夹: {output_dir}")
         
-        # 定义圈数字序号
-        circle_numbers = ['①', '②', '③', '④', '⑤', '⑥', '⑦', '⑧', '⑨', '⑩',
-                         '⑪', '⑫', '⑬', '⑭', '⑮', '⑯', '⑰', '⑱', '⑲', '⑳',
-                         '㉑', '㉒', '㉓', '㉔', '㉕', '㉖', '㉗', '㉘', '㉙', '㉚',
-                         '㉛', '㉜', '㉝', '㉞', '㉟', '㊱', '㊲', '㊳', '㊴', '㊵',
-                         '㊶', '㊷', '㊸', '㊹', '㊺', '㊻', '㊼', '㊽', '㊾', '㊿']
-        
-        # 遍历每一行裁剪
-        clip_number = 0  # 有效剪辑的计数器
-        for index, row in df.iterrows():
-            print(f"处理第{index+1}行数据: {row}")
-            # 获取开始时间和结束时间
-            start_time = row.get("开始时间", row.get("StartTime", "00:00:00"))
-            end_time = row.get("结束时间", row.get("EndTime", ""))
-            print(f"开始时间: {start_time}, 类型: {type(start_time)}")
-            print(f"结束时间: {end_time}, 类型: {type(end_time)}")
-            
-            # 检查开始时间和结束时间是否有效
-            # 检查结束时间是否为空
-            if pd.isna(end_time) or (not end_time) or (str(end_time).strip() == ""):
-                message = f"跳过：结束时间为空的行"
-                result_messages.append(message)
-                print(message)
-                continue
-                
-            # 检查开始时间是否为空
-            if pd.isna(start_time) or (not start_time) or (str(start_time).strip() == ""):
-                message = f"跳过：开始时间为空的行"
-                result_messages.append(message)
-                print(message)
-                continue
-            
-            title = str(row.get("剪辑标题", row.get("Title", "untitled"))).strip().replace("/", "-").replace("\\", "-")
-            
-            # 为标题添加序号
-            if clip_number < len(circle_numbers):
-                title = f"{circle_numbers[clip_number]}{title}"
-            else:
-                # 如果超过50个，使用数字格式
-                title = f"{clip_number + 1}.{title}"
-            
-            clip_number += 1  # 增加计数器
-            print(f"标题: {title}")
-            
-            start = time_to_seconds(start_time)
-            end = time_to_seconds(end_time)
-            print(f"开始时间(秒): {start}, 结束时间(秒): {end}")
-            
-            # 检查时间是否有效（开始时间必须小于结束时间，且结束时间必须大于0）
-            if start >= end:
-                message = f"跳过：时间无效（开始时间必须小于结束时间）"
-                result_messages.append(message)
-                print(message)
+        output_args = get_cut_output_args(audio_only)
+        
+        # 源文件内容指纹，用于片段缓存
+        try:
+            fingerprint = get_source_fingerprint(input_video_path)
+        except OSError as e:
+            fingerprint = None
+            logger.warning(f"内容指纹计算失败: {str(e)}")
+        clip_mode = 'audio' if audio_only else cut_mode
+        # 合并且不需要单个片段时，通过 concat 清单的 inpoint/outpoint 直接从源文件输出合并结果
+        # （accurate 模式需要重编码首尾GOP，仍先裁剪再合并）
+        fused = concat_after_cut and not export_clips and clip_mode != 'accurate'
+        
+        # 根据编译后的计划生成每个片段的输出信息（不在循环中直接调用FFmpeg）
+        row_messages = [[] for _ in range(len(df))]  # 每行的处理消息，按计划顺序保存
+        for bad_row in bad_rows:
+            row_messages[bad_row['row']].append(bad_row['message'])
+        planned_clips = []  # 每个有效片段的输出信息，按计划顺序保存
+        output_ext = '.mp3' if audio_only else '.mp4'  # 仅导出音频时使用MP3格式
+        for row, start, end, title in plan.tolist():
+            messages = row_messages[row]
+            output_path = os.path.join(output_dir, f"{title}{output_ext}")
+
+            clip = {
+                'row': row,
+                'title': title,
+                'start': start,
+                'end': end,
+                'output_path': output_path,
+                'messages': messages,
+                'done': False,
+                'cache_key': get_clip_cache_key(fingerprint, start, end, clip_mode, output_args) if fingerprint else None
+            }
+            planned_clips.append(clip)
+
+            if fused:
+                messages.append(f"待合并：{title} ({start}s - {end}s)")
                 continue
-            
-            if audio_only:
-                # 仅导出音频，使用MP3格式
-                output_path = os.path.join(output_dir, f"{title}.mp3")
-                print(f"输出路径: {output_path}")
+
+            # 相同源文件、区间和参数的片段已裁剪过时直接复用
+            cached_path = lookup_clip_cache(clip['cache_key'], output_ext) if clip['cache_key'] else None
+            if cached_path:
+                try:
+                    if os.path.exists(output_path) and os.path.samefile(cached_path, output_path):
+                        messages.append(f"已存在，跳过：{output_path}")
+                    else:
+                        link_or_copy_file(cached_path, output_path)
+                        messages.append(f"♻️ 复用已裁剪片段：{output_path}")
+                    clip['done'] = True
+                    continue
+                except FileNotFoundError:
+                    # 查找之后被其他线程淘汰，按未命中处理（已打开的文件不受删除影响）
+                    pass
+
+            messages.append(f"正在裁剪：{title} ({start}s - {end}s)")
+
+        # 报告整体计划：跳过的行、已存在的片段和待裁剪的片段
+        plan_rows = [{'title': '', 'status': 'skipped', 'message': messages[-1] if messages else ''}
+                     for messages in row_messages]
+        for clip in planned_clips:
+            plan_rows[clip['row']] = {
+                'title': clip['title'],
+                'status': 'done' if clip['done'] else 'pending',
+                'message': clip['messages'][-1]
+            }
+        report('plan', rows=plan_rows, merge=bool(concat_after_cut), bad_rows=bad_rows)
+
+        # 单次读取源文件，一次性输出所有待裁剪片段
+        pending_clips = [] if fused else [clip for clip in planned_clips if not clip['done']]
+        if pending_clips:
+            # 同名旧文件可能是过期结果或缓存片段的硬链接，先删除再重新裁剪
+            for clip in pending_clips:
+                if os.path.exists(clip['output_path']):
+                    os.remove(clip['output_path'])
+
+            # 关键帧索引：keyframe/accurate 模式需要时才扫描生成，copy 模式只使用已有缓存报告实际起止时间
+            keyframe_index = None
+            if not audio_only:
+                keyframe_index = get_keyframe_index(input_video_path, build=(cut_mode in ('keyframe', 'accurate')))
+            accurate = cut_mode == 'accurate' and not audio_only and bool(keyframe_index and keyframe_index['keyframes'])
+            # 缺少关键帧索引时实际按 copy 模式裁剪，结果不能记入所选模式的缓存
+            cacheable = audio_only or cut_mode == 'copy' or bool(keyframe_index and keyframe_index['keyframes'])
+            for clip in pending_clips:
+                clip['cut_start'] = clip['start']
+                clip['actual_range'] = None
+                if keyframe_index and keyframe_index['keyframes'] and not accurate:
+                    clip['actual_range'] = get_actual_cut_range(keyframe_index, clip['start'], clip['end'], cut_mode)
+                    if cut_mode == 'keyframe':
+                        # 提前到两个关键帧之间定位，确保起点关键帧不会被丢弃
+                        clip['cut_start'] = keyframe_copy_start(keyframe_index, clip['actual_range'][0])
+
+            if accurate:
+                # 精确模式：各片段只重编码首尾不完整的GOP，按CPU核数并行
+                def run_hybrid_cut(clip):
+                    try:
+                        hybrid_cut(input_video_path, clip['output_path'], clip['start'], clip['end'], keyframe_index)
+                        report('row', index=clip['row'], status='done')
+                        return True
+                    except Exception as e:
+                        logger.warning(f"混合精确剪辑失败: {str(e)}")
+                        return False
+
+                with ThreadPoolExecutor(max_workers=get_cut_worker_count(reencode=True)) as executor:
+                    cut_results = list(executor.map(run_hybrid_cut, pending_clips))
             else:
-                # 导出视频
-                output_path = os.path.join(output_dir, f"{title}.mp4")
-                print(f"输出路径: {output_path}")
+                # 流复制按磁盘带宽、音频重编码按CPU核数决定并行批次
+                def on_segment_done(i, ok):
+                    if ok:
+                        report('row', index=pending_clips[i]['row'], status='done')
 
-            if os.path.exists(output_path):
-                message = f"已存在，跳过：{output_path}"
-                result_messages.append(message)
-                print(message)
-                # 如果需要合并，将已存在的文件也添加到合并列表中
-                if concat_after_cut:
-                    cut_files.append(output_path)  # 添加到合并列表
-                    print(f"添加已存在的文件到合并列表: {output_path}")
-                continue
+                # 仅导出音频时先把整条音轨编码一次，各片段从中流复制切分
+                cut_source, cut_args, reencode = input_video_path, output_args, audio_only
+                if audio_only and fingerprint:
+                    audio_track = get_audio_track(input_video_path, fingerprint, output_args)
+                    if audio_track:
+                        cut_source, cut_args, reencode = audio_track, ['-c', 'copy'], False
 
-            message = f"正在裁剪：{title} ({start}s - {end}s)"
-            result_messages.append(message)
-            print(message)
-            # 实时更新前端显示（虽然当前架构不支持真正的流式响应，但至少记录处理过程）
-            
-            try:
-                if audio_only:
-                    # 仅导出音频
-                    cmd = [
-                        FFMPEG_PATH,
-                        '-i', input_video_path,
-                        '-ss', str(start),
-                        '-to', str(end),
-                        '-vn',  # 禁用视频
-                        '-acodec', 'libmp3lame',  # 使用MP3编码
-                        '-ar', '44100',  # 音频采样率
-                        '-ac', '2',  # 双声道
-                        '-b:a', '192k',  # 音频比特率
-                        '-y',
-                        output_path
-                    ]
-                    
-                    result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
-                    
-                    if result.returncode == 0:
+                segments = [(clip['cut_start'], clip['end'], clip['output_path']) for clip in pending_clips]
+                cut_results = multi_cut(cut_source, segments, cut_args,
+                                        max_workers=get_cut_worker_count(reencode=reencode),
+                                        on_result=on_segment_done)
+
+            for clip, cut_ok in zip(pending_clips, cut_results):
+                title, start, end, output_path = clip['title'], clip['start'], clip['end'], clip['output_path']
+                actual_info = ''
+                if clip['actual_range']:
+                    actual_info = f"，实际区间：{clip['actual_range'][0]:.3f}s - {clip['actual_range'][1]:.3f}s"
+                # MoviePy 重编码的结果与所选模式不一致，不放入缓存
+                cache_result = cacheable and clip['cache_key'] is not None
+                try:
+                    if cut_ok:
+                        if audio_only:
+                            message = f"✅ 成功导出音频：{title} ({start}s - {end}s)"
+                        else:
+                            message = f"✅ 成功裁剪：{title} ({start}s - {end}s){actual_info}"
+                    elif audio_only:
+                        # 批量导出失败时从源文件逐个重试
+                        cut_audio_clip(input_video_path, output_path, start, end, output_args)
                         message = f"✅ 成功导出音频：{title} ({start}s - {end}s)"
-                    else:
-                        raise Exception(f"FFmpeg音频导出错误: {result.stderr}")
-                else:
-                    # 使用FFmpeg零重编码精准切片，保证音画同步
-                    if smart_cut(input_video_path, output_path, start, end):
-                        message = f"✅ 成功裁剪：{title} ({start}s - {end}s)"
+                    elif not accurate and smart_cut(input_video_path, output_path, clip['cut_start'], end):
+                        # 批量输出失败时逐个重试
+                        message = f"✅ 成功裁剪：{title} ({start}s - {end}s){actual_info}"
                     else:
                         # 如果FFmpeg方法失败，回退到MoviePy方法
-                        message = f"⚠️ FFmpeg方法失败，使用MoviePy方法"
+                        message = "⚠️ FFmpeg方法失败，使用MoviePy方法"
+                        cache_result = False
                         with VideoFileClip(input_video_path) as video:
                             # 直接使用subclip方法
-                            clip = video.subclip(start, end)
+                            subclip = video.subclip(start, end)
                             
                             # 优化编码参数，确保音画同步
-                            clip.write_videofile(
+                            subclip.write_videofile(
                                 output_path,
                                 verbose=False,  # 减少输出信息
                                 logger=None,    # 禁用logger
@@ -558,19 +2579,22 @@ def cut_videos_from_dataframe(input_video_path, df, concat_after_cut=False, audi
                             )
                             
                             # 重要：显式关闭剪辑释放资源
-                            clip.close()
+                            subclip.close()
                         message = f"✅ 成功裁剪（MoviePy）：{title} ({start}s - {end}s)"
-                result_messages.append(message)
-                print(message)
-                
-                # 如果需要合并，将剪辑后的文件添加到列表
-                if concat_after_cut:
-                    cut_files.append(output_path)
-                    print(f"添加新剪辑的文件到合并列表: {output_path}")
-            except Exception as e:
-                message = f"❌ 裁剪失败：{title} - {str(e)}"
-                result_messages.append(message)
+                    clip['done'] = True
+                    if cache_result:
+                        store_clip_cache(clip['cache_key'], output_path)
+                except Exception as e:
+                    message = f"❌ 裁剪失败：{title} - {str(e)}"
+                clip['messages'].append(message)
                 print(message)
+                report('row', index=clip['row'], status='done' if clip['done'] else 'failed', message=message)
+
+        # 按计划顺序汇总消息和待合并文件
+        for messages in row_messages:
+            result_messages.extend(messages)
+        if concat_after_cut:
+            cut_files = [clip['output_path'] for clip in planned_clips if clip['done']]
         
         success_message = "✅ 所有片段裁剪完成！"
         result_messages.append(success_message)
@@ -591,10 +2615,35 @@ def cut_videos_from_dataframe(input_video_path, df, concat_after_cut=False, audi
                         # 使用自定义文件名或默认文件名
                         output_filename = concat_file_name if concat_file_name and concat_file_name.endswith('.mp4') else "合并结果.mp4"
                     
-                    concat_result = concatenate_videos(cut_files, os.path.join(output_dir, output_filename))
+                    report('stage', message='正在合并片段')
+                    concat_result = concatenate_videos(cut_files, os.path.join(output_dir, output_filename), check_compatibility=False)
                     result_messages.append(f"合并结果: {concat_result}")
+                    if not export_clips and '✅' in concat_result:
+                        # 不需要单个片段，合并后删除（缓存中的副本仍保留）
+                        for fp in cut_files:
+                            os.remove(fp)
                 except Exception as e:
                     result_messages.append(f"❌ 合并失败: {str(e)}")
+            elif fused and planned_clips:
+                output_filename = concat_file_name if concat_file_name and concat_file_name.endswith(output_ext) else f"合并结果{output_ext}"
+                # copy/keyframe 模式把入点对齐到关键帧，与单独裁剪后再合并的画面一致
+                keyframe_index = None if audio_only else get_keyframe_index(input_video_path)
+                segments = []
+                for clip in planned_clips:
+                    start, end = clip['start'], clip['end']
+                    if keyframe_index and keyframe_index['keyframes']:
+                        start, end = get_actual_cut_range(keyframe_index, start, end, cut_mode)
+                    segments.append((start, end))
+                report('stage', message='正在合并片段')
+                audio_track = get_audio_track(input_video_path, fingerprint, output_args) if audio_only and fingerprint else None
+                if audio_track:
+                    # MP3每帧都可以作为入点，直接从缓存音轨流复制拼接
+                    concat_result = fused_cut_concat(audio_track, segments, os.path.join(output_dir, output_filename))
+                else:
+                    concat_result = fused_cut_concat(input_video_path, segments, os.path.join(output_dir, output_filename), output_args, audio_only)
+                result_messages.append(f"合并结果: {concat_result}")
+                for clip in planned_clips:
+                    report('row', index=clip['row'], status='done' if '✅' in concat_result else 'failed')
             else:
                 result_messages.append("❌ 没有找到要合并的文件")
         
@@ -605,6 +2654,311 @@ def cut_videos_from_dataframe(input_video_path, df, concat_after_cut=False, audi
         return error_message
 
 
+# 剪辑计划预估使用的操作历史：各剪辑方式对应的操作类型，以及按哪一项计量工作量
+# 剪辑按处理的媒体时长计量，拼接的输入是片段清单，按写出的字节数计量
+CUT_ESTIMATE_OPERATIONS = {
+    'copy': (('cut',), 'media_seconds'),
+    'audio': (('audio_track',), 'media_seconds'),
+    'accurate': (('cut_hybrid', 'cut_accurate'), 'media_seconds'),
+    'merge': (('concat', 'concat_fused'), 'output_size')
+}
+
+# 本机还没有操作历史时使用的默认吞吐量（每秒处理的源文件字节数）
+DEFAULT_CUT_THROUGHPUT = {
+    'copy': 200 * 1024 * 1024,     # 流复制，受磁盘带宽限制
+    'audio': 40 * 1024 * 1024,     # 音频编码
+    'accurate': 30 * 1024 * 1024,  # 首尾GOP重编码
+    'merge': 200 * 1024 * 1024     # 拼接
+}
+
+def get_cut_operation_rate(kind, sample_limit=200):
+    """从操作历史中读取本机最近成功的同类操作每单位工作量的耗时，返回 (秒/单位, 样本数)
+
+    按耗时总和与工作量总和之比计算：混合精确剪辑的首尾重编码和中间流复制分别记录，
+    合在一起才是整个片段的耗时。优先使用当前FFmpeg版本的记录，没有历史记录时返回 (None, 0)。
+    """
+    operations, column = CUT_ESTIMATE_OPERATIONS[kind]
+    placeholders = ', '.join('?' * len(operations))
+    with history_lock:
+        conn = get_history_db()
+        try:
+            for version in (get_ffmpeg_version(), None):
+                sql = f"""
+                    SELECT wall_seconds, {column} FROM operations
+                    WHERE operation IN ({placeholders}) AND host = ? AND returncode = 0 AND {column} > 0
+                """
+                params = [*operations, socket.gethostname()]
+                if version is not None:
+                    sql += " AND ffmpeg_version = ?"
+                    params.append(version)
+                sql += " ORDER BY started_at DESC LIMIT ?"
+                params.append(sample_limit)
+                rows = conn.execute(sql, params).fetchall()
+                if rows:
+                    return sum(row[0] for row in rows) / sum(row[1] for row in rows), len(rows)
+        finally:
+            conn.close()
+    return None, 0
+
+def estimate_cut_seconds(kind, amount, work_bytes):
+    """按操作历史预估耗时，amount 为按 CUT_ESTIMATE_OPERATIONS 计量的工作量；没有历史时按默认吞吐量和读取字节数估算"""
+    rate, sample_count = get_cut_operation_rate(kind)
+    if rate is not None:
+        return rate * amount, {'kind': kind, 'source': 'history', 'sample_count': sample_count}
+    return work_bytes / DEFAULT_CUT_THROUGHPUT[kind], {'kind': kind, 'source': 'default', 'sample_count': 0}
+
+def estimate_range_bytes(index, file_size, start, end):
+    """根据关键帧索引估算源文件中 [start, end] 区间的字节数
+
+    视频按关键帧处的累计字节数插值，音频和封装开销按时长平均分摊。
+    """
+    duration = index['duration'] or 0
+    if duration <= 0 or end <= start:
+        return 0
+    start, end = max(start, 0.0), min(end, duration)
+    if end <= start:
+        return 0
+    positions = index['keyframes'] + [duration]
+    offsets = index['keyframe_bytes'] + [index['video_bytes']]
+    video_bytes = np.interp(end, positions, offsets) - np.interp(start, positions, offsets)
+    other_bytes = max(file_size - index['video_bytes'], 0) * (end - start) / duration
+    return int(video_bytes + other_bytes)
+
+def estimate_cut_read_bytes(index, file_size, segments, batched=True, max_workers=1):
+    """估算裁剪 segments [(start, end), ...] 时从源文件读取的字节数
+
+    batched 时与 multi_cut 相同的分批方式：每批从最早起点之前的关键帧顺序读到最晚终点；
+    否则每个片段从起点之前的关键帧单独读取（精确剪辑、直接合并）。
+    """
+    groups = get_cut_batches(segments, max_workers) if batched else [[i] for i in range(len(segments))]
+    total = 0
+    for group in groups:
+        seek = min(segments[i][0] for i in group)
+        if index['keyframes']:
+            seek = keyframe_before(index, seek)
+        total += estimate_range_bytes(index, file_size, seek, max(segments[i][1] for i in group))
+    return total
+
+def get_audio_bitrate(output_args):
+    """从音频编码参数中读取码率（字节/秒）"""
+    if '-b:a' in output_args:
+        value = output_args[output_args.index('-b:a') + 1]
+        if value.endswith('k'):
+            return int(value[:-1]) * 1000 / 8
+        return int(value) / 8
+    return 192000 / 8
+
+def estimate_cut_plan(input_video_path, df, concat_after_cut=False, audio_only=False, concat_file_name=None, cut_mode='copy', export_clips=True):
+    """预估剪辑计划的读写字节数、耗时和所需磁盘空间，不执行剪辑"""
+    plan, bad_rows, first_title = compile_cut_plan(df)
+    output_dir = os.path.join(app.config['OUTPUT_FOLDER'], first_title or "剪辑输出")
+
+    index = get_keyframe_index(input_video_path)
+    if index is None:
+        raise Exception("关键帧索引生成失败")
+    file_size = os.path.getsize(input_video_path)
+    duration = index['duration']
+
+    output_args = get_cut_output_args(audio_only)
+    kind = 'audio' if audio_only else 'accurate' if cut_mode == 'accurate' else 'copy'
+    clip_mode = 'audio' if audio_only else cut_mode
+    fused = concat_after_cut and not export_clips and clip_mode != 'accurate'
+    output_ext = '.mp3' if audio_only else '.mp4'
+    audio_rate = get_audio_bitrate(output_args)
+    try:
+        fingerprint = get_source_fingerprint(input_video_path)
+    except OSError:
+        fingerprint = None
+
+    clips = []
+    for row, start, end, title in plan.tolist():
+        if audio_only or not index['keyframes']:
+            actual_start, actual_end = start, min(end, duration or end)
+        elif cut_mode == 'accurate':
+            actual_start, actual_end = start, min(end, duration or end)
+        else:
+            actual_start, actual_end = get_actual_cut_range(index, start, end, cut_mode)
+        if audio_only:
+            output_bytes = int(audio_rate * max(actual_end - actual_start, 0))
+        else:
+            output_bytes = estimate_range_bytes(index, file_size, actual_start, actual_end)
+        cache_key = get_clip_cache_key(fingerprint, start, end, clip_mode, output_args) if fingerprint else None
+        cached = bool(cache_key and not fused and lookup_clip_cache(cache_key, output_ext, touch=False))
+        clips.append({
+            'row': row,
+            'title': title,
+            'start': start,
+            'end': end,
+            'actual_start': actual_start,
+            'actual_end': actual_end,
+            'output_bytes': output_bytes,
+            'cached': cached
+        })
+
+    pending = [clip for clip in clips if not clip['cached']]
+    bytes_read = 0
+    bytes_written = 0
+    work_bytes = 0  # 需要处理的源文件字节数，没有操作历史时按默认吞吐量估算耗时
+    work_seconds = 0  # 需要处理的媒体时长，按操作历史估算耗时
+
+    if audio_only and pending and fingerprint:
+        # 整条音轨编码一次后各片段流复制切分，切分本身几乎不耗时
+        track_key = get_clip_cache_key(fingerprint, 0, 0, 'audio_track', output_args)
+        if not lookup_clip_cache(track_key, '.mp3', touch=False):
+            bytes_read += file_size
+            bytes_written += int(audio_rate * duration)
+            work_bytes += file_size
+            work_seconds += duration
+        bytes_read += sum(clip['output_bytes'] for clip in pending)
+    elif pending:
+        segments = [(clip['start'], clip['end']) for clip in pending]
+        work_bytes = estimate_cut_read_bytes(index, file_size, segments, batched=not (fused or cut_mode == 'accurate'),
+                                             max_workers=get_cut_worker_count(reencode=audio_only))
+        bytes_read += work_bytes
+        work_seconds = sum(max(clip['actual_end'] - clip['actual_start'], 0) for clip in pending)
+
+    clip_bytes = sum(clip['output_bytes'] for clip in clips)
+    if not fused:
+        bytes_written += sum(clip['output_bytes'] for clip in pending)
+
+    estimated_seconds, throughput = estimate_cut_seconds(kind, work_seconds, work_bytes)
+    merge_bytes = 0
+    if concat_after_cut and clips:
+        merge_bytes = clip_bytes
+        bytes_written += merge_bytes
+        if fused:
+            # 直接合并时裁剪和拼接在同一次读取中完成
+            estimated_seconds, throughput = estimate_cut_seconds('merge', merge_bytes, work_bytes)
+        else:
+            bytes_read += clip_bytes
+            estimated_seconds += estimate_cut_seconds('merge', merge_bytes, clip_bytes)[0]
+
+    # 精确模式不导出单个片段时，片段在合并后才删除，峰值空间仍包含片段
+    disk_space_needed = bytes_written
+    os.makedirs(app.config['OUTPUT_FOLDER'], exist_ok=True)
+    free_space = shutil.disk_usage(app.config['OUTPUT_FOLDER']).free
+
+    return {
+        'output_folder': os.path.basename(output_dir),
+        'clip_count': len(clips),
+        'cached_clip_count': len(clips) - len(pending),
+        'skipped_rows': bad_rows,
+        'source': {
+            'size': file_size,
+            'duration': duration,
+            'bitrate': int(file_size * 8 / duration) if duration else 0,
+            'keyframe_count': len(index['keyframes'])
+        },
+        'bytes_read': int(bytes_read),
+        'bytes_written': int(bytes_written),
+        'merge_bytes': int(merge_bytes),
+        'disk_space_needed': int(disk_space_needed),
+        'free_space': free_space,
+        'fits_in_free_space': disk_space_needed <= free_space,
+        'estimated_seconds': round(estimated_seconds, 2),
+        'throughput': throughput,
+        'clips': clips
+    }
+
+
+# 后台任务：长时间的剪辑/拼接/压缩/转换在线程池中执行，前端通过 /jobs/<job_id> 轮询进度
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+JOB_RETENTION_SECONDS = 3600  # 已结束任务保留1小时
+
+job_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS)
+jobs = {}
+jobs_lock = threading.Lock()
+
+def prune_jobs():
+    """清理过期的已结束任务（调用方需持有 jobs_lock）"""
+    now = time.time()
+    expired = [job_id for job_id, job in jobs.items()
+               if job['finished_at'] and now - job['finished_at'] > JOB_RETENTION_SECONDS]
+    for job_id in expired:
+        del jobs[job_id]
+
+def update_job_progress(job):
+    """根据各行状态计算完成百分比（调用方需持有 jobs_lock）"""
+    rows = job['rows']
+    if not rows:
+        return
+    finished = sum(1 for row in rows if row['status'] in ('done', 'failed', 'skipped'))
+    # 需要合并时，合并阶段占最后10%
+    scale = 90 if job['merge'] else 100
+    job['progress'] = int(finished * scale / len(rows))
+
+def create_job(job_type, func):
+    """提交后台任务，func(progress_callback) 的返回值作为任务结果，返回任务ID"""
+    job_id = uuid.uuid4().hex
+    job = {
+        'id': job_id,
+        'type': job_type,
+        'status': 'pending',  # pending / running / finished / failed
+        'progress': 0,
+        'rows': [],
+        'bad_rows': [],
+        'stage': '',
+        'merge': False,
+        'result': None,
+        'error': None,
+        'created_at': time.time(),
+        'finished_at': None
+    }
+
+    def progress_callback(event, **info):
+        with jobs_lock:
+            if event == 'plan':
+                job['rows'] = info.get('rows', [])
+                job['merge'] = info.get('merge', False)
+                job['bad_rows'] = info.get('bad_rows', [])
+                update_job_progress(job)
+            elif event == 'row':
+                index = info.get('index')
+                if index is not None and 0 <= index < len(job['rows']):
+                    row = job['rows'][index]
+                    row['status'] = info.get('status', row['status'])
+                    if info.get('message'):
+                        row['message'] = info['message']
+                    update_job_progress(job)
+            elif event == 'stage':
+                job['stage'] = info.get('message', '')
+
+    def run():
+        with jobs_lock:
+            job['status'] = 'running'
+        try:
+            result = func(progress_callback)
+            with jobs_lock:
+                job['result'] = result
+                job['status'] = 'finished'
+                job['progress'] = 100
+        except Exception as e:
+            logger.warning(f"后台任务失败: {str(e)}")
+            with jobs_lock:
+                job['error'] = str(e)
+                job['status'] = 'failed'
+        finally:
+            with jobs_lock:
+                job['finished_at'] = time.time()
+
+    with jobs_lock:
+        prune_jobs()
+        jobs[job_id] = job
+    job_executor.submit(run)
+    return job_id
+
+def get_job_snapshot(job_id):
+    """获取任务状态快照，任务不存在时返回 None"""
+    with jobs_lock:
+        job = jobs.get(job_id)
+        if job is None:
+            return None
+        snapshot = copy.deepcopy(job)
+    result = snapshot['result']
+    snapshot['messages'] = result.split('\n') if isinstance(result, str) else []
+    return snapshot
+
+
 @app.route('/api/chat', methods=['POST'])
 def chat():
     """代理活动策划 AI 服务"""
@@ -687,6 +3041,9 @@ def upload_video() -> Response:
         filename = str(file.filename)  # 确保filename是字符串类型
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
         file.save(filepath)
+        # 后台生成关键帧索引，后续剪辑可直接使用
+        if is_video_file(filename):
+            start_keyframe_index_build(filepath)
         return jsonify({'success': '文件上传成功', 'filepath': filepath, 'filename': filename})
     # 添加默认返回值
     return jsonify({'error': '未知错误'})
@@ -746,6 +3103,52 @@ def get_video_info_route():
     info = get_video_info(video_path)
     return jsonify(info)
 
+# 批量读取媒体信息时的并发数
+PROBE_WORKERS = int(os.environ.get('PROBE_WORKERS', 8))
+
+@app.route('/get_media_info_batch', methods=['POST'])
+def get_media_info_batch_route():
+    """批量获取视频信息：缓存命中的立即返回，其余并发读取，按完成顺序逐行输出（NDJSON）"""
+    data = request.get_json()
+    paths = data.get('paths', [])
+    
+    if not isinstance(paths, list) or not paths:
+        return jsonify({'error': '没有文件路径'})
+    
+    def info_line(path, info=None, error=None):
+        if error is None:
+            try:
+                result = {'path': path, **format_video_info(path, info), 'media': info}
+            except Exception as e:
+                result = {'path': path, 'error': str(e)}
+        else:
+            result = {'path': path, 'error': error}
+        return json.dumps(result, ensure_ascii=False) + '\n'
+    
+    def generate():
+        missing = []
+        for path in dict.fromkeys(paths):
+            if not isinstance(path, str) or not os.path.isfile(path):
+                yield info_line(path, error='视频文件不存在')
+                continue
+            info = probe_media(path, probe=False)
+            if info is not None:
+                yield info_line(path, info)
+            else:
+                missing.append(path)
+        
+        if missing:
+            with ThreadPoolExecutor(max_workers=max(1, min(PROBE_WORKERS, len(missing)))) as executor:
+                futures = {executor.submit(probe_media, path): path for path in missing}
+                for future in as_completed(futures):
+                    path = futures[future]
+                    try:
+                        yield info_line(path, future.result())
+                    except Exception as e:
+                        yield info_line(path, error=str(e))
+    
+    return Response(generate(), mimetype='application/x-ndjson')
+
 @app.route('/get_file_size', methods=['POST'])
 def get_file_size_route():
     data = request.get_json()
@@ -755,33 +3158,158 @@ def get_file_size_route():
         return jsonify({'error': '文件不存在'})
     
     try:
-        size = os.path.getsize(file_path)
-        return jsonify({'size': size})
+        size = os.path.getsize(file_path)
+        return jsonify({'size': size})
+    except Exception as e:
+        return jsonify({'error': str(e)})
+
+@app.route('/cut_videos', methods=['POST'])
+def cut_videos_route():
+    data = request.get_json()
+    video_path = data.get('video_path')
+    excel_data = data.get('excel_data')
+    concat_after_cut = data.get('concat_after_cut', False)  # 获取合并选项，默认为False
+    audio_only = data.get('audio_only', False)  # 获取仅导出音频选项，默认为False
+    concat_file_name = data.get('concat_file_name', None)  # 获取自定义合并文件名
+    cut_mode = data.get('cut_mode', 'copy')  # 剪辑模式：copy、keyframe 或 accurate
+    export_clips = data.get('export_clips', True)  # 合并时是否同时导出单个片段
+    
+    if not video_path or not os.path.exists(video_path):
+        return jsonify({'error': '视频文件不存在'})
+    if concat_file_name and not is_safe_output_name(concat_file_name):
+        return jsonify({'error': '合并文件名不能包含路径'})
+    
+    if not excel_data:
+        return jsonify({'error': '没有剪辑数据'})
+    
+    # 将数据转换为DataFrame
+    df = pd.DataFrame(excel_data)
+    
+    # 提交后台任务，立即返回任务ID，前端通过 /jobs/<job_id> 轮询进度和结果
+    job_id = create_job('cut_videos', lambda progress_callback: cut_videos_from_dataframe(
+        video_path, df, concat_after_cut, audio_only, concat_file_name, cut_mode, progress_callback, export_clips))
+    
+    return jsonify({'job_id': job_id, 'status_url': f'/jobs/{job_id}'})
+
+@app.route('/estimate_cut_plan', methods=['POST'])
+def estimate_cut_plan_route():
+    """预估剪辑计划（参数与 /cut_videos 相同）：读写字节数、耗时和所需磁盘空间"""
+    try:
+        data = request.get_json()
+        video_path = data.get('video_path')
+        excel_data = data.get('excel_data')
+        
+        if not video_path or not os.path.exists(video_path):
+            return jsonify({'error': '视频文件不存在'})
+        
+        if not excel_data:
+            return jsonify({'error': '没有剪辑数据'})
+        
+        estimate = estimate_cut_plan(
+            video_path,
+            pd.DataFrame(excel_data),
+            data.get('concat_after_cut', False),
+            data.get('audio_only', False),
+            data.get('concat_file_name', None),
+            data.get('cut_mode', 'copy'),
+            data.get('export_clips', True)
+        )
+        return jsonify(estimate)
+    except Exception as e:
+        return jsonify({'error': f'处理过程中出现错误: {str(e)}'})
+
+@app.route('/jobs/<job_id>')
+def get_job_route(job_id):
+    """查询后台任务状态：各行状态、完成百分比和最终结果"""
+    job = get_job_snapshot(job_id)
+    if job is None:
+        return jsonify({'error': '任务不存在或已过期'}), 404
+    return jsonify(job)
+
+@app.route('/get_keyframe_index', methods=['POST'])
+def get_keyframe_index_route():
+    """获取视频关键帧索引，可同时计算剪辑区间的实际起止时间"""
+    try:
+        data = request.get_json()
+        video_path = data.get('video_path')
+        segments = data.get('segments', [])  # [{'start': 秒, 'end': 秒}, ...]
+        cut_mode = data.get('cut_mode', 'copy')
+
+        if not video_path or not os.path.exists(video_path):
+            return jsonify({'error': '视频文件不存在'})
+
+        index = get_keyframe_index(video_path)
+        if index is None:
+            return jsonify({'error': '关键帧索引生成失败'})
+
+        actual_segments = []
+        for segment in segments:
+            start = float(segment.get('start', 0))
+            end = float(segment.get('end', 0))
+            actual_start, actual_end = get_actual_cut_range(index, start, end, cut_mode)
+            actual_segments.append({
+                'start': start,
+                'end': end,
+                'actual_start': actual_start,
+                'actual_end': actual_end
+            })
+
+        return jsonify({
+            'keyframes': index['keyframes'],
+            'keyframe_count': len(index['keyframes']),
+            'duration': index['duration'],
+            'segments': actual_segments
+        })
+    except Exception as e:
+        return jsonify({'error': f'处理过程中出现错误: {str(e)}'})
+
+@app.route('/get_sprite_thumbnails', methods=['POST'])
+def get_sprite_thumbnails_route():
+    """获取进度条悬停预览用的缩略图雪碧图和图块映射表"""
+    try:
+        data = request.get_json()
+        video_path = data.get('video_path')
+        interval = int(data.get('interval') or SPRITE_INTERVAL)
+
+        if not video_path or not os.path.exists(video_path):
+            return jsonify({'error': '视频文件不存在'})
+        if interval <= 0:
+            return jsonify({'error': '缩略图间隔必须大于0'})
+
+        sprite_map = get_sprite_map(video_path, interval)
+        if sprite_map is None:
+            return jsonify({'error': '缩略图生成失败'})
+        return jsonify(sprite_map)
     except Exception as e:
-        return jsonify({'error': str(e)})
+        return jsonify({'error': f'处理过程中出现错误: {str(e)}'})
 
-@app.route('/cut_videos', methods=['POST'])
-def cut_videos_route():
-    data = request.get_json()
-    video_path = data.get('video_path')
-    excel_data = data.get('excel_data')
-    concat_after_cut = data.get('concat_after_cut', False)  # 获取合并选项，默认为False
-    audio_only = data.get('audio_only', False)  # 获取仅导出音频选项，默认为False
-    concat_file_name = data.get('concat_file_name', None)  # 获取自定义合并文件名
-    
+@app.route('/sprite_thumbnails.vtt')
+def sprite_thumbnails_vtt_route():
+    """以 WebVTT 缩略图轨道的形式返回图块映射表"""
+    video_path = request.args.get('video_path', '')
     if not video_path or not os.path.exists(video_path):
-        return jsonify({'error': '视频文件不存在'})
-    
-    if not excel_data:
-        return jsonify({'error': '没有剪辑数据'})
-    
-    # 将数据转换为DataFrame
-    df = pd.DataFrame(excel_data)
-    
-    # 执行剪辑，传递合并选项、仅导出音频选项和自定义合并文件名
-    result = cut_videos_from_dataframe(video_path, df, concat_after_cut, audio_only, concat_file_name)
-    
-    return jsonify({'result': result})
+        return Response('视频文件不存在', status=404)
+    sprite_map = get_sprite_map(video_path, int(request.args.get('interval') or SPRITE_INTERVAL))
+    if sprite_map is None:
+        return Response('缩略图生成失败', status=500)
+    response = Response(get_sprite_vtt(sprite_map), mimetype='text/vtt')
+    response.add_etag()
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+@app.route('/get_proxy', methods=['POST'])
+def get_proxy_route():
+    """获取播放器使用的编辑代理（需要时加入后台生成队列），剪辑、裁剪仍使用原文件"""
+    try:
+        data = request.get_json()
+        video_path = data.get('video_path')
+
+        if not video_path or not os.path.exists(video_path):
+            return jsonify({'error': '视频文件不存在'})
+
+        return jsonify(get_proxy(video_path, enqueue=data.get('enqueue', True)))
+    except Exception as e:
+        return jsonify({'error': f'处理过程中出现错误: {str(e)}'})
 
 @app.route('/concat_videos', methods=['POST'])
 def concat_videos_route():
@@ -791,6 +3319,8 @@ def concat_videos_route():
     
     if not video_paths:
         return jsonify({'error': '没有选择视频文件'})
+    if not is_safe_output_name(output_name):
+        return jsonify({'error': '输出文件名不能包含路径'})
     
     # 检查所有文件是否存在
     for path in video_paths:
@@ -800,53 +3330,223 @@ def concat_videos_route():
     # 输出文件路径
     output_path = os.path.join(app.config['OUTPUT_FOLDER'], output_name)
     
-    # 拼接视频
-    result = concatenate_videos(video_paths, output_path)
+    def run_concat(progress_callback=None):
+        # 拼接视频
+        result = concatenate_videos(video_paths, output_path)
+        return {'result': result, 'output_file': os.path.basename(output_path) if '✅' in result else None, 'output_path': output_path if '✅' in result else None}
     
-    return jsonify({'result': result, 'output_file': os.path.basename(output_path) if '✅' in result else None, 'output_path': output_path if '✅' in result else None})
+    # 异步模式：提交后台任务，立即返回任务ID
+    if data.get('async'):
+        job_id = create_job('concat_videos', run_concat)
+        return jsonify({'job_id': job_id, 'status_url': f'/jobs/{job_id}'})
+    
+    return jsonify(run_concat())
+
+# 目录索引：按目录修改时间增量刷新，列表接口不再每次遍历整个目录
+DIRECTORY_INDEX_REFRESH_INTERVAL = 1.0  # 秒，间隔内的重复请求直接使用索引
+
+_directory_indexes = {}
+_directory_indexes_lock = threading.Lock()
+
+def scan_index_dir(dir_path):
+    """读取单个目录下的文件和子目录"""
+    files, subdirs = {}, []
+    with os.scandir(dir_path) as entries:
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.name)
+                elif entry.is_file():
+                    stat = entry.stat()
+                    files[entry.name] = {'size': stat.st_size, 'mtime': stat.st_mtime, 'media': None}
+            except OSError:
+                continue
+    return files, subdirs
+
+def refresh_directory_index(root):
+    """增量刷新目录索引并返回
+
+    只重新遍历修改时间变化的目录（新增、删除、重命名文件都会改变目录的修改时间）；
+    原地覆盖写入不改变目录的修改时间，目录未变化时仍逐个读取文件的大小和修改时间，
+    有变化的文件清除已保存的媒体信息。
+    """
+    root = os.path.abspath(root)
+    with _directory_indexes_lock:
+        index = _directory_indexes.setdefault(root, {
+            'dirs': {},
+            'checked_at': 0,
+            'lock': threading.Lock()
+        })
+
+    with index['lock']:
+        now = time.time()
+        if now - index['checked_at'] < DIRECTORY_INDEX_REFRESH_INTERVAL:
+            return index
+
+        seen = set()
+        pending = ['']
+        while pending:
+            rel_dir = pending.pop()
+            dir_path = os.path.join(root, rel_dir) if rel_dir else root
+            try:
+                mtime = os.stat(dir_path).st_mtime
+            except OSError:
+                continue
+            node = index['dirs'].get(rel_dir)
+            if node is None or node['mtime'] != mtime:
+                try:
+                    files, subdirs = scan_index_dir(dir_path)
+                except OSError:
+                    continue
+                node = index['dirs'][rel_dir] = {'mtime': mtime, 'files': files, 'subdirs': subdirs}
+            else:
+                for name, info in node['files'].items():
+                    try:
+                        stat = os.stat(os.path.join(dir_path, name))
+                    except OSError:
+                        continue
+                    if stat.st_size != info['size'] or stat.st_mtime != info['mtime']:
+                        info.update(size=stat.st_size, mtime=stat.st_mtime, media=None)
+            seen.add(rel_dir)
+            pending.extend(os.path.join(rel_dir, name) if rel_dir else name for name in node['subdirs'])
+
+        for rel_dir in list(index['dirs']):
+            if rel_dir not in seen:
+                del index['dirs'][rel_dir]
+        index['checked_at'] = now
+        return index
+
+def list_indexed_files(root, recursive=True, file_filter=None):
+    """从目录索引中列出文件，返回 [{'name', 'folder', 'path', 'size', 'mtime', 'entry'}, ...]"""
+    index = refresh_directory_index(root)
+    files = []
+    with index['lock']:
+        for rel_dir, node in index['dirs'].items():
+            if rel_dir and not recursive:
+                continue
+            for name, info in node['files'].items():
+                if file_filter and not file_filter(name):
+                    continue
+                files.append({
+                    'name': name,
+                    'folder': rel_dir.replace(os.sep, '/'),
+                    'path': os.path.join(root, rel_dir, name),
+                    'size': info['size'],
+                    'mtime': info['mtime'],
+                    'entry': info
+                })
+    return files
+
+def get_indexed_media_summary(file, missing):
+    """列表页的时长和分辨率，读到缓存后保存在索引中，避免每次请求都读取缓存文件"""
+    entry = file['entry']
+    if entry['media'] is None:
+        pending = len(missing)
+        summary = get_media_summary(file['path'], missing)
+        if len(missing) > pending:
+            return summary
+        entry['media'] = summary
+    return entry['media']
+
+def query_file_list(files, args, default_sort):
+    """按请求参数过滤、排序和分页
+
+    q: 按名称或文件夹过滤（不区分大小写）；folder: 只列出指定文件夹；
+    sort: name / folder / size / mtime；order: asc / desc；
+    page 从1开始，page_size 为0时返回全部。
+    """
+    keyword = args.get('q', '').strip().lower()
+    if keyword:
+        files = [f for f in files if keyword in f['name'].lower() or keyword in f['folder'].lower()]
+    folder = args.get('folder')
+    if folder is not None:
+        files = [f for f in files if f['folder'] == folder]
+
+    sort = args.get('sort', '')
+    sort_keys = {
+        'name': lambda f: f['name'],
+        'folder': lambda f: (f['folder'], f['name']),
+        'size': lambda f: f['size'],
+        'mtime': lambda f: f['mtime']
+    }
+    files = sorted(files, key=sort_keys.get(sort, default_sort), reverse=args.get('order') == 'desc')
+
+    total = len(files)
+    page = max(args.get('page', 1, type=int) or 1, 1)
+    page_size = max(args.get('page_size', 0, type=int) or 0, 0)
+    if page_size:
+        files = files[(page - 1) * page_size:page * page_size]
+    return files, {'total': total, 'page': page, 'page_size': page_size}
+
+def conditional_json(data):
+    """返回带 ETag 的JSON响应，内容未变化时返回 304"""
+    response = jsonify(data)
+    response.add_etag()
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
 
 @app.route('/list_all_files')
 def list_all_files():
-    """列出所有上传和输出文件"""
-    upload_dir = app.config['UPLOAD_FOLDER']
-    output_dir = app.config['OUTPUT_FOLDER']
-    
+    """列出所有上传和输出文件（支持 q/sort/order/page/page_size 参数，分别作用于两个列表）"""
     files = {
         'uploads': [],
         'outputs': []
     }
+    missing = []  # 还没有媒体信息缓存的文件
     
-    # 获取上传文件
-    if os.path.exists(upload_dir):
-        for filename in os.listdir(upload_dir):
-            filepath = os.path.join(upload_dir, filename)
-            if os.path.isfile(filepath):
-                file_size = os.path.getsize(filepath)
-                # 转换为MB
-                file_size_mb = round(file_size / (1024 * 1024), 2)
-                files['uploads'].append({
-                    'name': filename,
-                    'path': filepath,
-                    'size': f"{file_size_mb} MB",
-                    'type': 'upload'
-                })
+    for key, file_type, folder in (('uploads', 'upload', app.config['UPLOAD_FOLDER']),
+                                   ('outputs', 'output', app.config['OUTPUT_FOLDER'])):
+        if not os.path.exists(folder):
+            files[f'{key}_total'] = 0
+            continue
+        page_files, paging = query_file_list(list_indexed_files(folder, recursive=False), request.args, lambda f: f['name'])
+        for file in page_files:
+            # 转换为MB
+            file_size_mb = round(file['size'] / (1024 * 1024), 2)
+            files[key].append({
+                'name': file['name'],
+                'path': file['path'],
+                'size': f"{file_size_mb} MB",
+                'type': file_type,
+                **get_indexed_media_summary(file, missing)
+            })
+        files[f'{key}_total'] = paging['total']
     
-    # 获取输出文件
-    if os.path.exists(output_dir):
-        for filename in os.listdir(output_dir):
-            filepath = os.path.join(output_dir, filename)
-            if os.path.isfile(filepath):
-                file_size = os.path.getsize(filepath)
-                # 转换为MB
-                file_size_mb = round(file_size / (1024 * 1024), 2)
-                files['outputs'].append({
-                    'name': filename,
-                    'path': filepath,
-                    'size': f"{file_size_mb} MB",
-                    'type': 'output'
+    start_media_probe(missing)
+    return conditional_json(files)
+
+@app.route('/check_faststart', methods=['POST'])
+def check_faststart_route():
+    """检查上传和输出目录中 moov 在文件末尾（需要 faststart）的 MP4/MOV 文件，传 remux: true 时加入后台重封装队列"""
+    try:
+        data = request.get_json(silent=True) or {}
+        remux = data.get('remux', False)
+        results = {}
+        for key, folder, recursive in (('uploads', app.config['UPLOAD_FOLDER'], True),
+                                       ('outputs', app.config['OUTPUT_FOLDER'], False)):
+            results[key] = []
+            if not os.path.exists(folder):
+                continue
+            candidates = list_indexed_files(folder, recursive=recursive,
+                                            file_filter=lambda name: os.path.splitext(name)[1].lower() in FASTSTART_MUXERS)
+            for file in candidates:
+                with _faststart_lock:
+                    pending = os.path.abspath(file['path']) in _faststart_pending
+                if not pending and get_moov_position(file['path']) != 'end':
+                    continue
+                if remux and not pending:
+                    pending = start_faststart_remux(file['path'])
+                results[key].append({
+                    'name': file['name'],
+                    'folder': file['folder'],
+                    'path': file['path'],
+                    'size': file['size'],
+                    'queued': pending
                 })
-    
-    return jsonify(files)
+        results['total'] = len(results['uploads']) + len(results['outputs'])
+        return jsonify(results)
+    except Exception as e:
+        return jsonify({'error': f'处理过程中出现错误: {str(e)}'})
 
 @app.route('/delete_file', methods=['POST'])
 def delete_file():
@@ -888,69 +3588,60 @@ def list_output_files():
         return jsonify({'files': []})
     
     files = []
-    for filename in os.listdir(output_dir):
-        if filename.endswith(('.mp4', '.avi', '.mov', '.mkv')):
-            filepath = os.path.join(output_dir, filename)
-            file_size = os.path.getsize(filepath)
-            # 转换为MB
-            file_size_mb = round(file_size / (1024 * 1024), 2)
-            files.append({
-                'name': filename,
-                'path': filepath,
-                'size': f"{file_size_mb} MB"
-            })
+    missing = []  # 还没有媒体信息缓存的文件
+    output_files = list_indexed_files(output_dir, recursive=False,
+                                      file_filter=lambda name: name.endswith(('.mp4', '.avi', '.mov', '.mkv')))
+    page_files, paging = query_file_list(output_files, request.args, lambda f: f['name'])
+    for file in page_files:
+        # 转换为MB
+        file_size_mb = round(file['size'] / (1024 * 1024), 2)
+        files.append({
+            'name': file['name'],
+            'path': file['path'],
+            'size': f"{file_size_mb} MB",
+            **get_indexed_media_summary(file, missing)
+        })
     
-    return jsonify({'files': files})
+    start_media_probe(missing)
+    return conditional_json({'files': files, **paging})
 
 @app.route('/list_upload_videos')
 def list_upload_videos():
-    """列出上传的视频文件（包含子文件夹）"""
+    """列出上传的视频文件（包含子文件夹，支持 q/folder/sort/order/page/page_size 参数）"""
     try:
         files = []
+        missing = []  # 还没有媒体信息缓存的文件
+        paging = {'total': 0}
         upload_dir = app.config['UPLOAD_FOLDER']
         if os.path.exists(upload_dir):
-            # 递归遍历所有子文件夹
-            for root, dirs, filenames in os.walk(upload_dir):
-                for filename in filenames:
-                    if is_video_file(filename):
-                        filepath = os.path.join(root, filename)
-                        file_size = format_file_size(os.path.getsize(filepath))
-                        
-                        # 计算相对路径用于显示
-                        relative_path = os.path.relpath(root, upload_dir)
-                        if relative_path == '.':
-                            # 根目录文件
-                            display_name = filename
-                            folder = ''
-                            # URL编码文件名，但保留/符号
-                            encoded_filename = quote(filename)
-                            web_path = f'/static/uploads/{encoded_filename}'
-                        else:
-                            # 子文件夹文件
-                            display_name = f"{relative_path}/{filename}"
-                            folder = relative_path
-                            # URL编码路径和文件名
-                            encoded_path = '/'.join([quote(part) for part in relative_path.split('/')])
-                            encoded_filename = quote(filename)
-                            web_path = f'/static/uploads/{encoded_path}/{encoded_filename}'
-                        
-                        files.append({
-                            'name': filename,
-                            'display_name': display_name,
-                            'folder': folder,
-                            'path': web_path,
-                            'size': file_size
-                        })
-                        
-                        # 调试：输出前3个文件的路径
-                        if len(files) <= 3:
-                            print(f"[DEBUG] File: {filename}")
-                            print(f"[DEBUG] Folder: {folder}")
-                            print(f"[DEBUG] Web path: {web_path}")
-        
-        # 按文件夹和文件名排序
-        files.sort(key=lambda x: (x['folder'], x['name']))
-        return jsonify({'files': files})
+            # 默认按文件夹和文件名排序
+            upload_files = list_indexed_files(upload_dir, file_filter=is_video_file)
+            page_files, paging = query_file_list(upload_files, request.args, lambda f: (f['folder'], f['name']))
+            for file in page_files:
+                filename, folder = file['name'], file['folder']
+                if not folder:
+                    # 根目录文件
+                    display_name = filename
+                    # URL编码文件名，但保留/符号
+                    web_path = f'/static/uploads/{quote(filename)}'
+                else:
+                    # 子文件夹文件
+                    display_name = f"{folder}/{filename}"
+                    # URL编码路径和文件名
+                    encoded_path = '/'.join([quote(part) for part in folder.split('/')])
+                    web_path = f'/static/uploads/{encoded_path}/{quote(filename)}'
+                
+                files.append({
+                    'name': filename,
+                    'display_name': display_name,
+                    'folder': folder,
+                    'path': web_path,
+                    'size': format_file_size(file['size']),
+                    **get_indexed_media_summary(file, missing)
+                })
+        
+        start_media_probe(missing)
+        return conditional_json({'files': files, **paging})
     except Exception as e:
         return jsonify({'error': str(e)})
 
@@ -1008,6 +3699,8 @@ def compress_video_route():
         video_path = data.get('video_path')
         preset = data.get('preset', 'medium')  # 默认中等质量
         speed_mode = data.get('speed_mode', 'medium')  # 默认中等速度
+        chunked = bool(data.get('chunked'))  # 分段并行压缩
+        target_size_mb = data.get('target_size_mb')  # 目标大小（MB），为空时按预设CRF压缩
         
         if not video_path or not os.path.exists(video_path):
             return jsonify({'error': '视频文件不存在'})
@@ -1018,17 +3711,94 @@ def compress_video_route():
         output_filename = f"{name}_compressed.mp4"  # 强制使用MP4扩展名
         output_path = os.path.join(app.config['OUTPUT_FOLDER'], output_filename)
         
-        # 执行压缩
-        result = compress_video(video_path, output_path, preset, speed_mode)
+        def run_compress(progress_callback=None):
+            # 执行压缩
+            compress_info = {}
+            result = compress_video(video_path, output_path, preset, speed_mode, chunked, progress_callback, target_size_mb, compress_info)
+            response = {
+                'result': result,
+                'compress_path': compress_info.get('path'),  # 实际采用的压缩方式
+                'compress_reason': compress_info.get('reason'),
+                'output_path': output_path if '✅' in result else None,
+                'output_filename': output_filename if '✅' in result else None
+            }
+            if target_size_mb and '✅' in result:
+                # 目标大小模式下返回实际大小和偏差
+                actual_size = os.path.getsize(output_path) / (1024 * 1024)
+                response['report'] = {
+                    'target_size': float(target_size_mb),
+                    'actual_size': round(actual_size, 2),
+                    'deviation_percent': round((actual_size - float(target_size_mb)) / float(target_size_mb) * 100, 2)
+                }
+            return response
         
-        return jsonify({
-            'result': result,
-            'output_path': output_path if '✅' in result else None,
-            'output_filename': output_filename if '✅' in result else None
-        })
+        # 异步模式：提交后台任务，立即返回任务ID
+        if data.get('async'):
+            job_id = create_job('compress_video', run_compress)
+            return jsonify({'job_id': job_id, 'status_url': f'/jobs/{job_id}'})
+        
+        return jsonify(run_compress())
     except Exception as e:
         return jsonify({'error': f'处理过程中出现错误: {str(e)}'})
 
+@app.route('/operation_stats')
+def operation_stats_route():
+    """操作历史统计：按操作类型、主机和FFmpeg版本汇总耗时和吞吐量（参数 operation、days）"""
+    try:
+        days = request.args.get('days', type=float)
+        since = time.time() - days * 86400 if days else None
+        return jsonify({'stats': get_operation_stats(request.args.get('operation'), since)})
+    except Exception as e:
+        return jsonify({'error': str(e)})
+
+@app.route('/operation_history')
+def operation_history_route():
+    """最近的操作记录（参数 operation、limit）"""
+    try:
+        operation = request.args.get('operation')
+        limit = min(request.args.get('limit', 50, type=int), 1000)
+        sql = "SELECT * FROM operations"
+        params = []
+        if operation:
+            sql += " WHERE operation = ?"
+            params.append(operation)
+        sql += " ORDER BY started_at DESC LIMIT ?"
+        params.append(limit)
+        with history_lock:
+            conn = get_history_db()
+            try:
+                conn.row_factory = sqlite3.Row
+                rows = [dict(row) for row in conn.execute(sql, params).fetchall()]
+            finally:
+                conn.close()
+        for row in rows:
+            row['args'] = json.loads(row['args'] or '[]')
+        return jsonify({'operations': rows})
+    except Exception as e:
+        return jsonify({'error': str(e)})
+
+@app.route('/predict_eta', methods=['POST'])
+def predict_eta_route():
+    """根据操作历史预估耗时：传 operation 以及 video_path，或直接传 duration（秒）/ size（字节）"""
+    try:
+        data = request.get_json()
+        operation = data.get('operation')
+        if not operation:
+            return jsonify({'error': '操作类型不能为空'})
+        
+        media_seconds = data.get('duration')
+        input_size = data.get('size')
+        video_path = data.get('video_path')
+        if video_path:
+            if not os.path.exists(video_path):
+                return jsonify({'error': '视频文件不存在'})
+            input_size = os.path.getsize(video_path)
+            if media_seconds is None:
+                media_seconds = probe_media(video_path)['duration']
+        return jsonify(predict_operation_eta(operation, media_seconds, input_size))
+    except Exception as e:
+        return jsonify({'error': str(e)})
+
 @app.route('/get_compression_estimate', methods=['POST'])
 def get_compression_estimate_route():
     """获取压缩估算路由"""
@@ -1036,15 +3806,26 @@ def get_compression_estimate_route():
         data = request.get_json()
         video_path = data.get('video_path')
         preset = data.get('preset', 'medium')
+        speed_mode = data.get('speed_mode', 'medium')
+        target_size_mb = data.get('target_size_mb')
         
         if not video_path or not os.path.exists(video_path):
             return jsonify({'error': '视频文件不存在'})
-            
-        # 获取原始视频大小
-        original_size = os.path.getsize(video_path) / (1024 * 1024)  # MB
+        
+        # 目标大小模式按时长计算码率
+        target_plan = None
+        if target_size_mb:
+            media_info = probe_media(video_path)
+            settings = COMPRESS_PRESET_SETTINGS.get(preset, COMPRESS_PRESET_SETTINGS['medium'])
+            try:
+                target_plan = get_target_size_plan(media_info['duration'], float(target_size_mb),
+                                                   settings['audio_bitrate'],
+                                                   media_info.get('audio') is not None)
+            except ValueError as e:
+                return jsonify({'error': str(e)})
         
         # 获取压缩估算
-        estimate = get_compression_estimate(original_size, preset)
+        estimate = get_compression_estimate(video_path, preset, speed_mode, target_plan)
         
         return jsonify(estimate)
     except Exception as e:
@@ -1083,6 +3864,49 @@ def set_video_cover_route():
         return jsonify({'error': f'处理过程中出现错误: {str(e)}'})
 
 
+@app.route('/run_pipeline', methods=['POST'])
+def run_pipeline_route():
+    """操作流水线路由：operations 为按顺序执行的操作列表，编译为一次FFmpeg调用"""
+    try:
+        data = request.get_json()
+        video_path = data.get('video_path')
+        operations = data.get('operations', [])
+        
+        if not video_path or not os.path.exists(video_path):
+            return jsonify({'error': '视频文件不存在'})
+        if not operations:
+            return jsonify({'error': '操作列表不能为空'})
+        
+        # 生成输出文件路径，封面和流复制都输出为MP4
+        filename = os.path.basename(video_path)
+        name, ext = os.path.splitext(filename)
+        output_filename = data.get('output_name') or f"{name}_pipeline.mp4"
+        if not is_safe_output_name(output_filename):
+            return jsonify({'error': '输出文件名不能包含路径'})
+        if not output_filename.lower().endswith('.mp4'):
+            output_filename += '.mp4'
+        output_path = os.path.join(app.config['OUTPUT_FOLDER'], output_filename)
+        
+        def run_pipeline_job(progress_callback=None):
+            plan = {}
+            result = run_pipeline(video_path, operations, output_path, plan)
+            return {
+                'result': result,
+                'plan': plan,
+                'output_path': output_path if '✅' in result else None,
+                'output_filename': output_filename if '✅' in result else None
+            }
+        
+        # 异步模式：提交后台任务，立即返回任务ID
+        if data.get('async'):
+            job_id = create_job('run_pipeline', run_pipeline_job)
+            return jsonify({'job_id': job_id, 'status_url': f'/jobs/{job_id}'})
+        
+        return jsonify(run_pipeline_job())
+    except Exception as e:
+        return jsonify({'error': f'处理过程中出现错误: {str(e)}'})
+
+
 @app.route('/upload_pdf', methods=['POST'])
 def upload_pdf():
     """上传PDF文件"""
@@ -1358,11 +4182,12 @@ def crop_video_route():
             '-i', video_path,
             '-filter:v', f'crop={width}:{height}:{x}:{y}',
             '-c:a', 'copy',  # 音频直接复制
+            *get_faststart_args(output_path),
             '-y',
             output_path
         ]
         
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=600)  # 10分钟超时
+        result = run_ffmpeg(cmd, operation='crop', timeout=600)  # 10分钟超时
         
         if result.returncode != 0:
             raise Exception(f"FFmpeg裁剪错误: {result.stderr}")
@@ -1417,21 +4242,27 @@ def crop_video_with_time_route():
         output_path = os.path.join(app.config['OUTPUT_FOLDER'], output_filename)
         
         # 构建 FFmpeg 命令
-        cmd = [FFMPEG_PATH, '-i', video_path]
+        cmd = [FFMPEG_PATH]
         
-        # 如果设置了时间段
+        # 如果设置了时间段，在输入端定位（有关键帧索引时从起点前的关键帧开始解码）
         if end_time > start_time and end_time > 0:
-            cmd.extend(['-ss', str(start_time), '-to', str(end_time)])
+            keyframe_index = get_keyframe_index(video_path, build=False)
+            seek = keyframe_before(keyframe_index, start_time) if keyframe_index and keyframe_index['keyframes'] else start_time
+            cmd.extend(['-ss', str(seek), '-i', video_path,
+                        '-ss', str(start_time - seek), '-t', str(end_time - start_time)])
+        else:
+            cmd.extend(['-i', video_path])
         
         # 添加裁剪滤镜
         cmd.extend([
             '-filter:v', f'crop={width}:{height}:{x}:{y}',
             '-c:a', 'copy',  # 音频直接复制
+            *get_faststart_args(output_path),
             '-y',
             output_path
         ])
         
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=600)  # 10分钟超时
+        result = run_ffmpeg(cmd, operation='crop', timeout=600)  # 10分钟超时
         
         if result.returncode != 0:
             raise Exception(f"FFmpeg裁剪错误: {result.stderr}")
@@ -1458,6 +4289,143 @@ def crop_video_with_time_route():
     except Exception as e:
         return jsonify({'error': f'处理过程中出现错误: {str(e)}'})
 
+def convert_video_to_audio(video_path, audio_format):
+    """将视频转换为音频，超过2小时自动切分，返回结果字典"""
+    # 获取视频时长
+    try:
+        duration_seconds = probe_media(video_path)['duration']
+    except Exception as e:
+        duration_seconds = 0
+        logger.warning(f"读取媒体信息失败: {str(e)}")
+    
+    print(f"[DEBUG] Video duration: {duration_seconds} seconds")
+    
+    # 根据格式选择编码器和参数
+    format_settings = {
+        'mp3': {'codec': 'libmp3lame', 'bitrate': '192k'},
+        'wav': {'codec': 'pcm_s16le', 'bitrate': None},
+        'aac': {'codec': 'aac', 'bitrate': '192k'},
+        'm4a': {'codec': 'aac', 'bitrate': '192k'},
+        'ogg': {'codec': 'libvorbis', 'bitrate': '192k'},
+        'flac': {'codec': 'flac', 'bitrate': None}
+    }
+    
+    settings = format_settings.get(audio_format.lower(), format_settings['mp3'])
+    
+    # 生成输出文件名
+    filename = os.path.basename(video_path)
+    name, _ = os.path.splitext(filename)
+    
+    # 定义最大片段时长（2小时 = 7200秒）
+    MAX_SEGMENT_DURATION = 7200  # 2小时
+    
+    # 如果视频时长超过2小时，切分成多个音频文件
+    if duration_seconds > MAX_SEGMENT_DURATION:
+        print("[DEBUG] Video longer than 2 hours, splitting into segments")
+        
+        # 计算需要多少个片段
+        num_segments = int(duration_seconds // MAX_SEGMENT_DURATION) + (1 if duration_seconds % MAX_SEGMENT_DURATION > 0 else 0)
+        print(f"[DEBUG] Will create {num_segments} segments")
+        
+        output_files = []
+        total_size_mb = 0
+        
+        for i in range(num_segments):
+            start_time = i * MAX_SEGMENT_DURATION
+            segment_duration = min(MAX_SEGMENT_DURATION, duration_seconds - start_time)
+            
+            # 生成片段文件名
+            segment_filename = f"{name}_part{i+1:02d}.{audio_format.lower()}"
+            segment_path = os.path.join(app.config['OUTPUT_FOLDER'], segment_filename)
+            
+            # 构建FFmpeg命令（带时间范围）
+            cmd = [
+                FFMPEG_PATH,
+                '-ss', str(start_time),
+                '-t', str(segment_duration),
+                '-i', video_path,
+                '-vn',
+                '-acodec', settings['codec'],
+                '-ar', '44100',
+                '-ac', '2',
+            ]
+            
+            if settings['bitrate']:
+                cmd.extend(['-b:a', settings['bitrate']])
+            
+            cmd.extend(['-y', segment_path])
+            
+            print(f"[DEBUG] Converting segment {i+1}/{num_segments}: {start_time}s - {start_time + segment_duration}s")
+            
+            # 执行转换
+            result = run_ffmpeg(cmd, operation='convert_audio', timeout=300)
+            
+            if result.returncode != 0:
+                raise Exception(f"FFmpeg转换错误（片段{i+1}）: {result.stderr}")
+            
+            # 获取文件大小
+            segment_size = os.path.getsize(segment_path)
+            segment_size_mb = segment_size / (1024 * 1024)
+            total_size_mb += segment_size_mb
+            
+            output_files.append({
+                'name': segment_filename,
+                'path': segment_path,
+                'size_mb': round(segment_size_mb, 2),
+                'start_time': start_time,
+                'duration': segment_duration
+            })
+        
+        return {
+            'success': True,
+            'message': f'转换成功: 已切分为 {num_segments} 个音频文件（总大小: {total_size_mb:.2f} MB）',
+            'audio_files': output_files,
+            'total_size_mb': round(total_size_mb, 2),
+            'is_split': True,
+            'total_duration': duration_seconds
+        }
+    
+    else:
+        # 视频时长不超过2小时，直接转换
+        output_filename = f"{name}.{audio_format.lower()}"
+        output_path = os.path.join(app.config['OUTPUT_FOLDER'], output_filename)
+        
+        # 构建FFmpeg命令
+        cmd = [
+            FFMPEG_PATH,
+            '-i', video_path,
+            '-vn',
+            '-acodec', settings['codec'],
+            '-ar', '44100',
+            '-ac', '2',
+        ]
+        
+        if settings['bitrate']:
+            cmd.extend(['-b:a', settings['bitrate']])
+        
+        cmd.extend(['-y', output_path])
+        
+        # 执行转换
+        result = run_ffmpeg(cmd, operation='convert_audio', timeout=300)
+        
+        if result.returncode != 0:
+            raise Exception(f"FFmpeg转换错误: {result.stderr}")
+        
+        # 获取输出文件大小
+        output_size = os.path.getsize(output_path)
+        output_size_mb = output_size / (1024 * 1024)
+        
+        return {
+            'success': True,
+            'message': f'转换成功: {output_filename} ({output_size_mb:.2f} MB)',
+            'audio_path': output_path,
+            'audio_name': output_filename,
+            'size_mb': round(output_size_mb, 2),
+            'is_split': False,
+            'duration': duration_seconds
+        }
+
+
 @app.route('/convert_to_audio', methods=['POST'])
 def convert_to_audio():
     """将视频转换为音频，超过2小时自动切分"""
@@ -1506,148 +4474,12 @@ def convert_to_audio():
         if audio_format.lower() not in valid_formats:
             return jsonify({'error': f'不支持的音频格式: {audio_format}'}), 400
         
-        # 获取视频时长
-        duration_cmd = [FFMPEG_PATH, '-i', video_path]
-        duration_result = subprocess.run(duration_cmd, capture_output=True, text=True)
-        
-        # 从stderr中解析时长
-        duration_seconds = 0
-        for line in duration_result.stderr.split('\n'):
-            if 'Duration' in line:
-                try:
-                    duration_str = line.split('Duration: ')[1].split(',')[0]
-                    h, m, s = duration_str.split(':')
-                    duration_seconds = int(h) * 3600 + int(m) * 60 + float(s)
-                    break
-                except:
-                    pass
-        
-        print(f"[DEBUG] Video duration: {duration_seconds} seconds")
-        
-        # 根据格式选择编码器和参数
-        format_settings = {
-            'mp3': {'codec': 'libmp3lame', 'bitrate': '192k'},
-            'wav': {'codec': 'pcm_s16le', 'bitrate': None},
-            'aac': {'codec': 'aac', 'bitrate': '192k'},
-            'm4a': {'codec': 'aac', 'bitrate': '192k'},
-            'ogg': {'codec': 'libvorbis', 'bitrate': '192k'},
-            'flac': {'codec': 'flac', 'bitrate': None}
-        }
-        
-        settings = format_settings.get(audio_format.lower(), format_settings['mp3'])
-        
-        # 生成输出文件名
-        filename = os.path.basename(video_path)
-        name, _ = os.path.splitext(filename)
-        
-        # 定义最大片段时长（2小时 = 7200秒）
-        MAX_SEGMENT_DURATION = 7200  # 2小时
-        
-        # 如果视频时长超过2小时，切分成多个音频文件
-        if duration_seconds > MAX_SEGMENT_DURATION:
-            print(f"[DEBUG] Video longer than 2 hours, splitting into segments")
-            
-            # 计算需要多少个片段
-            num_segments = int(duration_seconds // MAX_SEGMENT_DURATION) + (1 if duration_seconds % MAX_SEGMENT_DURATION > 0 else 0)
-            print(f"[DEBUG] Will create {num_segments} segments")
-            
-            output_files = []
-            total_size_mb = 0
-            
-            for i in range(num_segments):
-                start_time = i * MAX_SEGMENT_DURATION
-                segment_duration = min(MAX_SEGMENT_DURATION, duration_seconds - start_time)
-                
-                # 生成片段文件名
-                segment_filename = f"{name}_part{i+1:02d}.{audio_format.lower()}"
-                segment_path = os.path.join(app.config['OUTPUT_FOLDER'], segment_filename)
-                
-                # 构建FFmpeg命令（带时间范围）
-                cmd = [
-                    FFMPEG_PATH,
-                    '-ss', str(start_time),
-                    '-t', str(segment_duration),
-                    '-i', video_path,
-                    '-vn',
-                    '-acodec', settings['codec'],
-                    '-ar', '44100',
-                    '-ac', '2',
-                ]
-                
-                if settings['bitrate']:
-                    cmd.extend(['-b:a', settings['bitrate']])
-                
-                cmd.extend(['-y', segment_path])
-                
-                print(f"[DEBUG] Converting segment {i+1}/{num_segments}: {start_time}s - {start_time + segment_duration}s")
-                
-                # 执行转换
-                result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
-                
-                if result.returncode != 0:
-                    raise Exception(f"FFmpeg转换错误（片段{i+1}）: {result.stderr}")
-                
-                # 获取文件大小
-                segment_size = os.path.getsize(segment_path)
-                segment_size_mb = segment_size / (1024 * 1024)
-                total_size_mb += segment_size_mb
-                
-                output_files.append({
-                    'name': segment_filename,
-                    'path': segment_path,
-                    'size_mb': round(segment_size_mb, 2),
-                    'start_time': start_time,
-                    'duration': segment_duration
-                })
-            
-            return jsonify({
-                'success': True,
-                'message': f'转换成功: 已切分为 {num_segments} 个音频文件（总大小: {total_size_mb:.2f} MB）',
-                'audio_files': output_files,
-                'total_size_mb': round(total_size_mb, 2),
-                'is_split': True,
-                'total_duration': duration_seconds
-            })
+        # 异步模式：提交后台任务，立即返回任务ID
+        if data.get('async'):
+            job_id = create_job('convert_to_audio', lambda progress_callback: convert_video_to_audio(video_path, audio_format))
+            return jsonify({'job_id': job_id, 'status_url': f'/jobs/{job_id}'})
         
-        else:
-            # 视频时长不超过2小时，直接转换
-            output_filename = f"{name}.{audio_format.lower()}"
-            output_path = os.path.join(app.config['OUTPUT_FOLDER'], output_filename)
-            
-            # 构建FFmpeg命令
-            cmd = [
-                FFMPEG_PATH,
-                '-i', video_path,
-                '-vn',
-                '-acodec', settings['codec'],
-                '-ar', '44100',
-                '-ac', '2',
-            ]
-            
-            if settings['bitrate']:
-                cmd.extend(['-b:a', settings['bitrate']])
-            
-            cmd.extend(['-y', output_path])
-            
-            # 执行转换
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
-            
-            if result.returncode != 0:
-                raise Exception(f"FFmpeg转换错误: {result.stderr}")
-            
-            # 获取输出文件大小
-            output_size = os.path.getsize(output_path)
-            output_size_mb = output_size / (1024 * 1024)
-            
-            return jsonify({
-                'success': True,
-                'message': f'转换成功: {output_filename} ({output_size_mb:.2f} MB)',
-                'audio_path': output_path,
-                'audio_name': output_filename,
-                'size_mb': round(output_size_mb, 2),
-                'is_split': False,
-                'duration': duration_seconds
-            })
+        return jsonify(convert_video_to_audio(video_path, audio_format))
         
     except subprocess.TimeoutExpired:
         return jsonify({'error': '转换超时，请检查视频文件大小'}), 504
@@ -0,0 +1,452 @@
+"""
+FFmpeg 公共工具：按文件生成的缓存、操作历史（run_ffmpeg）、媒体信息读取和日志
+app.py 和 toAdd/app.py 共用这一份实现
+"""
+
+import os
+import re
+import json
+import logging
+import hashlib
+import shutil
+import socket
+import sqlite3
+import subprocess
+import threading
+import time
+import uuid
+
+# 诊断日志：新代码路径统一使用 logger，级别由环境变量 LOG_LEVEL 控制（默认 INFO）
+logger = logging.getLogger('video_cut_helper')
+if not logger.handlers:
+    _log_handler = logging.StreamHandler()
+    _log_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+    logger.addHandler(_log_handler)
+    _log_level = getattr(logging, os.environ.get('LOG_LEVEL', 'INFO').upper(), None)
+    # 未知的 LOG_LEVEL 取值回退为 INFO
+    logger.setLevel(_log_level if isinstance(_log_level, int) else logging.INFO)
+    logger.propagate = False
+
+# 尝试导入imageio_ffmpeg以备FFmpeg路径问题
+try:
+    import imageio_ffmpeg
+    FFMPEG_PATH = imageio_ffmpeg.get_ffmpeg_exe()
+except ImportError:
+    FFMPEG_PATH = 'ffmpeg'
+
+# ffprobe 用于读取媒体信息，找不到时退回到FFmpeg
+FFPROBE_PATH = shutil.which('ffprobe')
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# 缓存目录（关键帧索引等按文件生成的数据）
+CACHE_FOLDER = os.path.join(BASE_DIR, 'static/cache')
+# 运行数据目录（操作历史等不能通过 static 对外提供的数据）
+INSTANCE_FOLDER = os.path.join(BASE_DIR, 'instance')
+
+# 封装时可以把 moov 原子放到文件开头（faststart）的输出格式
+FASTSTART_MUXERS = {'.mp4': 'mp4', '.m4v': 'mp4', '.mov': 'mov', '.m4a': 'ipod'}
+
+def get_faststart_args(output_path):
+    """MP4/MOV 输出的 faststart 参数，其他格式返回空列表"""
+    if os.path.splitext(output_path)[1].lower() in FASTSTART_MUXERS:
+        return ['-movflags', '+faststart']
+    return []
+
+def get_file_cache_path(kind, file_path):
+    """获取按文件生成的缓存数据的存放路径"""
+    key = hashlib.sha1(os.path.abspath(file_path).encode('utf-8')).hexdigest()
+    return os.path.join(CACHE_FOLDER, kind, f"{key}.json")
+
+def load_file_cache(kind, file_path):
+    """读取文件缓存，文件路径、大小或修改时间变化后缓存失效"""
+    cache_path = get_file_cache_path(kind, file_path)
+    try:
+        stat = os.stat(file_path)
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+        if cached.get('size') == stat.st_size and cached.get('mtime') == stat.st_mtime:
+            return cached.get('data')
+    except (OSError, ValueError):
+        pass
+    return None
+
+def save_file_cache(kind, file_path, data):
+    """保存文件缓存（先写临时文件再替换，避免读到半截内容）"""
+    cache_path = get_file_cache_path(kind, file_path)
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    stat = os.stat(file_path)
+    temp_path = f"{cache_path}.{uuid.uuid4().hex}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'path': os.path.abspath(file_path),
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'data': data
+        }, f, ensure_ascii=False)
+    os.replace(temp_path, cache_path)
+
+# 操作历史：记录每次FFmpeg调用的输入、参数、耗时和CPU时间，用于统计吞吐量和预估耗时
+HISTORY_DB_PATH = os.path.join(INSTANCE_FOLDER, 'history.sqlite3')
+history_lock = threading.Lock()
+_ffmpeg_version = None
+
+def get_history_db():
+    """打开操作历史数据库，首次使用时建表"""
+    os.makedirs(os.path.dirname(HISTORY_DB_PATH), exist_ok=True)
+    conn = sqlite3.connect(HISTORY_DB_PATH, timeout=10)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS operations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            operation TEXT NOT NULL,
+            started_at REAL NOT NULL,
+            wall_seconds REAL NOT NULL,
+            cpu_seconds REAL,
+            returncode INTEGER,
+            input_path TEXT,
+            input_size INTEGER,
+            input_duration REAL,
+            input_codec TEXT,
+            media_seconds REAL,
+            output_path TEXT,
+            output_size INTEGER,
+            args TEXT,
+            host TEXT,
+            ffmpeg_version TEXT
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_operations_operation ON operations (operation, started_at)")
+    return conn
+
+def get_ffmpeg_version():
+    """FFmpeg版本号（只读取一次），用于区分升级前后的耗时"""
+    global _ffmpeg_version
+    if _ffmpeg_version is None:
+        try:
+            result = subprocess.run([FFMPEG_PATH, '-version'], capture_output=True, text=True, timeout=30)
+            match = re.match(r'\S+ version (\S+)', result.stdout)
+            _ffmpeg_version = match.group(1) if match else ''
+        except Exception:
+            _ffmpeg_version = ''
+    return _ffmpeg_version
+
+def parse_ffmpeg_time(value):
+    """解析FFmpeg的时间参数（秒数或 HH:MM:SS.mmm），无法解析时抛出 ValueError"""
+    seconds = 0.0
+    for part in str(value).split(':'):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+def record_operation(operation, cmd, started_at, wall_seconds, cpu_seconds, returncode):
+    """把一次FFmpeg调用写入操作历史，失败时只打印日志，不影响调用方"""
+    try:
+        cmd = [str(arg) for arg in cmd]
+        inputs = [cmd[i + 1] for i in range(len(cmd) - 1) if cmd[i] == '-i' and os.path.isfile(cmd[i + 1])]
+        input_path = inputs[0] if inputs else None
+        output_path = cmd[-1] if len(cmd) > 1 and cmd[-1] not in inputs and not cmd[-1].startswith('-') and cmd[-1] != os.devnull else None
+        
+        input_size = input_duration = input_codec = None
+        if input_path:
+            input_size = os.path.getsize(input_path)
+            # 只读取已有的媒体信息缓存，不额外读取文件
+            info = probe_media(input_path, probe=False)
+            if info:
+                input_duration = info['duration']
+                input_codec = (info.get('video') or info.get('audio') or {}).get('codec')
+        
+        # 处理的媒体时长：按 -t 或 -ss/-to 参数累加（剪辑），都没有时取输入时长
+        durations = []
+        seek = 0.0
+        for i in range(len(cmd) - 1):
+            try:
+                if cmd[i] == '-ss':
+                    seek = parse_ffmpeg_time(cmd[i + 1])
+                elif cmd[i] == '-t':
+                    durations.append(parse_ffmpeg_time(cmd[i + 1]))
+                elif cmd[i] == '-to':
+                    durations.append(parse_ffmpeg_time(cmd[i + 1]) - seek)
+            except ValueError:
+                pass
+        media_seconds = sum(durations) if durations else input_duration
+        output_size = os.path.getsize(output_path) if output_path and os.path.isfile(output_path) else None
+        
+        with history_lock:
+            conn = get_history_db()
+            try:
+                with conn:
+                    conn.execute("""
+                        INSERT INTO operations (operation, started_at, wall_seconds, cpu_seconds, returncode,
+                                                input_path, input_size, input_duration, input_codec, media_seconds,
+                                                output_path, output_size, args, host, ffmpeg_version)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """, (operation, started_at, wall_seconds, cpu_seconds, returncode,
+                          input_path and os.path.abspath(input_path), input_size, input_duration, input_codec, media_seconds,
+                          output_path and os.path.abspath(output_path), output_size,
+                          json.dumps(cmd[1:], ensure_ascii=False), socket.gethostname(), get_ffmpeg_version()))
+            finally:
+                conn.close()
+    except Exception as e:
+        logger.warning(f"记录操作历史失败: {str(e)}")
+
+def wait_process(process, timeout=None):
+    """读取子进程的输出后用 os.wait4 回收，返回 (stdout, stderr, returncode, rusage)
+
+    超时时杀掉子进程并抛出 subprocess.TimeoutExpired。
+    """
+    outputs = {}
+
+    def read(name, stream):
+        try:
+            outputs[name] = stream.read()
+        except Exception as e:
+            outputs[name] = e
+
+    readers = []
+    for name in ('stdout', 'stderr'):
+        stream = getattr(process, name)
+        if stream is not None:
+            reader = threading.Thread(target=read, args=(name, stream), daemon=True)
+            reader.start()
+            readers.append(reader)
+
+    deadline = None if timeout is None else time.monotonic() + timeout
+    for reader in readers:
+        reader.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+    result = None
+    if not any(reader.is_alive() for reader in readers):
+        # 输出已关闭，子进程正在退出
+        delay = 0.001
+        while True:
+            pid, status, rusage = os.wait4(process.pid, os.WNOHANG)
+            if pid:
+                result = (os.waitstatus_to_exitcode(status), rusage)
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            time.sleep(delay)
+            delay = min(delay * 2, 0.05)
+    if result is None:
+        # 超时：子进程还没有被回收，交给 Popen 杀掉并回收
+        process.kill()
+        process.wait()
+        for reader in readers:
+            reader.join()
+        raise subprocess.TimeoutExpired(process.args, timeout)
+
+    # 已由 os.wait4 回收，Popen 不再等待
+    process.returncode = result[0]
+    for reader in readers:
+        reader.join()
+    for value in outputs.values():
+        if isinstance(value, Exception):
+            raise value
+    return outputs.get('stdout'), outputs.get('stderr'), result[0], result[1]
+
+def run_ffmpeg(cmd, operation='ffmpeg', timeout=None, capture_output=True, text=True, nice=None, record=True, **kwargs):
+    """执行FFmpeg命令并记录到操作历史，用法同 subprocess.run(cmd, capture_output=True, text=True, timeout=...)
+
+    operation 为操作类型（cut、concat、compress 等），统计和预估耗时按操作类型分组。
+    有 os.wait4 的系统上同时记录子进程的CPU时间。
+    nice 为子进程的调度优先级，在子进程启动后用 os.setpriority 设置（不用 preexec_fn，多线程下不安全）。
+    record=False 时不写入操作历史（读取媒体信息等辅助命令）。
+    """
+    if capture_output:
+        kwargs.setdefault('stdout', subprocess.PIPE)
+        kwargs.setdefault('stderr', subprocess.PIPE)
+    started_at = time.time()
+    started = time.perf_counter()
+    cpu_seconds = None
+    with subprocess.Popen(cmd, text=text, **kwargs) as process:
+        if nice is not None and hasattr(os, 'setpriority'):
+            try:
+                os.setpriority(os.PRIO_PROCESS, process.pid, nice)
+            except OSError:
+                pass
+        try:
+            if hasattr(os, 'wait4'):
+                stdout, stderr, returncode, rusage = wait_process(process, timeout)
+                cpu_seconds = rusage.ru_utime + rusage.ru_stime
+            else:
+                stdout, stderr = process.communicate(timeout=timeout)
+                returncode = process.returncode
+        except subprocess.TimeoutExpired:
+            if process.returncode is None:
+                process.kill()
+                process.communicate()
+            if record:
+                record_operation(operation, cmd, started_at, time.perf_counter() - started, None, None)
+            raise
+    if record:
+        record_operation(operation, cmd, started_at, time.perf_counter() - started, cpu_seconds, returncode)
+    return subprocess.CompletedProcess(cmd, returncode, stdout, stderr)
+
+# 媒体信息缓存格式版本，格式变化后旧缓存自动失效
+MEDIA_PROBE_VERSION = 3
+
+def parse_frame_rate(value):
+    """解析 ffprobe 的帧率（如 30000/1001）"""
+    try:
+        num, _, den = str(value).partition('/')
+        return float(num) / float(den) if den else float(num)
+    except (ValueError, ZeroDivisionError):
+        return 0.0
+
+def probe_media_ffprobe(file_path):
+    """用 ffprobe 的JSON输出读取媒体信息"""
+    cmd = [
+        FFPROBE_PATH,
+        '-v', 'error',
+        '-print_format', 'json',
+        '-show_format',
+        '-show_streams',
+        file_path
+    ]
+    result = run_ffmpeg(cmd, operation='probe', timeout=60, record=False)
+    if result.returncode != 0:
+        raise Exception(f"FFprobe错误: {result.stderr}")
+    data = json.loads(result.stdout or '{}')
+    fmt = data.get('format', {})
+
+    info = {
+        'version': MEDIA_PROBE_VERSION,
+        'format': fmt.get('format_name', ''),
+        'duration': float(fmt.get('duration') or 0),
+        'bit_rate': int(fmt.get('bit_rate') or 0),
+        'video': None,
+        'audio': None
+    }
+    for stream in data.get('streams', []):
+        codec_type = stream.get('codec_type')
+        if codec_type == 'video' and info['video'] is None and not stream.get('disposition', {}).get('attached_pic'):
+            fps = parse_frame_rate(stream.get('avg_frame_rate')) or parse_frame_rate(stream.get('r_frame_rate'))
+            info['video'] = {
+                'codec': stream.get('codec_name', ''),
+                'pix_fmt': stream.get('pix_fmt'),
+                'width': int(stream.get('width') or 0),
+                'height': int(stream.get('height') or 0),
+                'fps': round(fps, 3),
+                'time_base': stream.get('time_base'),
+                'bit_rate': int(stream.get('bit_rate') or 0),
+                'profile': stream.get('profile'),
+                'level': stream.get('level') if (stream.get('level') or 0) > 0 else None,
+                'refs': stream.get('refs')
+            }
+        elif codec_type == 'audio' and info['audio'] is None:
+            info['audio'] = {
+                'codec': stream.get('codec_name', ''),
+                'sample_rate': int(stream.get('sample_rate') or 0),
+                'channels': int(stream.get('channels') or 0),
+                'channel_layout': stream.get('channel_layout'),
+                'bit_rate': int(stream.get('bit_rate') or 0)
+            }
+    return info
+
+def split_stream_fields(text):
+    """按顶层逗号拆分 `ffmpeg -i` 的流描述（括号内的逗号不拆分）"""
+    fields, depth, current = [], 0, ''
+    for char in text:
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        if char == ',' and depth == 0:
+            fields.append(current.strip())
+            current = ''
+        else:
+            current += char
+    fields.append(current.strip())
+    return fields
+
+def parse_kbps(field):
+    """解析 '128 kb/s' 形式的码率（比特/秒）"""
+    match = re.match(r'^(\d+(?:\.\d+)?) kb/s', field)
+    return int(float(match.group(1)) * 1000) if match else 0
+
+def probe_media_ffmpeg(file_path):
+    """没有 ffprobe 时解析 `ffmpeg -i` 的输出读取媒体信息"""
+    result = run_ffmpeg([FFMPEG_PATH, '-i', file_path], operation='probe', timeout=60, record=False)
+    info = {
+        'version': MEDIA_PROBE_VERSION,
+        'format': '',
+        'duration': 0.0,
+        'bit_rate': 0,
+        'video': None,
+        'audio': None
+    }
+    found = False
+    for line in result.stderr.split('\n'):
+        line = line.strip()
+        if line.startswith('Input #0,'):
+            info['format'] = line.split(',', 1)[1].rsplit(', from', 1)[0].strip()
+        elif line.startswith('Duration:'):
+            found = True
+            duration_match = re.match(r'Duration: (\d+):(\d+):(\d+(?:\.\d+)?)', line)
+            if duration_match:
+                h, m, s = duration_match.groups()
+                info['duration'] = int(h) * 3600 + int(m) * 60 + float(s)
+            bitrate_match = re.search(r'bitrate: (\d+) kb/s', line)
+            if bitrate_match:
+                info['bit_rate'] = int(bitrate_match.group(1)) * 1000
+        elif line.startswith('Stream') and 'Video:' in line and info['video'] is None and 'attached pic' not in line:
+            found = True
+            fields = split_stream_fields(line.split('Video:', 1)[1])
+            video = {'codec': fields[0].split(' ')[0], 'pix_fmt': None, 'width': 0, 'height': 0, 'fps': 0.0, 'time_base': None, 'bit_rate': 0,
+                     'profile': None, 'level': None, 'refs': None}
+            # h264 (High) (avc1 / 0x31637661)：第一个括号内是 profile，`ffmpeg -i` 不输出 level
+            profile_match = re.match(r'^\w+ \(([^)/]+)\)', fields[0])
+            if profile_match:
+                video['profile'] = profile_match.group(1)
+            if len(fields) > 1:
+                video['pix_fmt'] = fields[1].split('(')[0].strip()
+            for field in fields[1:]:
+                size_match = re.match(r'^(\d+)x(\d+)', field)
+                if size_match and not video['width']:
+                    video['width'], video['height'] = int(size_match.group(1)), int(size_match.group(2))
+                elif field.endswith(' fps'):
+                    try:
+                        video['fps'] = float(field[:-4])
+                    except ValueError:
+                        pass
+                elif re.match(r'^\d+k? tbn', field):
+                    # 12800 tbn、90k tbn
+                    timescale = field.split(' ')[0]
+                    video['time_base'] = f"1/{int(timescale[:-1]) * 1000 if timescale.endswith('k') else timescale}"
+                elif field.endswith('kb/s') or 'kb/s ' in field:
+                    video['bit_rate'] = parse_kbps(field)
+            info['video'] = video
+        elif line.startswith('Stream') and 'Audio:' in line and info['audio'] is None:
+            found = True
+            fields = split_stream_fields(line.split('Audio:', 1)[1])
+            audio = {'codec': fields[0].split(' ')[0], 'sample_rate': 0, 'channels': 0, 'channel_layout': None, 'bit_rate': 0}
+            for field in fields[1:]:
+                if field.endswith(' Hz'):
+                    audio['sample_rate'] = int(field[:-3])
+                elif field in ('mono', 'stereo'):
+                    audio['channels'] = 1 if field == 'mono' else 2
+                    audio['channel_layout'] = field
+                elif re.match(r'^\d+(\.\d+)*(\(\w+\))?$', field):
+                    # 5.1、7.1(wide) 等声道布局
+                    audio['channels'] = sum(int(part) for part in re.findall(r'\d+', field.split('(')[0]))
+                    audio['channel_layout'] = field
+                elif re.match(r'^\d+ channels', field):
+                    audio['channels'] = int(field.split(' ')[0])
+                elif 'kb/s' in field:
+                    audio['bit_rate'] = parse_kbps(field)
+            info['audio'] = audio
+    if not found:
+        raise Exception(f"无法读取媒体信息: {result.stderr.strip().splitlines()[-1] if result.stderr.strip() else file_path}")
+    return info
+
+def probe_media(file_path, probe=True):
+    """读取媒体信息（时长、码率、视频/音频流参数），按路径+大小+修改时间缓存
+
+    优先使用 ffprobe 的JSON输出，没有 ffprobe 时解析 `ffmpeg -i` 的输出。
+    probe=False 时只返回已有缓存，没有缓存返回 None。
+    """
+    info = load_file_cache('probe', file_path)
+    if info is not None and info.get('version') == MEDIA_PROBE_VERSION:
+        return info
+    if not probe:
+        return None
+    info = probe_media_ffprobe(file_path) if FFPROBE_PATH else probe_media_ffmpeg(file_path)
+    save_file_cache('probe', file_path, info)
+    return info
@@ -297,6 +297,8 @@ function compressVideo() {
     const resultBox = document.getElementById('compressResult');
     const preset = document.getElementById('compressionPreset').value;
     const speedMode = document.getElementById('compressionSpeed').value;
+    const chunked = document.getElementById('compressChunked').checked;
+    const targetSize = parseFloat(document.getElementById('compressTargetSize').value);
     // 检查是否已上传视频
     if (!uploadedCompressVideoPath) {
         alert('请先上传视频文件');
@@ -315,8 +317,13 @@ function compressVideo() {
     const requestData = {
         video_path: videoPath,
         preset: preset,
-        speed_mode: speedMode
+        speed_mode: speedMode,
+        chunked: chunked
     };
+    // 填写目标大小时按目标大小两遍编码
+    if (targetSize > 0) {
+        requestData.target_size_mb = targetSize;
+    }
     // 发送压缩请求
     fetch('/compress_video', {
         method: 'POST',
@@ -1,5 +1,7 @@
 // 视频区域裁剪模块
 
+import { loadPlayableSource, clearPlayableSource } from './proxy.js';
+
 let cropCanvas = null;
 let cropCtx = null;
 let cropVideoElement = null;
@@ -8,6 +10,8 @@ let cropStartX = 0, cropStartY = 0, cropEndX = 0, cropEndY = 0;
 let isCropDragging = false;
 let cropImgWidth = 0, cropImgHeight = 0;
 let currentCropVideoPath = null;
+// 原视频尺寸（播放器播放的是代理时，裁剪坐标仍按原视频计算）
+let cropSourceSize = null;
 
 // 拖动调整相关变量
 let isDraggingResize = false;
@@ -364,8 +368,10 @@ function handleCropVideoFileUpload(e) {
     if (file) {
         const url = URL.createObjectURL(file);
         currentCropVideoPath = null;
+        cropSourceSize = null;
         // 加载到播放器
         if (cropVideoPlayer) {
+            clearPlayableSource(cropVideoPlayer);
             cropVideoPlayer.src = url;
             cropVideoPlayer.play().catch(err => console.log('自动播放失败:', err));
         }
@@ -429,11 +435,14 @@ function loadVideoForCrop(videoPath) {
 function loadVideoToPlayer(videoPath) {
     // videoPath 已经是完整的 web 路径，如 /static/uploads/folder/file.mp4
     // 直接使用，不需要重新构建
-    const videoUrl = videoPath;
-    
+    cropSourceSize = null;
     if (cropVideoPlayer) {
-        cropVideoPlayer.src = videoUrl;
-        cropVideoPlayer.play().catch(err => console.log('自动播放失败:', err));
+        // 需要时播放编辑代理
+        loadPlayableSource(cropVideoPlayer, videoPath, proxyInfo => {
+            if (proxyInfo && proxyInfo.width && proxyInfo.height) {
+                cropSourceSize = { width: proxyInfo.width, height: proxyInfo.height };
+            }
+        });
     }
 }
 
@@ -453,8 +462,8 @@ function captureCurrentFrame() {
  * 绘制视频帧到 Canvas
  */
 function drawVideoFrameToCanvas() {
-    cropImgWidth = cropVideoPlayer.videoWidth;
-    cropImgHeight = cropVideoPlayer.videoHeight;
+    cropImgWidth = cropSourceSize ? cropSourceSize.width : cropVideoPlayer.videoWidth;
+    cropImgHeight = cropSourceSize ? cropSourceSize.height : cropVideoPlayer.videoHeight;
     
     // 设置 Canvas 尺寸
     const maxWidth = 800;
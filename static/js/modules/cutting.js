@@ -1,5 +1,7 @@
 // 视频剪辑模块
 
+import { loadPlayableSource, clearPlayableSource } from './proxy.js';
+
 // 全局变量
 let activeCell = null;
 let videoElement = null;
@@ -73,6 +75,12 @@ function startCutting() {
     // 获取仅导出音频选项
     const audioOnly = document.getElementById('audioOnly').checked;
     
+    // 获取剪辑模式
+    const cutMode = document.getElementById('cutMode').value;
+    
+    // 合并时是否同时导出单个片段（不导出时合并结果直接从源文件生成）
+    const exportClips = !concatAfterCut || document.getElementById('exportClips').checked;
+    
     // 将web路径转换为文件系统路径
     let videoPath = uploadedVideoPath;
     if (videoPath.startsWith('/static/')) {
@@ -91,7 +99,9 @@ function startCutting() {
             excel_data: tableData,
             concat_after_cut: concatAfterCut,  // 添加合并选项
             concat_file_name: concatFileName,   // 添加自定义合并文件名
-            audio_only: audioOnly  // 添加仅导出音频选项
+            audio_only: audioOnly,  // 添加仅导出音频选项
+            cut_mode: cutMode,  // 剪辑模式
+            export_clips: exportClips  // 是否导出单个片段
         })
     })
     .then(response => response.json())
@@ -99,10 +109,49 @@ function startCutting() {
         if (data.error) {
             cutResultElement.textContent = '剪辑失败: ' + data.error;
         } else {
-            cutResultElement.textContent = data.result;
+            // 剪辑在后台执行，轮询任务进度
+            pollCutJob(data.status_url, cutResultElement);
+        }
+    })
+    .catch(error => {
+        console.error('Error:', error);
+        cutResultElement.textContent = '剪辑失败: ' + error;
+    });
+}
+
+/**
+ * 轮询剪辑任务进度，完成后显示结果
+ */
+function pollCutJob(statusUrl, cutResultElement) {
+    fetch(statusUrl)
+    .then(response => response.json())
+    .then(job => {
+        if (job.error && !job.status) {
+            cutResultElement.textContent = '剪辑失败: ' + job.error;
+            return;
+        }
+        if (job.status === 'finished') {
+            cutResultElement.textContent = job.result;
             // 更新剪辑输出文件列表
             updateCutOutputFilesList();
+            return;
+        }
+        if (job.status === 'failed') {
+            cutResultElement.textContent = '剪辑失败: ' + job.error;
+            return;
+        }
+        // 显示进度和各行状态
+        const lines = [`正在处理视频剪辑... ${job.progress}%`];
+        job.rows.forEach(row => {
+            if (row.message) {
+                lines.push(row.message);
+            }
+        });
+        if (job.stage) {
+            lines.push(job.stage);
         }
+        cutResultElement.textContent = lines.join('\n');
+        setTimeout(() => pollCutJob(statusUrl, cutResultElement), 1000);
     })
     .catch(error => {
         console.error('Error:', error);
@@ -464,9 +513,8 @@ function refreshVideoListForCutting() {
 }
 
 function doRefreshVideoListForCutting() {
-    // 添加时间戳防止缓存
-    const timestamp = new Date().getTime();
-    fetch(`/list_upload_videos?t=${timestamp}`)
+    // 浏览器携带 ETag 重新验证，列表未变化时服务端返回 304
+    fetch('/list_upload_videos', { cache: 'no-cache' })
     .then(response => response.json())
     .then(data => {
         console.log('获取到上传视频列表:', data);
@@ -614,8 +662,6 @@ function renderVideoList(selectElement, files) {
 function playVideoFromPath(videoPath, targetPlayerId) {
     // videoPath已经是完整的web路径，直接使用
     // 格式: /static/uploads/folder/file.mp4 (已URL编码)
-    const videoUrl = videoPath;
-    
     // 确定要播放视频的播放器
     let videoPlayer;
     if (targetPlayerId) {
@@ -625,13 +671,8 @@ function playVideoFromPath(videoPath, targetPlayerId) {
     }
 
     if (videoPlayer) {
-        videoPlayer.src = videoUrl;
-        // 自动播放视频
-        videoPlayer.play().catch(error => {
-            console.log('自动播放失败:', error);
-            // 如果自动播放失败，至少设置视频源
-            videoPlayer.src = videoUrl;
-        });
+        // 需要时播放编辑代理，剪辑仍使用原文件
+        loadPlayableSource(videoPlayer, videoPath);
     }
 }
 
@@ -641,6 +682,7 @@ function playVideoFromPath(videoPath, targetPlayerId) {
 function playUploadedVideo(file) {
     const videoPlayer = document.getElementById('cuttingVideoPlayer');
     const url = URL.createObjectURL(file);
+    clearPlayableSource(videoPlayer);
     videoPlayer.src = url;
     videoPlayer.play();
 }
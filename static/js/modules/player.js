@@ -2,9 +2,12 @@
 
 // 导入排序函数
 import { sortTableByStartTime } from './cutting.js';
+import { loadPlayableSource, clearPlayableSource } from './proxy.js';
 
 // 全局变量
 let activeCell = null;
+// 当前视频的缩略图雪碧图映射表（进度条悬停预览）
+let spriteMap = null;
 
 /**
  * 初始化视频播放器标签页
@@ -24,6 +27,7 @@ function initPlayerTab() {
         if (file) {
             // 直接创建本地URL播放，不上传到服务器
             const url = URL.createObjectURL(file);
+            clearPlayableSource(videoPlayer);
             videoPlayer.src = url;
             // 自动播放视频
             videoPlayer.play();
@@ -33,6 +37,8 @@ function initPlayerTab() {
             }, 100);
             // 清除已选择的现有文件
             document.getElementById('existingVideoSelectForPlayer').value = '';
+            // 本地文件没有服务器端缩略图
+            spriteMap = null;
         }
     });
     // 从已上传文件中选择视频（视频打标页面）
@@ -45,6 +51,8 @@ function initPlayerTab() {
             playVideoFromPathLocal(selectedValue, 'videoPlayer');
             // 显示视频信息
             showUploadedVideoInfo(selectedValue);
+            // 加载进度条悬停预览的缩略图
+            loadSpriteThumbnails(selectedValue);
         }
     });
     // 刷新视频列表按钮（视频打标页面）
@@ -86,12 +94,15 @@ function initPlayerTab() {
             const hoverPos = e.clientX - rect.left;
             hoverTimeDisplay.style.left = (hoverPos - 30) + 'px';
             hoverTimeDisplay.style.display = 'block';
+            // 显示缩略图
+            showHoverThumbnail(hoverTime, hoverPos);
         }
     });
     // 鼠标离开进度条时隐藏时间显示
     progressContainer.addEventListener('mouseleave', function() {
         const hoverTimeDisplay = document.getElementById('hoverTimeDisplay');
         hoverTimeDisplay.style.display = 'none';
+        document.getElementById('hoverThumbnail').style.display = 'none';
     });
     
     // 添加鼠标滚轮事件监听器，用于精细调整时间
@@ -170,8 +181,8 @@ function refreshVideoListForPlayer() {
 }
 
 function doRefreshVideoListForPlayer() {
-    const timestamp = new Date().getTime();
-    fetch(`/list_upload_videos?t=${timestamp}`)
+    // 浏览器携带 ETag 重新验证，列表未变化时服务端返回 304
+    fetch('/list_upload_videos', { cache: 'no-cache' })
     .then(response => response.json())
     .then(data => {
         console.log('获取到上传视频列表 (播放器页面):', data);
@@ -939,8 +950,6 @@ function setActiveCell(cell) {
 function playVideoFromPathLocal(videoPath, targetPlayerId) {
     // videoPath已经是完整的web路径，直接使用
     // 格式: /static/uploads/folder/file.mp4 (已URL编码)
-    const videoUrl = videoPath;
-    
     // 确定要播放视频的播放器
     let videoPlayer;
     if (targetPlayerId) {
@@ -950,14 +959,72 @@ function playVideoFromPathLocal(videoPath, targetPlayerId) {
     }
 
     if (videoPlayer) {
-        videoPlayer.src = videoUrl;
-        // 自动播放视频
-        videoPlayer.play().catch(error => {
-            console.log('自动播放失败:', error);
-            // 如果自动播放失败，至少设置视频源
-            videoPlayer.src = videoUrl;
-        });
+        // 需要时播放编辑代理，打标记录的时间与原文件一致
+        loadPlayableSource(videoPlayer, videoPath);
+    }
+}
+
+/**
+ * 加载视频的缩略图雪碧图映射表（服务器只解码关键帧生成，并缓存在磁盘上）
+ * @param {string} videoPath - 视频的web路径
+ */
+function loadSpriteThumbnails(videoPath) {
+    spriteMap = null;
+    let filePath = videoPath;
+    if (filePath.startsWith('/static/')) {
+        filePath = filePath.substring(1);
+    }
+    filePath = decodeURIComponent(filePath);
+
+    fetch('/get_sprite_thumbnails', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({video_path: filePath})
+    })
+    .then(response => response.json())
+    .then(data => {
+        // 加载期间可能已切换到其他视频
+        if (!data.error && document.getElementById('existingVideoSelectForPlayer').value === videoPath) {
+            spriteMap = data;
+        }
+    })
+    .catch(error => {
+        console.log('缩略图加载失败:', error);
+    });
+}
+
+/**
+ * 在进度条上方显示悬停时间对应的缩略图
+ * @param {number} time - 悬停位置对应的时间（秒）
+ * @param {number} hoverPos - 悬停位置相对进度条左侧的像素
+ */
+function showHoverThumbnail(time, hoverPos) {
+    const thumbnail = document.getElementById('hoverThumbnail');
+    if (!spriteMap || !spriteMap.tiles.length) {
+        thumbnail.style.display = 'none';
+        return;
+    }
+    // 二分查找不晚于 time 的最后一个图块
+    const tiles = spriteMap.tiles;
+    let low = 0;
+    let high = tiles.length - 1;
+    while (low < high) {
+        const mid = Math.ceil((low + high) / 2);
+        if (tiles[mid].start <= time) {
+            low = mid;
+        } else {
+            high = mid - 1;
+        }
     }
+    const tile = tiles[low];
+    thumbnail.style.width = spriteMap.tile_width + 'px';
+    thumbnail.style.height = spriteMap.tile_height + 'px';
+    thumbnail.style.backgroundImage = `url("${spriteMap.sheets[tile.sheet]}")`;
+    thumbnail.style.backgroundPosition = `-${tile.x}px -${tile.y}px`;
+    thumbnail.style.left = (hoverPos - spriteMap.tile_width / 2) + 'px';
+    thumbnail.style.display = 'block';
 }
 
 /**
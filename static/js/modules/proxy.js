@@ -0,0 +1,108 @@
+// 编辑代理模块：播放器播放低分辨率代理，剪辑、裁剪等操作仍然使用原文件
+
+// 代理生成中时的轮询间隔（毫秒）
+const PROXY_POLL_INTERVAL = 5000;
+
+/**
+ * 把web路径转换为服务器文件路径
+ * @param {string} videoPath - 格式: /static/uploads/folder/file.mp4 (已URL编码)
+ */
+function webPathToFilePath(videoPath) {
+    let filePath = videoPath;
+    if (filePath.startsWith('/static/')) {
+        filePath = filePath.substring(1);
+    }
+    return decodeURIComponent(filePath);
+}
+
+/**
+ * 给播放器加载可播放的视频源
+ * 不需要代理时直接播放原文件；代理已生成时播放代理；代理生成中时先播放原文件，生成完成后切换到代理并保持播放位置
+ * @param {HTMLVideoElement} videoPlayer - 播放器
+ * @param {string} videoPath - 原视频的web路径
+ * @param {Function} onSource - 设置视频源后回调 onSource(proxyInfo)，proxyInfo 包含原视频的 width/height
+ */
+function loadPlayableSource(videoPlayer, videoPath, onSource) {
+    videoPlayer.dataset.sourcePath = videoPath;
+
+    const setSource = (url, proxyInfo, swap) => {
+        // 加载期间可能已切换到其他视频
+        if (videoPlayer.dataset.sourcePath !== videoPath) {
+            return;
+        }
+        if (swap) {
+            // 代理生成完成后切换，保持播放位置和播放状态
+            const currentTime = videoPlayer.currentTime;
+            const paused = videoPlayer.paused;
+            videoPlayer.src = url;
+            videoPlayer.addEventListener('loadedmetadata', () => {
+                videoPlayer.currentTime = currentTime;
+                if (!paused) {
+                    videoPlayer.play().catch(error => console.log('自动播放失败:', error));
+                }
+            }, { once: true });
+        } else {
+            videoPlayer.src = url;
+            videoPlayer.play().catch(error => console.log('自动播放失败:', error));
+        }
+        if (onSource) {
+            onSource(proxyInfo);
+        }
+    };
+
+    const check = (firstCheck) => {
+        fetch('/get_proxy', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({video_path: webPathToFilePath(videoPath)})
+        })
+        .then(response => response.json())
+        .then(data => {
+            if (data.error) {
+                if (firstCheck) {
+                    setSource(videoPath, null, false);
+                }
+                return;
+            }
+            if (data.status === 'ready') {
+                setSource(data.url, data, !firstCheck);
+            } else {
+                if (firstCheck) {
+                    setSource(videoPath, data, false);
+                }
+                if (data.status === 'queued' || data.status === 'building') {
+                    console.log(`正在生成编辑代理（${data.reason}）`);
+                    setTimeout(() => {
+                        if (videoPlayer.dataset.sourcePath === videoPath) {
+                            check(false);
+                        }
+                    }, PROXY_POLL_INTERVAL);
+                }
+            }
+        })
+        .catch(error => {
+            console.log('获取编辑代理失败:', error);
+            if (firstCheck) {
+                setSource(videoPath, null, false);
+            }
+        });
+    };
+
+    check(true);
+}
+
+/**
+ * 播放本地文件等不经过代理的视频源时调用，停止对之前视频的代理轮询
+ * @param {HTMLVideoElement} videoPlayer - 播放器
+ */
+function clearPlayableSource(videoPlayer) {
+    delete videoPlayer.dataset.sourcePath;
+}
+
+export {
+    webPathToFilePath,
+    loadPlayableSource,
+    clearPlayableSource
+};
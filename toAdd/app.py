@@ -5,18 +5,15 @@
 
 from flask import Flask, request, jsonify, send_from_directory
 import os
-import subprocess
+import sys
 import tempfile
 import uuid
 import shutil
 from werkzeug.utils import secure_filename
 
-# 尝试导入imageio_ffmpeg
-try:
-    import imageio_ffmpeg
-    FFMPEG_PATH = imageio_ffmpeg.get_ffmpeg_exe()
-except ImportError:
-    FFMPEG_PATH = 'ffmpeg'
+# FFmpeg路径、按文件缓存、操作历史和媒体信息读取与主应用共用（仓库根目录的 media_tools.py）
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from media_tools import logger, FFMPEG_PATH, get_faststart_args, run_ffmpeg, probe_media
 
 # 配置
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -140,7 +137,7 @@ def crop_video_region(input_path, output_path, x, y, width, height, start_time,
             output_path
         ]
         
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
+        result = run_ffmpeg(cmd, operation='crop', timeout=300)
         
         if result.returncode != 0:
             print(f"FFmpeg error: {result.stderr}")
@@ -172,7 +169,7 @@ def crop_video_region_with_output(input_path, output_path, x, y, width, height,
             output_path
         ]
         
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
+        result = run_ffmpeg(cmd, operation='crop', timeout=300)
         
         if result.returncode != 0:
             print(f"FFmpeg crop error: {result.stderr}")
@@ -184,6 +181,171 @@ def crop_video_region_with_output(input_path, output_path, x, y, width, height,
         return False
 
 
+def get_canvas_bg_color(bg_color):
+    """把前端的背景色（#rrggbb / transparent）转换为 FFmpeg 颜色"""
+    color_map = {
+        'transparent': 'black@0.0',
+        '#000000': 'black',
+        '#ffffff': 'white',
+        '#f0f0f0': 'gray',
+        '#1a1a2e': '0x1a1a2e'
+    }
+    ffmpeg_bg = color_map.get(bg_color, '0x1a1a2e')
+    
+    if bg_color.startswith('#') and bg_color not in color_map:
+        r = int(bg_color[1:3], 16)
+        g = int(bg_color[3:5], 16)
+        b = int(bg_color[5:7], 16) if len(bg_color) > 6 else 0
+        ffmpeg_bg = f'0x{r:02x}{g:02x}{b:02x}'
+    return ffmpeg_bg
+
+
+def get_region_crop(region, source_size=None, x_key='source_x', y_key='source_y'):
+    """整理一个裁剪区域：宽高取偶数，裁剪框收回到画面内；时间段无效时返回 None"""
+    start_time = float(region.get('start_time', 0) or 0)
+    end_time = float(region.get('end_time', 0) or 0)
+    width = int(region.get('width', 100))
+    height = int(region.get('height', 100))
+    x, y = int(region.get(x_key, 0)), int(region.get(y_key, 0))
+    if source_size:
+        # 裁剪框超出画面时收回到画面内，避免 crop 滤镜报错
+        width = min(width, source_size[0])
+        height = min(height, source_size[1])
+    width, height = width - (width % 2), height - (height % 2)
+    if source_size:
+        x = max(0, min(x, source_size[0] - width))
+        y = max(0, min(y, source_size[1] - height))
+    if end_time <= start_time or width <= 0 or height <= 0:
+        return None
+    return {'start': start_time, 'end': end_time, 'width': width, 'height': height, 'x': x, 'y': y}
+
+
+def get_region_crop_filter(crop, seek=0.0):
+    """区域对应的 trim + crop 滤镜（时间相对输入端 -ss 的位置）"""
+    return (
+        f"trim=start={crop['start'] - seek:.3f}:end={crop['end'] - seek:.3f},"
+        f"setpts=PTS-STARTPTS,crop={crop['width']}:{crop['height']}:{crop['x']}:{crop['y']}"
+    )
+
+
+def get_source_size(input_path):
+    """读取源视频尺寸，读取失败返回 None"""
+    try:
+        video = (probe_media(input_path) or {}).get('video')
+        if video and video.get('width'):
+            return video['width'], video['height']
+    except Exception as e:
+        logger.warning(f"Probe error: {str(e)}")
+    return None
+
+
+def build_canvas_graph(regions, canvas_width, canvas_height, bg_color, source_size=None):
+    """把画布布局编译成一个 filter_complex
+
+    源视频只解码一次：split 成N路，每路 trim 到自己的时间段、crop 出区域，
+    再按 z_index 依次 overlay 到纯色画布上。
+    返回 (seek, duration, filter_graph)，seek/duration 用作输入端 -ss/-t；
+    没有有效区域时返回 None。
+    """
+    layers = []
+    for region in sorted(regions, key=lambda r: r.get('z_index', 0)):
+        layer = get_region_crop(region, source_size)
+        if layer is None:
+            continue
+        layer['layout_x'] = int(region.get('layout_x', 0))
+        layer['layout_y'] = int(region.get('layout_y', 0))
+        layers.append(layer)
+    if not layers:
+        return None
+    
+    seek = min(layer['start'] for layer in layers)
+    duration = max(layer['end'] for layer in layers) - seek
+    canvas_duration = max(layer['end'] - layer['start'] for layer in layers)
+    
+    n = len(layers)
+    parts = [f'color=c={get_canvas_bg_color(bg_color)}:s={canvas_width}x{canvas_height}:d={canvas_duration:.3f}[base]']
+    if n > 1:
+        parts.append('[0:v]' + 'split=' + str(n) + ''.join(f'[s{i}]' for i in range(n)))
+    for i, layer in enumerate(layers):
+        source = f'[s{i}]' if n > 1 else '[0:v]'
+        parts.append(f"{source}{get_region_crop_filter(layer, seek)}[c{i}]")
+    previous = '[base]'
+    for i, layer in enumerate(layers):
+        label = '[out]' if i == n - 1 else f'[v{i}]'
+        parts.append(f"{previous}[c{i}]overlay={layer['layout_x']}:{layer['layout_y']}{label}")
+        previous = label
+    return seek, duration, ';'.join(parts)
+
+
+def compose_canvas_single_pass(input_path, regions, output_path, canvas_width, canvas_height, bg_color):
+    """一次 FFmpeg 调用完成多区域裁剪和画布合成（解码一次、编码一次）"""
+    try:
+        graph = build_canvas_graph(regions, canvas_width, canvas_height, bg_color, get_source_size(input_path))
+        if graph is None:
+            return False
+        seek, duration, filter_graph = graph
+        
+        cmd = [
+            FFMPEG_PATH,
+            '-ss', f'{seek:.3f}',
+            '-t', f'{duration:.3f}',
+            '-i', input_path,
+            '-filter_complex', filter_graph,
+            '-map', '[out]',
+            '-c:v', 'libx264',
+            '-preset', 'fast',
+            '-crf', '23',
+            '-pix_fmt', 'yuv420p',
+            '-an',
+            *get_faststart_args(output_path),
+            '-y',
+            output_path
+        ]
+        
+        result = run_ffmpeg(cmd, operation='canvas_compose', timeout=600)
+        
+        if result.returncode != 0:
+            logger.warning(f"Canvas single pass error: {result.stderr}")
+            return False
+        
+        return True
+        
+    except Exception as e:
+        logger.warning(f"Canvas single pass error: {str(e)}")
+        return False
+
+
+def crop_canvas_regions(input_path, regions, temp_dir):
+    """逐个区域裁剪到临时文件（单次合成失败时的回退方案）"""
+    cropped_files = []
+    for i, region in enumerate(sorted(regions, key=lambda r: r.get('z_index', 0))):
+        source_x = region.get('source_x', 0)
+        source_y = region.get('source_y', 0)
+        width = region.get('width', 100)
+        height = region.get('height', 100)
+        start_time = region.get('start_time', 0)
+        end_time = region.get('end_time', 0)
+        
+        cropped_path = os.path.join(temp_dir, f'crop_{i}.mp4')
+        
+        success = crop_video_region_with_output(
+            input_path, cropped_path,
+            source_x, source_y, width, height,
+            start_time, end_time
+        )
+        
+        if success:
+            cropped_files.append({
+                'path': cropped_path,
+                'layout_x': region.get('layout_x', 0),
+                'layout_y': region.get('layout_y', 0),
+                'width': width,
+                'height': height,
+                'z_index': region.get('z_index', 0)
+            })
+    return cropped_files
+
+
 @app.route('/canvas_crop_concat', methods=['POST'])
 def canvas_crop_concat():
     """画布式多画面裁剪拼接接口 - 支持自由位置和层级"""
@@ -208,52 +370,31 @@ def canvas_crop_concat():
         if not os.path.exists(input_path):
             return jsonify({'error': f'视频文件不存在: {input_path}'})
         
-        temp_dir = tempfile.mkdtemp()
-        sorted_regions = sorted(regions, key=lambda r: r.get('z_index', 0))
-        
-        cropped_files = []
-        for i, region in enumerate(sorted_regions):
-            source_x = region.get('source_x', 0)
-            source_y = region.get('source_y', 0)
-            width = region.get('width', 100)
-            height = region.get('height', 100)
-            start_time = region.get('start_time', 0)
-            end_time = region.get('end_time', 0)
-            
-            cropped_path = os.path.join(temp_dir, f'crop_{i}.mp4')
-            
-            success = crop_video_region_with_output(
-                input_path, cropped_path,
-                source_x, source_y, width, height,
-                start_time, end_time
-            )
-            
-            if success:
-                cropped_files.append({
-                    'path': cropped_path,
-                    'layout_x': region.get('layout_x', 0),
-                    'layout_y': region.get('layout_y', 0),
-                    'width': width,
-                    'height': height,
-                    'z_index': region.get('z_index', 0)
-                })
-        
-        if not cropped_files:
-            return jsonify({'error': '所有裁剪操作都失败了'})
-        
         output_filename = secure_filename(output_name)
         if not output_filename.endswith('.mp4'):
             output_filename += '.mp4'
         
         output_path = os.path.join(app.config['OUTPUT_FOLDER'], output_filename)
         
-        success = compose_canvas(cropped_files, output_path, canvas_width, canvas_height, bg_color)
+        # 整个布局编译成一个 filter_complex：解码一次、编码一次
+        success = compose_canvas_single_pass(input_path, regions, output_path, canvas_width, canvas_height, bg_color)
+        
+        if not success:
+            temp_dir = tempfile.mkdtemp()
+            try:
+                cropped_files = crop_canvas_regions(input_path, regions, temp_dir)
+                if not cropped_files:
+                    return jsonify({'error': '所有裁剪操作都失败了'})
+                success = compose_canvas(cropped_files, output_path, canvas_width, canvas_height, bg_color)
+            finally:
+                shutil.rmtree(temp_dir, ignore_errors=True)
         
         if not success:
             return jsonify({'error': '画布拼接失败'})
         
         previews = []
-        preview_path = os.path.join(temp_dir, 'preview.jpg')
+        preview_filename = f'preview_{uuid.uuid4().hex}.jpg'
+        preview_path = os.path.join(app.config['OUTPUT_FOLDER'], preview_filename)
         cmd = [
             FFMPEG_PATH,
             '-i', output_path,
@@ -262,19 +403,14 @@ def canvas_crop_concat():
             '-y',
             preview_path
         ]
-        subprocess.run(cmd, capture_output=True, timeout=30)
+        run_ffmpeg(cmd, operation='preview', timeout=30)
         
         if os.path.exists(preview_path):
-            preview_filename = f'preview_{uuid.uuid4().hex}.jpg'
-            preview_dest = os.path.join(app.config['OUTPUT_FOLDER'], preview_filename)
-            shutil.copy(preview_path, preview_dest)
             previews.append({
                 'url': f'/static/output/{preview_filename}',
                 'title': '拼接结果预览'
             })
         
-        shutil.rmtree(temp_dir, ignore_errors=True)
-        
         return jsonify({
             'success': True,
             'output_url': f'/static/output/{output_filename}',
@@ -292,21 +428,7 @@ def compose_canvas(cropped_files, output_path, canvas_width, canvas_height, bg_c
         if not cropped_files:
             return False
         
-        # 转换背景色
-        color_map = {
-            'transparent': 'black@0.0',
-            '#000000': 'black',
-            '#ffffff': 'white',
-            '#f0f0f0': 'gray',
-            '#1a1a2e': '0x1a1a2e'
-        }
-        ffmpeg_bg = color_map.get(bg_color, '0x1a1a2e')
-        
-        if bg_color.startswith('#') and bg_color not in color_map:
-            r = int(bg_color[1:3], 16)
-            g = int(bg_color[3:5], 16)
-            b = int(bg_color[5:7], 16) if len(bg_color) > 6 else 0
-            ffmpeg_bg = f'0x{r:02x}{g:02x}{b:02x}'
+        ffmpeg_bg = get_canvas_bg_color(bg_color)
         
         inputs = []
         
@@ -338,11 +460,12 @@ def compose_canvas(cropped_files, output_path, canvas_width, canvas_height, bg_c
             '-preset', 'fast',
             '-crf', '23',
             '-an',
+            *get_faststart_args(output_path),
             '-y',
             output_path
         ]
         
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=600)
+        result = run_ffmpeg(cmd, operation='canvas_compose', timeout=600)
         
         if result.returncode != 0:
             print(f"Canvas compose error: {result.stderr}")
@@ -367,6 +490,7 @@ def simple_canvas_compose(cropped_files, output_path, canvas_width, canvas_heigh
                 '-preset', 'fast',
                 '-crf', '23',
                 '-an',
+                *get_faststart_args(output_path),
                 '-y',
                 output_path
             ]
@@ -398,11 +522,12 @@ def simple_canvas_compose(cropped_files, output_path, canvas_width, canvas_heigh
                 '-preset', 'fast',
                 '-crf', '23',
                 '-an',
+                *get_faststart_args(output_path),
                 '-y',
                 output_path
             ]
         
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=600)
+        result = run_ffmpeg(cmd, operation='canvas_compose', timeout=600)
         
         if result.returncode != 0:
             print(f"Simple compose error: {result.stderr}")
@@ -437,67 +562,54 @@ def multi_crop_concat():
         if not os.path.exists(input_path):
             return jsonify({'error': f'视频文件不存在: {input_path}'})
         
-        temp_dir = tempfile.mkdtemp()
-        cropped_paths = []
-        
-        for i, region in enumerate(regions):
-            x = region.get('x', 0)
-            y = region.get('y', 0)
-            width = region.get('width', 100)
-            height = region.get('height', 100)
-            start_time = region.get('start_time', 0)
-            end_time = region.get('end_time', 0)
-            
-            cropped_path = os.path.join(temp_dir, f'crop_{i}.mp4')
-            
-            success = crop_video_region(
-                input_path, cropped_path,
-                x, y, width, height,
-                start_time, end_time
-            )
-            
-            if success:
-                cropped_paths.append(cropped_path)
-        
-        if not cropped_paths:
-            return jsonify({'error': '所有裁剪操作都失败了'})
-        
         output_filename = secure_filename(output_name)
         if not output_filename.endswith('.mp4'):
             output_filename += '.mp4'
         
         output_path = os.path.join(app.config['OUTPUT_FOLDER'], output_filename)
         
-        # 使用 concatenate_videos_grid 函数
-        success = concatenate_videos_grid(cropped_paths, output_path, direction)
+        # 裁剪、拼接和每个区域的预览图在同一个 filter_complex 里完成
+        preview_prefix = f'preview_{uuid.uuid4().hex}'
+        preview_paths = [
+            os.path.join(app.config['OUTPUT_FOLDER'], f'{preview_prefix}_{i}.jpg')
+            for i in range(len(regions))
+        ]
+        success = stack_crop_regions(input_path, regions, output_path, direction, preview_paths)
+        
+        if not success:
+            temp_dir = tempfile.mkdtemp()
+            try:
+                cropped_files = crop_grid_regions(input_path, regions, temp_dir)
+                if not cropped_files:
+                    return jsonify({'error': '所有裁剪操作都失败了'})
+                sizes = [(f['width'], f['height']) for f in cropped_files]
+                success = concatenate_videos_grid([f['path'] for f in cropped_files], output_path, direction, sizes)
+                if success:
+                    # 按原始区域下标命名预览图，裁剪失败的区域不会让后面的标题错位
+                    for f in cropped_files:
+                        cmd = [
+                            FFMPEG_PATH,
+                            '-i', f['path'],
+                            '-ss', '00:00:01',
+                            '-vframes', '1',
+                            '-y',
+                            preview_paths[f['index']]
+                        ]
+                        run_ffmpeg(cmd, operation='preview', timeout=30)
+            finally:
+                shutil.rmtree(temp_dir, ignore_errors=True)
         
         if not success:
             return jsonify({'error': '视频拼接失败'})
         
         previews = []
-        for i, path in enumerate(cropped_paths):
-            preview_path = os.path.join(temp_dir, f'preview_{i}.jpg')
-            cmd = [
-                FFMPEG_PATH,
-                '-i', path,
-                '-ss', '00:00:01',
-                '-vframes', '1',
-                '-y',
-                preview_path
-            ]
-            subprocess.run(cmd, capture_output=True, timeout=30)
-            
+        for i, preview_path in enumerate(preview_paths):
             if os.path.exists(preview_path):
-                preview_filename = f'preview_{uuid.uuid4().hex}_{i}.jpg'
-                preview_dest = os.path.join(app.config['OUTPUT_FOLDER'], preview_filename)
-                shutil.copy(preview_path, preview_dest)
                 previews.append({
-                    'url': f'/static/output/{preview_filename}',
+                    'url': f'/static/output/{os.path.basename(preview_path)}',
                     'title': f'裁剪区域 {i + 1}'
                 })
         
-        shutil.rmtree(temp_dir, ignore_errors=True)
-        
         return jsonify({
             'success': True,
             'output_url': f'/static/output/{output_filename}',
@@ -509,8 +621,158 @@ def multi_crop_concat():
         return jsonify({'error': str(e)})
 
 
-def concatenate_videos_grid(video_paths, output_path, direction='horizontal'):
-    """拼接多个视频（支持横向、纵向、网格布局）"""
+def get_stack_layout(sizes, direction='horizontal'):
+    """按各画面尺寸计算拼接布局
+
+    horizontal/vertical 依次排成一行/一列，grid 按 ceil(sqrt(n)) 列排列，
+    每列宽度、每行高度取该列/行中最大的画面。
+    返回 (positions, total_width, total_height)，positions 为每个画面左上角坐标。
+    """
+    import math
+    n = len(sizes)
+    if direction == 'horizontal':
+        cols = n
+    elif direction == 'vertical':
+        cols = 1
+    else:
+        cols = math.ceil(math.sqrt(n))
+    rows = math.ceil(n / cols)
+    
+    col_widths = [0] * cols
+    row_heights = [0] * rows
+    for i, (width, height) in enumerate(sizes):
+        col_widths[i % cols] = max(col_widths[i % cols], width)
+        row_heights[i // cols] = max(row_heights[i // cols], height)
+    
+    positions = []
+    for i in range(n):
+        col, row = i % cols, i // cols
+        positions.append((sum(col_widths[:col]), sum(row_heights[:row])))
+    return positions, sum(col_widths), sum(row_heights)
+
+
+def get_stack_filter(labels, sizes, direction='horizontal'):
+    """生成把 labels 对应画面拼到一起的 xstack 滤镜（尺寸不一致时用黑色填充）"""
+    positions, total_width, total_height = get_stack_layout(sizes, direction)
+    if len(labels) == 1:
+        return f'{labels[0]}null'
+    layout_str = '|'.join(f'{x}_{y}' for x, y in positions)
+    return f"{''.join(labels)}xstack=inputs={len(labels)}:layout={layout_str}:fill=black"
+
+
+def build_stack_graph(regions, direction='horizontal', source_size=None, preview_count=0):
+    """把多区域裁剪 + 拼接编译成一个 filter_complex
+
+    源视频只解码一次：split 成N路，每路 trim/crop 后按计算好的坐标 xstack；
+    前 preview_count 个区域再分出一路取第1秒（不足1秒取中间）的画面作预览。
+    返回 (seek, duration, filter_graph, preview_labels)；没有有效区域时返回 None。
+    """
+    crops = []
+    for i, region in enumerate(regions):
+        crop = get_region_crop(region, source_size, x_key='x', y_key='y')
+        if crop is not None:
+            crop['index'] = i
+            crops.append(crop)
+    if not crops:
+        return None
+    
+    seek = min(crop['start'] for crop in crops)
+    duration = max(crop['end'] for crop in crops) - seek
+    
+    n = len(crops)
+    parts = []
+    if n > 1:
+        parts.append('[0:v]' + 'split=' + str(n) + ''.join(f'[s{i}]' for i in range(n)))
+    stack_labels = []
+    preview_labels = {}
+    for i, crop in enumerate(crops):
+        source = f'[s{i}]' if n > 1 else '[0:v]'
+        if crop['index'] < preview_count:
+            preview_time = min(1.0, (crop['end'] - crop['start']) / 2)
+            parts.append(f"{source}{get_region_crop_filter(crop, seek)},split[c{i}][q{i}]")
+            parts.append(f'[q{i}]trim=start={preview_time:.3f}[p{i}]')
+            preview_labels[crop['index']] = f'[p{i}]'
+        else:
+            parts.append(f"{source}{get_region_crop_filter(crop, seek)}[c{i}]")
+        stack_labels.append(f'[c{i}]')
+    sizes = [(crop['width'], crop['height']) for crop in crops]
+    parts.append(get_stack_filter(stack_labels, sizes, direction) + '[v]')
+    return seek, duration, ';'.join(parts), preview_labels
+
+
+def stack_crop_regions(input_path, regions, output_path, direction='horizontal', preview_paths=None):
+    """一次 FFmpeg 调用完成多区域裁剪、拼接和预览图输出"""
+    try:
+        preview_paths = preview_paths or []
+        graph = build_stack_graph(regions, direction, get_source_size(input_path), len(preview_paths))
+        if graph is None:
+            return False
+        seek, duration, filter_graph, preview_labels = graph
+        
+        preview_outputs = []
+        for index, label in preview_labels.items():
+            preview_outputs.extend(['-map', label, '-frames:v', '1', '-y', preview_paths[index]])
+        
+        cmd = [
+            FFMPEG_PATH,
+            '-ss', f'{seek:.3f}',
+            '-t', f'{duration:.3f}',
+            '-i', input_path,
+            '-filter_complex', filter_graph,
+            '-map', '[v]',
+            '-c:v', 'libx264',
+            '-preset', 'fast',
+            '-crf', '23',
+            '-pix_fmt', 'yuv420p',
+            '-an',
+            *get_faststart_args(output_path),
+            '-y',
+            output_path,
+            *preview_outputs
+        ]
+        
+        result = run_ffmpeg(cmd, operation='grid_concat', timeout=600)
+        
+        if result.returncode != 0:
+            logger.warning(f"Stack crop error: {result.stderr}")
+            return False
+        
+        return True
+        
+    except Exception as e:
+        logger.warning(f"Stack crop error: {str(e)}")
+        return False
+
+
+def crop_grid_regions(input_path, regions, temp_dir):
+    """逐个区域裁剪到临时文件（单次拼接失败时的回退方案），index 为区域在 regions 中的下标"""
+    cropped_files = []
+    for i, region in enumerate(regions):
+        width = region.get('width', 100)
+        height = region.get('height', 100)
+        cropped_path = os.path.join(temp_dir, f'crop_{i}.mp4')
+        
+        success = crop_video_region(
+            input_path, cropped_path,
+            region.get('x', 0), region.get('y', 0), width, height,
+            region.get('start_time', 0), region.get('end_time', 0)
+        )
+        
+        if success:
+            cropped_files.append({
+                'index': i,
+                'path': cropped_path,
+                'width': width - (width % 2),
+                'height': height - (height % 2)
+            })
+    return cropped_files
+
+
+def concatenate_videos_grid(video_paths, output_path, direction='horizontal', sizes=None):
+    """拼接多个视频（支持横向、纵向、网格布局）
+
+    sizes 为各视频的 (宽, 高)，不传时从缓存的媒体信息读取。
+    """
     try:
         if not video_paths:
             return False
@@ -519,106 +781,40 @@ def concatenate_videos_grid(video_paths, output_path, direction='horizontal'):
             shutil.copy(video_paths[0], output_path)
             return True
         
-        # 获取所有视频的尺寸信息
-        video_info = []
+        if sizes is None:
+            sizes = []
+            for path in video_paths:
+                width, height = 1920, 1080
+                try:
+                    video = probe_media(path)['video']
+                    if video and video['width']:
+                        width, height = video['width'], video['height']
+                except Exception as e:
+                    logger.warning(f"读取媒体信息失败: {str(e)}")
+                sizes.append((width, height))
+        
+        inputs = []
         for path in video_paths:
-            cmd = [
-                FFMPEG_PATH,
-                '-i', path,
-                '-f', 'null',
-                '-'
-            ]
-            result = subprocess.run(cmd, capture_output=True, text=True)
-            
-            width, height = 1920, 1080
-            for line in result.stderr.split('\n'):
-                if 'Stream' in line and 'Video:' in line:
-                    import re
-                    match = re.search(r'(\d+)x(\d+)', line)
-                    if match:
-                        width = int(match.group(1))
-                        height = int(match.group(2))
-                        break
-            
-            video_info.append({'path': path, 'width': width, 'height': height})
+            inputs.extend(['-i', path])
         
-        if direction == 'horizontal':
-            n = len(video_paths)
-            v_stack = ''.join([f'[{i}:v]' for i in range(n)])
-            filter_str = f'{v_stack}hstack=inputs={n}[v]'
-            
-            inputs = []
-            for path in video_paths:
-                inputs.extend(['-i', path])
-            
-            cmd = [
-                FFMPEG_PATH,
-                *inputs,
-                '-filter_complex', filter_str,
-                '-map', '[v]',
-                '-c:v', 'libx264',
-                '-preset', 'fast',
-                '-crf', '23',
-                '-an',
-                '-y',
-                output_path
-            ]
-            
-        elif direction == 'vertical':
-            n = len(video_paths)
-            v_stack = ''.join([f'[{i}:v]' for i in range(n)])
-            filter_str = f'{v_stack}vstack=inputs={n}[v]'
-            
-            inputs = []
-            for path in video_paths:
-                inputs.extend(['-i', path])
-            
-            cmd = [
-                FFMPEG_PATH,
-                *inputs,
-                '-filter_complex', filter_str,
-                '-map', '[v]',
-                '-c:v', 'libx264',
-                '-preset', 'fast',
-                '-crf', '23',
-                '-an',
-                '-y',
-                output_path
-            ]
-            
-        else:  # grid
-            import math
-            n = len(video_paths)
-            cols = math.ceil(math.sqrt(n))
-            
-            inputs = []
-            for path in video_paths:
-                inputs.extend(['-i', path])
-            
-            layouts = []
-            for i in range(n):
-                row = i // cols
-                col = i % cols
-                layouts.append(f'{col}_{row}')
-            
-            layout_str = '|'.join(layouts)
-            v_stack = ''.join([f'[{i}:v]' for i in range(n)])
-            filter_str = f'{v_stack}xstack=inputs={n}:layout={layout_str}[v]'
-            
-            cmd = [
-                FFMPEG_PATH,
-                *inputs,
-                '-filter_complex', filter_str,
-                '-map', '[v]',
-                '-c:v', 'libx264',
-                '-preset', 'fast',
-                '-crf', '23',
-                '-an',
-                '-y',
-                output_path
-            ]
+        labels = [f'[{i}:v]' for i in range(len(video_paths))]
+        filter_str = get_stack_filter(labels, sizes, direction) + '[v]'
+        
+        cmd = [
+            FFMPEG_PATH,
+            *inputs,
+            '-filter_complex', filter_str,
+            '-map', '[v]',
+            '-c:v', 'libx264',
+            '-preset', 'fast',
+            '-crf', '23',
+            '-an',
+            *get_faststart_args(output_path),
+            '-y',
+            output_path
+        ]
         
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=600)
+        result = run_ffmpeg(cmd, operation='grid_concat', timeout=600)
         
         if result.returncode != 0:
             print(f"Concatenate error: {result.stderr}")
@@ -632,7 +828,7 @@ def concatenate_videos_grid(video_paths, output_path, direction='horizontal'):
 
 
 if __name__ == '__main__':
-    print(f"多画面裁剪拼接测试服务器启动...")
+    print("多画面裁剪拼接测试服务器启动...")
     print(f"上传文件夹: {UPLOAD_FOLDER}")
     print(f"输出文件夹: {OUTPUT_FOLDER}")
     app.run(host='0.0.0.0', port=5002, debug=True)